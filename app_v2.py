@@ -3,36 +3,91 @@ Enhanced Book Cover OCR Service with CLIP, SQLite, and Caching
 Priority 1: Better accuracy with CLIP and cosine similarity
 Priority 3: Scalability with database, async processing, and caching
 """
-from fastapi import FastAPI, UploadFile, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, UploadFile, HTTPException, Form, BackgroundTasks, Header, Depends, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 import cv2
 import numpy as np
 from utils.embedding_v2 import (
     initialize_clip_model, 
+    initialize_clip_processor,
+    use_inference_server,
     get_embedding, 
+    get_clip_embeddings_batch,
     assess_image_quality,
-    compute_similarity
-)
-from utils.visualization import (
-    create_processing_pipeline,
-    get_quality_metrics
+    compute_similarity,
+    DEFAULT_CLIP_MODEL
 )
 from utils.database import (
     BookDatabase, 
     initialize_database, 
     migrate_from_json,
     get_all_books_sync,
-    get_book_ids_sync
+    get_book_ids_sync,
+    get_book_embeddings_sync,
+    get_change_head_sync,
+    DB_PATH
+)
+from utils.snapshot import load_snapshot, read_manifest, restore_books
+from utils.replication import ApplierLock, ChangeLogFollower, encode_change, make_transport
+from utils.admission import (
+    AdmissionController,
+    Overloaded,
+    RequestCancelled,
+    RequestContext,
+    parse_priority,
+    INTERACTIVE,
+    BULK
+)
+from utils.search import (
+    SearchService,
+    BatchSearchResult,
+    assemble_candidates,
+    build_index,
+    confidence_buckets,
+    describe_index,
+    set_ef_search
+)
+from utils.timing import ServerTimingMiddleware, bind_context, record, span
+from utils import metrics
+from utils.profiler import MAX_DURATION as MAX_PROFILE_SECONDS, ProfilerBusy, profile_in_thread
+from utils.inference import InferenceClient, InferenceUnavailable
+from utils.runtime import apply_thread_config, is_configured, runtime_report, thread_config_from_env
+from utils.synthetic import synthetic_cover
+from utils.cascade import CascadeStage, load_cascade_embeddings, mobilenet_embed_batch, save_cascade_embeddings
+from utils.barcode import BarcodeReader, BarcodeStats, barcode_supported, isbn_lookup_keys
+from utils.segmentation import Region, detect_cover_regions
+from utils.streaming import (
+    DUPLICATE,
+    INVALID,
+    PROCESSED,
+    STALE,
+    LatestFrame,
+    StreamStats,
+    decode_frame,
+    thumbnail_difference
 )
+from utils.ingest import (
+    ImagePayload,
+    UploadRejected,
+    read_base64_image,
+    read_image_upload,
+    read_image_uploads,
+    shared_pool as upload_buffers
+)
+from starlette.requests import ClientDisconnect
 import faiss
 import json
+import os
 import asyncio
 from pathlib import Path
 from cachetools import TTLCache, cached
 from functools import wraps
 import logging
 import hashlib
+import random
+import secrets
+import time
 from typing import Dict, List, Tuple, Optional
 
 # Configure logging
@@ -46,8 +101,43 @@ logger = logging.getLogger(__name__)
 CONFIDENCE_THRESHOLD = 0.65  # Minimum similarity score (0-1, higher = stricter)
 TOP_K_RESULTS = 5
 USE_HNSW = True  # Use HNSW for approximate nearest neighbor (faster for large datasets)
+HNSW_EF_SEARCH = 16  # HNSW search breadth: higher = better recall, slower (measure with evaluate_index.py)
+INDEX_SHARDS = 1  # Partition the index into N shards searched in parallel (1 = no sharding)
 CACHE_SIZE = 1000
 CACHE_TTL = 3600  # 1 hour
+MAX_BATCH_SIZE = 32  # Maximum images per /recognize_batch request
+REGENERATE_BATCH_SIZE = 16  # Covers per forward pass when embeddings are regenerated after an edit
+REGENERATE_MAX_ATTEMPTS = 10  # Tries per regeneration batch while inference is shed or unavailable
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024  # Largest image per upload; bigger ones are refused while still arriving
+MAX_SHELF_REGIONS = 32  # Covers recognized per /recognize_shelf photo (the largest, if more are found)
+STREAM_MAX_FRAME_BYTES = 5 * 1024 * 1024  # Largest frame accepted on /ws/recognize
+STREAM_DUPLICATE_THRESHOLD = 0.02  # Thumbnail difference (0-1) under which a frame repeats the last recognized one
+WARMUP_BATCH_SIZES = (1, 8)  # Dummy forward passes per worker before /ready reports ready (() = skip)
+WARMUP_RETRY_INTERVAL = 5.0  # Seconds between warm-up attempts after a failure (e.g. inference server down)
+MAX_INFLIGHT_INFERENCES = 2  # Concurrent CLIP forward passes per worker
+MAX_QUEUED_INFERENCES = 16  # Requests allowed to wait for a slot before shedding
+REQUEST_TIMEOUT = 10.0  # Default seconds a request may wait for inference (X-Deadline-Ms overrides)
+BULK_REQUEST_TIMEOUT = 60.0  # Same, for bulk-priority requests (X-Priority: bulk, /recognize_batch)
+BULK_MIN_SHARE = 0.2  # Fraction of inference slots guaranteed to bulk traffic while it is queued
+# Read replica mode: leader's books.db path or base URL (unset = this node is the leader)
+REPLICATE_FROM = os.environ.get("BOOK_OCR_REPLICATE_FROM")
+REPLICATION_POLL_INTERVAL = 2.0  # Seconds between change log polls when caught up
+# Snapshot bundle to provision the catalog from at startup (see snapshot.py)
+SNAPSHOT_PATH = os.environ.get("BOOK_OCR_SNAPSHOT")
+SERVER_TIMING = True  # Add per-stage Server-Timing headers to responses
+SLOW_REQUEST_MS = 1000.0  # Log the stage breakdown of requests slower than this (None = off)
+# MobileNet vectors (.npz, see generate_embeddings_v2.py --cascade) for the two-stage
+# cascade; unset = every recognition uses CLIP
+CASCADE_EMBEDDINGS = os.environ.get("BOOK_OCR_CASCADE")
+CASCADE_MIN_SIMILARITY = 0.80  # MobileNet top-1 score needed to skip CLIP (tune with evaluate_index.py --cascade)
+CASCADE_MIN_MARGIN = 0.10  # Lead over the MobileNet runner-up also needed to skip CLIP
+CASCADE_AUDIT_RATE = 0.05  # Fraction of MobileNet answers re-checked with CLIP in the background
+BARCODE_FAST_PATH = True  # Answer photos showing a catalog ISBN barcode from the database, skipping CLIP and FAISS
+BARCODE_MAX_SIDE = 1280  # Longest side of the grayscale copy scanned (smaller = cheaper, misses small barcodes)
+# Shared inference server socket (see serve_inference.py); unset = this process loads CLIP itself
+INFERENCE_SOCKET = os.environ.get("BOOK_OCR_INFERENCE_SOCKET")
+# Token required by diagnostic admin endpoints such as /admin/profile (unset = disabled)
+ADMIN_TOKEN = os.environ.get("BOOK_OCR_ADMIN_TOKEN")
 
 # Initialize FastAPI
 app = FastAPI(
@@ -56,6 +146,31 @@ app = FastAPI(
     description="Enhanced book recognition with CLIP embeddings and smart matching"
 )
 
+_route_templates: Dict = {}
+
+
+def observe_request_metrics(scope, status: int, timer):
+    """Feed a finished request into the Prometheus latency histograms"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        template = "unmatched"
+    else:
+        if not _route_templates:
+            _route_templates.update({
+                route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")
+            })
+        template = _route_templates.get(endpoint, "unmatched")
+    metrics.observe_request(template, scope["method"], status, timer)
+
+
+# Stage timing feeds both the Server-Timing header and /metrics
+app.add_middleware(
+    ServerTimingMiddleware,
+    slow_request_ms=SLOW_REQUEST_MS,
+    emit_header=SERVER_TIMING,
+    on_finish=observe_request_metrics
+)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -69,85 +184,656 @@ db = BookDatabase()
 embeddings_array: Optional[np.ndarray] = None
 faiss_index: Optional[faiss.Index] = None
 book_ids_list: List[str] = []
+search_service: Optional[SearchService] = None
+follower: Optional[ChangeLogFollower] = None
+inference_client: Optional[InferenceClient] = None
+cascade: Optional[CascadeStage] = None
+cascade_in_sync = False  # Stage-one index holds exactly the live catalog
+cascade_audits = set()  # Background audit tasks (referenced so they are not collected)
+barcode_reader: Optional[BarcodeReader] = None
+barcode_stats = BarcodeStats()
+stream_stats = StreamStats()  # Frame outcomes summed over all /ws/recognize streams
+open_streams = 0
+model_and_catalog_loaded = False
+ready = False  # Set once warm-up finishes; cleared on shutdown (see /ready)
+warmup_status: Dict = {"state": "pending"}
 embedding_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+admission = AdmissionController(
+    max_inflight=MAX_INFLIGHT_INFERENCES,
+    max_queue=MAX_QUEUED_INFERENCES,
+    default_timeout=REQUEST_TIMEOUT,
+    bulk_timeout=BULK_REQUEST_TIMEOUT,
+    bulk_min_share=BULK_MIN_SHARE
+)
 
 
-def load_embeddings_and_index():
-    """Load embeddings and build FAISS index with cosine similarity"""
-    global embeddings_array, faiss_index, book_ids_list
+def build_catalog_index(embeddings: np.ndarray) -> faiss.Index:
+    """Build the catalog index over L2-normalized embeddings (blocking: run it in an executor while serving)"""
+    build_start = time.perf_counter()
+    index = build_index(
+        embeddings, use_hnsw=USE_HNSW, num_shards=INDEX_SHARDS, ef_search=HNSW_EF_SEARCH
+    )
+    metrics.REBUILD_DURATION.labels("index_build").observe(time.perf_counter() - build_start)
+    index_info = describe_index(index)
+    logger.info(f"Using {index_info['type']} index with {index_info['shards']} shard(s)")
+    return index
+
+
+def set_catalog_index(embeddings: np.ndarray, book_ids: List[str],
+                      index: Optional[faiss.Index] = None):
+    """
+    Swap in a catalog index (built over the embeddings unless one is given)
+    
+    Args:
+        embeddings: (N, d) float32 array, already L2-normalized
+        book_ids: Book id for each embedding row
+        index: Ready index over exactly these rows (e.g. from a snapshot)
+    """
+    global embeddings_array, faiss_index, book_ids_list, search_service, cascade_in_sync
+    
+    if index is None:
+        index = build_catalog_index(embeddings)
+    
+    metrics.set_index_info(describe_index(index))
+    embeddings_array = embeddings
+    book_ids_list = book_ids
+    faiss_index = index
+    search_service = SearchService(
+        index, book_ids,
+        top_k=TOP_K_RESULTS, threshold=CONFIDENCE_THRESHOLD
+    )
+    
+    if cascade is not None:
+        was_in_sync, cascade_in_sync = cascade_in_sync, cascade.covers(book_ids)
+        if was_in_sync and not cascade_in_sync:
+            logger.warning("Catalog changed; cascade paused until its MobileNet vectors are regenerated")
+
+
+def load_cascade():
+    """Build the cascade's stage-one index from CASCADE_EMBEDDINGS"""
+    global cascade, cascade_in_sync
     
+    embeddings, book_ids, model = load_cascade_embeddings(CASCADE_EMBEDDINGS)
+    cascade = CascadeStage(
+        mobilenet_embed_batch, embeddings, book_ids,
+        min_similarity=CASCADE_MIN_SIMILARITY,
+        min_margin=CASCADE_MIN_MARGIN,
+        top_k=TOP_K_RESULTS,
+        threshold=CONFIDENCE_THRESHOLD,
+        model=model
+    )
+    cascade_in_sync = cascade.covers(book_ids_list)
+    logger.info(
+        f"Cascade enabled: {model} index of {len(book_ids)} books"
+        + ("" if cascade_in_sync else " (does not match the catalog; paused until regenerated)")
+    )
+
+
+def clear_catalog_index():
+    """Drop the catalog index (no books): recognition answers 503 until books are added"""
+    global embeddings_array, faiss_index, book_ids_list, search_service
+    embeddings_array = None
+    faiss_index = None
+    book_ids_list = []
+    search_service = None
+    metrics.set_index_info(None)
+
+
+# A catalog ready to swap in: (embeddings, book_ids, index), or None for no books
+Catalog = Optional[Tuple[np.ndarray, List[str], faiss.Index]]
+
+
+def install_catalog(catalog: Catalog):
+    """Swap in a catalog prepared off the event loop (cheap: no index build)"""
+    if catalog is None:
+        clear_catalog_index()
+    else:
+        set_catalog_index(*catalog)
+
+
+def read_catalog() -> Catalog:
+    """Load embeddings.npy and build its index (blocking)"""
     try:
-        embeddings_array = np.load("embeddings.npy").astype("float32")
-        book_ids_list = get_book_ids_sync()
+        embeddings = np.load("embeddings.npy").astype("float32")
+        if len(embeddings) == 0:
+            logger.warning("embeddings.npy is empty. Database is empty.")
+            return None
+        book_ids = get_book_ids_sync()
         
-        if len(book_ids_list) != len(embeddings_array):
+        if len(book_ids) != len(embeddings):
             logger.warning(
-                f"Mismatch: {len(book_ids_list)} books but {len(embeddings_array)} embeddings"
+                f"Mismatch: {len(book_ids)} books but {len(embeddings)} embeddings"
             )
         
         # Normalize embeddings for cosine similarity
         # With normalized vectors, cosine similarity = inner product
-        faiss.normalize_L2(embeddings_array)
-        
-        dim = embeddings_array.shape[1]
+        faiss.normalize_L2(embeddings)
         
-        if USE_HNSW and len(embeddings_array) > 100:
-            # HNSW for larger datasets (approximate but faster)
-            M = 32  # Number of connections per layer
-            faiss_index = faiss.IndexHNSWFlat(dim, M)
-            faiss_index.hnsw.efConstruction = 40
-            faiss_index.hnsw.efSearch = 16
-            logger.info("Using HNSW index for approximate nearest neighbor")
-        else:
-            # Exact search with inner product (cosine similarity on normalized vectors)
-            faiss_index = faiss.IndexFlatIP(dim)
-            logger.info("Using flat index with cosine similarity")
-        
-        faiss_index.add(embeddings_array)
-        logger.info(f"Loaded {len(embeddings_array)} embeddings, dimension={dim}")
+        index = build_catalog_index(embeddings)
+        logger.info(f"Loaded {len(embeddings)} embeddings, dimension={embeddings.shape[1]}")
+        return embeddings, book_ids, index
         
     except FileNotFoundError:
         logger.warning("No embeddings.npy found. Database is empty.")
-        embeddings_array = None
-        faiss_index = None
+        return None
     except Exception as e:
         logger.error(f"Failed to load embeddings: {e}")
         raise
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize models and database on startup"""
-    logger.info("Starting Book Cover OCR Service v2.0...")
+def load_embeddings_and_index():
+    """Load embeddings and build FAISS index with cosine similarity (startup)"""
+    install_catalog(read_catalog())
+
+
+async def reload_embeddings_and_index():
+    """load_embeddings_and_index() while serving: load and build in the executor, swap on the loop"""
+    loop = asyncio.get_running_loop()
+    install_catalog(await loop.run_in_executor(None, read_catalog))
+
+
+def _changed_catalog(ids: List[str], embeddings: Optional[np.ndarray], index: Optional[faiss.Index],
+                     changes: List[Dict], persist: bool) -> Catalog:
+    """
+    The catalog after replicated changes (blocking; see apply_catalog_changes())
+    
+    Pure appends extend a copy of the live index, which keeps serving
+    meanwhile; updates and deletes rebuild it from the kept vectors (no
+    re-embedding).
+    """
+    vectors: Dict[str, np.ndarray] = {}
+    if embeddings is not None:
+        ids = ids[:len(embeddings)]
+        vectors = dict(zip(ids, embeddings))
+    
+    appended: List[str] = []
+    needs_rebuild = False
+    
+    for change in changes:
+        book_id = change['book_id']
+        
+        if change['op'] == 'delete':
+            if book_id in vectors:
+                del vectors[book_id]
+                needs_rebuild = True
+            continue
+        
+        if change['embedding'] is None:
+            if change['op'] == 'add':
+                logger.warning(f"Replicated book {book_id} has no embedding; not indexed")
+            continue
+        
+        emb = change['embedding'].astype("float32").reshape(1, -1)
+        faiss.normalize_L2(emb)
+        
+        if book_id in vectors:
+            needs_rebuild = True
+        else:
+            appended.append(book_id)
+        vectors[book_id] = emb[0]
+    
+    if not vectors:
+        # Last book deleted: nothing may stay matchable
+        if persist and embeddings is not None:
+            np.save("embeddings.npy", np.zeros((0, embeddings.shape[1]), dtype="float32"))
+        return None
+    
+    order = [book_id for book_id in ids if book_id in vectors]
+    known = set(order)
+    order += [book_id for book_id in appended if book_id in vectors and book_id not in known]
+    new_embeddings = np.vstack([vectors[book_id] for book_id in order]).astype("float32")
+    
+    if needs_rebuild or index is None or INDEX_SHARDS > 1 or not appended:
+        new_index = build_catalog_index(new_embeddings)
+    else:
+        # Append-only: extend the live index instead of rebuilding it
+        new_index = faiss.clone_index(index)
+        new_index.add(new_embeddings[len(order) - len(appended):])
+    
+    if persist:
+        np.save("embeddings.npy", new_embeddings)
+    return new_embeddings, order, new_index
+
+
+async def apply_catalog_changes(changes: List[Dict], persist: bool = True):
+    """
+    Apply replicated catalog changes to the in-memory index (follower nodes)
+    
+    The new index is built in the executor and swapped in on the loop, so
+    requests keep being served by the old one meanwhile. With `persist`,
+    embeddings.npy is rewritten so a restart sees the same catalog; only
+    the worker that applies changes to books.db persists.
+    """
+    loop = asyncio.get_running_loop()
+    install_catalog(await loop.run_in_executor(
+        None, _changed_catalog, list(book_ids_list), embeddings_array, faiss_index, changes, persist
+    ))
+
+
+def _rebuilt_catalog(ids: List[str], embeddings: Optional[np.ndarray], persist: bool) -> Catalog:
+    """The catalog as books.db holds it (blocking; see rebuild_catalog_index())"""
+    loaded: Dict[str, np.ndarray] = {}
+    if embeddings is not None:
+        loaded = dict(zip(ids, embeddings))
+    
+    order: List[str] = []
+    vectors: List[np.ndarray] = []
+    for book_id, stored in get_book_embeddings_sync():
+        vector = stored if stored is not None else loaded.get(book_id)
+        if vector is None:
+            logger.warning(f"Book {book_id} has no embedding; not indexed")
+            continue
+        order.append(book_id)
+        vectors.append(vector)
+    
+    if not vectors:
+        if persist and embeddings is not None:
+            np.save("embeddings.npy", np.zeros((0, embeddings.shape[1]), dtype="float32"))
+        return None
+    
+    new_embeddings = np.vstack(vectors).astype("float32")
+    faiss.normalize_L2(new_embeddings)
+    index = build_catalog_index(new_embeddings)
+    if persist:
+        np.save("embeddings.npy", new_embeddings)
+    logger.info(f"Rebuilt the catalog index from {DB_PATH}: {len(order)} books")
+    return new_embeddings, order, index
+
+
+async def rebuild_catalog_index(persist: bool = True):
+    """
+    Rebuild the index from books.db (replicated changes failed to index)
+    
+    Uses the vectors stored with the books; a book without one keeps the
+    vector it had in the loaded index (i.e. from embeddings.npy).
+    """
+    loop = asyncio.get_running_loop()
+    install_catalog(await loop.run_in_executor(
+        None, _rebuilt_catalog, list(book_ids_list), embeddings_array, persist
+    ))
+
+
+def load_snapshot_bundle(bundle_path: str) -> bool:
+    """
+    Provision the catalog from a snapshot bundle (no CLIP inference)
+    
+    The bundle is skipped when the local catalog is already at or past the
+    snapshot's change log position, so restarts never roll a node back.
+    
+    Returns:
+        True if the snapshot was loaded
+    """
+    manifest = read_manifest(bundle_path)
+    local_head = get_change_head_sync()
+    if get_book_ids_sync() and manifest.get("change_seq", 0) <= local_head:
+        logger.info(
+            f"Local catalog (seq {local_head}) is not older than snapshot "
+            f"(seq {manifest.get('change_seq', 0)}); skipping {bundle_path}"
+        )
+        return False
+    
+    snapshot = load_snapshot(bundle_path, expected_model_id=DEFAULT_CLIP_MODEL)
+    restore_books(snapshot)
+    np.save("embeddings.npy", snapshot.embeddings)
+    
+    # The serialized index is used as-is unless this node shards its index
+    prebuilt = snapshot.index if INDEX_SHARDS == 1 else None
+    if prebuilt is not None:
+        set_ef_search(prebuilt, HNSW_EF_SEARCH)
+    set_catalog_index(snapshot.embeddings, snapshot.book_ids, index=prebuilt)
+    
+    logger.info(
+        f"Loaded snapshot {bundle_path}: {manifest['count']} books, "
+        f"{manifest['index']['type']}, created {manifest['created_at']}"
+    )
+    return True
+
+
+def ensure_writable():
+    """Reject catalog edits on read replicas"""
+    if follower is not None:
+        raise HTTPException(
+            status_code=403,
+            detail=f"This node is a read replica of {REPLICATE_FROM}; send catalog edits to the leader"
+        )
+
+
+def load_model_and_catalog():
+    """
+    Load the database, catalog index and CLIP model
+    
+    Runs once per process tree: the pre-fork launcher (serve_prefork.py)
+    calls it in the master so forked workers share the pages, and their
+    startup then skips it. With INFERENCE_SOCKET set only the CLIP
+    preprocessing config is loaded; forward passes go to the server.
+    """
+    global model_and_catalog_loaded, inference_client, barcode_reader
+    
+    if model_and_catalog_loaded:
+        logger.info("Model and catalog already loaded (pre-forked worker)")
+        return
     
     # Initialize database
     initialize_database()
     
+    # Provision the catalog from a snapshot bundle if configured
+    snapshot_loaded = bool(
+        SNAPSHOT_PATH and Path(SNAPSHOT_PATH).exists() and load_snapshot_bundle(SNAPSHOT_PATH)
+    )
+    
     # Migrate from old JSON format if exists
-    try:
-        migrate_from_json()
-    except Exception as e:
-        logger.warning(f"Migration skipped: {e}")
+    if not snapshot_loaded:
+        try:
+            migrate_from_json()
+        except Exception as e:
+            logger.warning(f"Migration skipped: {e}")
     
     # Initialize CLIP model
     try:
-        initialize_clip_model()
-        logger.info("CLIP model initialized successfully")
+        if INFERENCE_SOCKET:
+            initialize_clip_processor()
+            inference_client = InferenceClient(INFERENCE_SOCKET)
+            use_inference_server(inference_client)
+            logger.info(f"Using shared inference server at {INFERENCE_SOCKET}")
+        else:
+            initialize_clip_model()
+            logger.info("CLIP model initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize CLIP: {e}")
         raise
     
     # Load embeddings and FAISS index
-    load_embeddings_and_index()
+    if not snapshot_loaded:
+        load_embeddings_and_index()
+    
+    if CASCADE_EMBEDDINGS:
+        load_cascade()
+    
+    if BARCODE_FAST_PATH:
+        if barcode_supported():
+            barcode_reader = BarcodeReader(BARCODE_MAX_SIDE)
+        else:
+            logger.warning(f"OpenCV {cv2.__version__} has no barcode module; ISBN fast path disabled")
+    
+    model_and_catalog_loaded = True
+
+
+async def warm_up():
+    """
+    Push dummy covers through CLIP, the index and the database, then mark ready
+    
+    The first calls pay for lazy kernel initialization and allocation, so
+    every size in WARMUP_BATCH_SIZES runs once before traffic is routed
+    here. Runs after startup so /live answers meanwhile; retried until it
+    succeeds (with an inference server, it also waits for the server).
+    """
+    global ready
+    
+    loop = asyncio.get_running_loop()
+    rng = np.random.default_rng(0)
+    covers = [synthetic_cover(rng) for _ in range(max(WARMUP_BATCH_SIZES, default=0))]
+    
+    while True:
+        warmup_status.update(state="running")
+        start = time.perf_counter()
+        timings = {}
+        try:
+            embeddings = None
+            for size in WARMUP_BATCH_SIZES:
+                step = time.perf_counter()
+                embeddings = await loop.run_in_executor(None, get_clip_embeddings_batch, covers[:size])
+                timings[f"embed_batch{size}"] = round((time.perf_counter() - step) * 1000, 1)
+            
+            if embeddings is not None and search_service is not None:
+                step = time.perf_counter()
+                result = search_service.search(embeddings)
+                await db.get_books(search_service.unique_book_ids(result))
+                timings["search_and_db"] = round((time.perf_counter() - step) * 1000, 1)
+            
+            if cascade is not None and covers:
+                step = time.perf_counter()
+                await loop.run_in_executor(None, cascade.embed, covers[:1])
+                timings["cascade_stage_one"] = round((time.perf_counter() - step) * 1000, 1)
+            
+            if barcode_reader is not None and covers:
+                step = time.perf_counter()
+                await loop.run_in_executor(None, barcode_reader.scan, covers[:1])
+                await db.get_book_by_isbn(["0"])
+                timings["barcode"] = round((time.perf_counter() - step) * 1000, 1)
+            
+            if 1 in WARMUP_BATCH_SIZES:
+                # A warm single-image pass seeds the admission controller's service time estimate
+                step = time.perf_counter()
+                await loop.run_in_executor(None, get_embedding, covers[0], True)
+                admission.service_time = time.perf_counter() - step
+                timings["embed_warm"] = round(admission.service_time * 1000, 1)
+        except Exception as e:
+            logger.error(f"Warm-up failed, retrying in {WARMUP_RETRY_INTERVAL:g}s: {e}")
+            warmup_status.update(state="failed", error=str(e))
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+            continue
+        
+        warmup_status.clear()
+        warmup_status.update(
+            state="done",
+            seconds=round(time.perf_counter() - start, 2),
+            timings_ms=timings
+        )
+        ready = True
+        logger.info(f"Warm-up done in {warmup_status['seconds']}s {timings}; ready for traffic")
+        return
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize models and database on startup"""
+    global follower
+    
+    logger.info("Starting Book Cover OCR Service v2.0...")
+    
+    # Thread budget from BOOK_OCR_* variables, unless a launcher (serve_prefork.py) set it
+    if not is_configured():
+        apply_thread_config(thread_config_from_env())
+    
+    load_model_and_catalog()
+    
+    # Follow the leader's catalog change log on read replicas
+    if REPLICATE_FROM:
+        # One worker per node applies changes to books.db; the rest reload from it
+        follower = ChangeLogFollower(
+            make_transport(REPLICATE_FROM),
+            on_applied=apply_catalog_changes,
+            on_resync=rebuild_catalog_index,
+            db_path=DB_PATH,
+            poll_interval=REPLICATION_POLL_INTERVAL,
+            lock=ApplierLock(f"{DB_PATH}.replica.lock")
+        )
+        asyncio.create_task(follower.run())
+    
+    asyncio.create_task(warm_up())
     
     logger.info("Service started successfully!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop reporting ready and remove this worker's live gauges from /metrics"""
+    global ready
+    ready = False
+    metrics.mark_worker_dead()
+
+
 def hash_image(img: np.ndarray) -> str:
     """Generate hash for image caching"""
     return hashlib.md5(img.tobytes()).hexdigest()
 
 
+def _request_context(deadline_ms: Optional[int], priority: Optional[str], default_priority: str):
+    """
+    Build a request context
+    The client connection is watched only once the body has been read (see
+    receive_upload()): polling it earlier would consume body chunks
+    """
+    return admission.new_context(parse_priority(priority, default_priority), deadline_ms)
+
+
+async def interactive_context(
+    x_deadline_ms: Optional[int] = Header(None),
+    x_priority: Optional[str] = Header(None)
+):
+    """Dependency: request context, interactive unless X-Priority says bulk"""
+    ctx = _request_context(x_deadline_ms, x_priority, INTERACTIVE)
+    try:
+        yield ctx
+    finally:
+        ctx.close()
+
+
+async def bulk_context(
+    x_deadline_ms: Optional[int] = Header(None),
+    x_priority: Optional[str] = Header(None)
+):
+    """Dependency: request context, bulk unless X-Priority says interactive"""
+    ctx = _request_context(x_deadline_ms, x_priority, BULK)
+    try:
+        yield ctx
+    finally:
+        ctx.close()
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Dependency: allow only requests carrying X-Admin-Token = BOOK_OCR_ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail="Diagnostic endpoints are disabled; set BOOK_OCR_ADMIN_TOKEN to enable them"
+        )
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+def check_cancelled(ctx: RequestContext, include_deadline: bool = True):
+    """Stop work for a request whose client is gone (or whose deadline passed)"""
+    try:
+        ctx.check(include_deadline)
+    except RequestCancelled as e:
+        raise cancelled_exception(e)
+
+
+def cancelled_exception(e: RequestCancelled) -> HTTPException:
+    """Map an abandoned request to an HTTP error (mostly never delivered)"""
+    if e.reason == RequestContext.DISCONNECTED:
+        return HTTPException(status_code=499, detail="Client closed request")
+    return HTTPException(
+        status_code=503,
+        detail="Request deadline exceeded",
+        headers={"Retry-After": str(admission.retry_after())}
+    )
+
+
+async def receive_upload(read, request: Request, ctx: RequestContext, **kwargs):
+    """
+    Receive a request body with one of the utils.ingest readers
+
+    Oversized and non-image uploads are refused while they arrive (413/415)
+    instead of after buffering them. Once the body is in, the connection is
+    watched for a disconnect; a client leaving mid-upload is seen here.
+    """
+    try:
+        with span("read"):
+            received = await read(request, **kwargs)
+    except UploadRejected as e:
+        metrics.UPLOADS_REJECTED.labels(e.reason).inc()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ClientDisconnect:
+        ctx.cancel(RequestContext.DISCONNECTED)
+        raise HTTPException(status_code=499, detail="Client closed request")
+    ctx.watch(request)
+    return received
+
+
+def decode_upload(upload: ImagePayload, detail: str = "Invalid image file") -> np.ndarray:
+    """Decode a received image in place (400 if corrupt)"""
+    with span("decode"):
+        img = upload.decode()
+    if img is None:
+        raise HTTPException(status_code=400, detail=detail)
+    return img
+
+
+def _upload_body(media_type: str, schema: Dict) -> Dict:
+    """OpenAPI request body for endpoints that read the body themselves"""
+    return {"requestBody": {"required": True, "content": {media_type: {"schema": schema}}}}
+
+
+IMAGE_UPLOAD_BODY = _upload_body("multipart/form-data", {
+    "type": "object",
+    "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}}
+})
+BATCH_UPLOAD_BODY = _upload_body("multipart/form-data", {
+    "type": "object",
+    "required": ["files"],
+    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}}
+})
+BASE64_IMAGE_BODY = _upload_body("application/json", {
+    "type": "object",
+    "required": ["image"],
+    "properties": {"image": {"type": "string", "description": "Base64 encoded JPEG/PNG/WebP/BMP/TIFF"}}
+})
+
+
+def publish_admission_gauges():
+    """Copy this worker's queue depth and in-flight count to /metrics"""
+    metrics.QUEUE_DEPTH.set(admission.queue_depth)
+    metrics.INFLIGHT.set(admission.in_flight)
+
+
+async def run_inference(fn, *args, ctx: RequestContext, batch_size: int = 1):
+    """
+    Run CPU-bound model work in a worker thread behind the priority scheduler
+    
+    Args:
+        fn: Embedding function to call with *args
+        ctx: Request context (priority, deadline, cancellation)
+        batch_size: Images in this forward pass (for metrics)
+    
+    Raises:
+        HTTPException: 503 with Retry-After when the request is shed or the
+            inference server is unreachable, 499 when the client
+            disconnected before the work started
+    """
+    queued_at = time.perf_counter()
+    try:
+        publish_admission_gauges()
+        async with admission.slot(ctx):
+            record("queue", time.perf_counter() - queued_at)
+            publish_admission_gauges()
+            metrics.INFERENCE_BATCH_SIZE.observe(batch_size)
+            loop = asyncio.get_running_loop()
+            # bind_context carries the request timer into the worker thread
+            return await loop.run_in_executor(None, bind_context(fn, *args))
+    except Overloaded as e:
+        metrics.SHED.labels(e.reason).inc()
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy ({e.reason}), please retry",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except RequestCancelled as e:
+        metrics.SHED.labels(e.reason).inc()
+        raise cancelled_exception(e)
+    except InferenceUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=503,
+            detail="Inference server unavailable, please retry",
+            headers={"Retry-After": "5"}
+        )
+    finally:
+        publish_admission_gauges()
+
+
 def compute_confidence_score(similarity: float, rank: int = 1) -> Dict:
     """
     Convert similarity to confidence with interpretation
@@ -159,38 +845,148 @@ def compute_confidence_score(similarity: float, rank: int = 1) -> Dict:
     Returns:
         Dict with confidence score and match quality
     """
-    # Adjust confidence based on similarity
-    if similarity >= 0.85:
-        quality = "excellent"
-        confidence = "very_high"
-    elif similarity >= 0.75:
-        quality = "good"
-        confidence = "high"
-    elif similarity >= CONFIDENCE_THRESHOLD:
-        quality = "acceptable"
-        confidence = "medium"
-    else:
-        quality = "poor"
-        confidence = "low"
+    confidence, quality = confidence_buckets(np.asarray(similarity), CONFIDENCE_THRESHOLD)
     
     return {
         "similarity": float(similarity),
-        "confidence": confidence,
-        "match_quality": quality,
+        "confidence": str(confidence),
+        "match_quality": str(quality),
         "rank": rank
     }
 
 
-async def recognize_image(img: np.ndarray) -> Dict:
+async def barcode_fast_path(images: List[np.ndarray]) -> List[Optional[Dict]]:
+    """
+    Answer images whose ISBN barcode is in the catalog, without embedding them
+    
+    Args:
+        images: OpenCV images (BGR) that missed the embedding cache
+    
+    Returns:
+        One answer per image; None where the image still needs embedding
+        (no readable ISBN, or one the catalog does not have)
+    """
+    loop = asyncio.get_running_loop()
+    with span("barcode"):
+        # Off the event loop, but not behind the inference scheduler: a scan costs a few ms
+        scans = await loop.run_in_executor(None, bind_context(barcode_reader.scan, images))
+    
+    answers: List[Optional[Dict]] = [None] * len(images)
+    for row, (isbn, seconds) in enumerate(scans):
+        book = None
+        if isbn:
+            lookup_start = time.perf_counter()
+            with span("db"):
+                book = await db.get_book_by_isbn(isbn_lookup_keys(isbn))
+            seconds += time.perf_counter() - lookup_start
+        
+        outcome = "hit" if book else "not_in_catalog" if isbn else "no_barcode"
+        barcode_stats.record(decoded=isbn is not None, hit=book is not None, seconds=seconds)
+        metrics.BARCODE_SCANS.labels(outcome).inc()
+        metrics.BARCODE_LATENCY.labels(outcome).observe(seconds)
+        if book is None:
+            if isbn:
+                logger.info(f"Barcode {isbn} is not in the catalog; recognizing the cover instead")
+            continue
+        
+        candidate = {
+            "book_id": book["book_id"],
+            "title": book["title"],
+            "author": book["author"],
+            "image": book["image"],
+            **compute_confidence_score(1.0)
+        }
+        answers[row] = {
+            "status": "success",
+            "message": "Match found",
+            "results": [candidate],
+            "top_match": candidate,
+            "stage": "barcode",
+            "isbn": isbn
+        }
+    return answers
+
+
+def cascade_ready() -> bool:
+    """Whether recognitions go through the MobileNet stage first"""
+    return cascade is not None and cascade_in_sync
+
+
+async def cascade_first_stage(images: List[np.ndarray],
+                              ctx: RequestContext) -> Tuple[List[Optional[Dict]], List[Optional[str]]]:
+    """
+    Answer the decisive images from the MobileNet index (cascade stage one)
+    
+    Args:
+        images: OpenCV images (BGR) that missed the embedding cache
+        ctx: Request context (priority, deadline, cancellation)
+    
+    Returns:
+        Tuple of (answers, stage-one top-1 book ids); answers[i] is None
+        where the image still needs CLIP
+    """
+    embeddings = await run_inference(cascade.embed, images, ctx=ctx, batch_size=len(images))
+    with span("cascade_search"):
+        result, decisive = cascade.search(embeddings)
+    cascade.stats.record_decisions(len(images), int(decisive.sum()))
+    metrics.CASCADE_DECISIONS.labels("accepted").inc(int(decisive.sum()))
+    metrics.CASCADE_DECISIONS.labels("fell_through").inc(int((~decisive).sum()))
+    
+    answers: List[Optional[Dict]] = [None] * len(images)
+    if decisive.any():
+        with span("db"):
+            books = await db.get_books(list(dict.fromkeys(result.book_ids[decisive, 0].tolist())))
+        for row in np.flatnonzero(decisive):
+            answers[row] = {**build_match_response(result, row, books), "stage": cascade.model}
+    
+    return answers, result.book_ids[:, 0].tolist()
+
+
+def compare_with_stage_one(stage_one_ids: List[Optional[str]], matches: List[Dict]):
+    """Record whether stage one's top-1 would have matched CLIP's for fall-through images"""
+    for stage_one_id, match in zip(stage_one_ids, matches):
+        top = match.get("top_match") or (match.get("possible_matches") or [{}])[0]
+        agreed = stage_one_id is not None and stage_one_id == top.get("book_id")
+        cascade.stats.record_shadow(agreed)
+
+
+def schedule_cascade_audit(img: np.ndarray, img_hash: str, stage_one_id: str):
+    """Re-check a sample of stage-one answers with CLIP in the background (bulk lane)"""
+    if random.random() >= CASCADE_AUDIT_RATE:
+        return
+    
+    async def audit():
+        ctx = admission.new_context(BULK)
+        try:
+            emb = await run_inference(get_embedding, img, True, ctx=ctx)
+        except HTTPException:
+            return  # Shed or inference unavailable: skip this sample
+        embedding_cache[img_hash] = emb
+        result = search_service.search(emb)
+        agreed = bool(result.valid[0, 0]) and result.book_ids[0, 0] == stage_one_id
+        cascade.stats.record_audit(agreed)
+        metrics.CASCADE_AUDITS.labels("agreed" if agreed else "disagreed").inc()
+        if not agreed:
+            logger.info(f"Cascade audit: MobileNet answered {stage_one_id}, CLIP says {result.book_ids[0, 0]}")
+    
+    task = asyncio.create_task(audit())
+    cascade_audits.add(task)
+    task.add_done_callback(cascade_audits.discard)
+
+
+async def recognize_image(img: np.ndarray, ctx: Optional[RequestContext] = None) -> Dict:
     """
     Core recognition logic with confidence assessment
     
     Args:
         img: OpenCV image (BGR)
+        ctx: Request context (priority, deadline, cancellation)
     
     Returns:
         Recognition results with confidence scores
     """
+    ctx = ctx or admission.new_context()
+    
     if faiss_index is None or embeddings_array is None:
         raise HTTPException(
             status_code=503,
@@ -198,7 +994,8 @@ async def recognize_image(img: np.ndarray) -> Dict:
         )
     
     # Check image quality
-    is_acceptable, quality_msg = assess_image_quality(img)
+    with span("quality"):
+        is_acceptable, quality_msg = assess_image_quality(img)
     if not is_acceptable:
         return {
             "status": "error",
@@ -208,41 +1005,58 @@ async def recognize_image(img: np.ndarray) -> Dict:
     
     # Check cache
     img_hash = hash_image(img)
+    stage_one_ids = None
     if img_hash in embedding_cache:
         emb = embedding_cache[img_hash]
+        metrics.CACHE_REQUESTS.labels("hit").inc()
         logger.info("Using cached embedding")
     else:
+        metrics.CACHE_REQUESTS.labels("miss").inc()
+        
+        # ISBN barcode: a database lookup answers without any embedding
+        if barcode_reader is not None:
+            answer = (await barcode_fast_path([img]))[0]
+            if answer is not None:
+                return answer
+            check_cancelled(ctx)
+        
+        # Cascade: MobileNet answers decisive images without CLIP
+        if cascade_ready():
+            answers, stage_one_ids = await cascade_first_stage([img], ctx)
+            if answers[0] is not None:
+                schedule_cascade_audit(img, img_hash, stage_one_ids[0])
+                return answers[0]
+            check_cancelled(ctx)
+        
         # Generate embedding
-        emb = get_embedding(img, use_clip=True)
+        if stage_one_ids:
+            emb = (await run_inference(cascade.stats.timed_clip(get_clip_embeddings_batch), [img], ctx=ctx))[0]
+        else:
+            emb = await run_inference(get_embedding, img, True, ctx=ctx)
         embedding_cache[img_hash] = emb
+        metrics.CACHE_SIZE.set(len(embedding_cache))
     
-    # Normalize for cosine similarity
-    emb = emb.reshape(1, -1).astype("float32")
-    faiss.normalize_L2(emb)
-    
-    # Search (returns similarity scores with IndexFlatIP)
-    similarities, indices = faiss_index.search(emb, TOP_K_RESULTS)
+    check_cancelled(ctx, include_deadline=False)
+    results = await match_embeddings(emb)
+    if stage_one_ids:
+        compare_with_stage_one(stage_one_ids, results)
+    return results[0]
+
+
+def build_match_response(result: BatchSearchResult, row: int, books: Dict[str, Dict]) -> Dict:
+    """
+    Build the /recognize response for one query row of a batch search
     
-    # Process results
-    candidates = []
-    top_similarity = similarities[0][0] if len(similarities[0]) > 0 else 0.0
+    Args:
+        result: Batch search result
+        row: Query row
+        books: book_id -> book info for every id in the result block
     
-    for rank, (idx, similarity) in enumerate(zip(indices[0], similarities[0]), 1):
-        if idx >= len(book_ids_list):
-            continue
-        
-        book_id = book_ids_list[idx]
-        book_info = await db.get_book(book_id)
-        
-        if book_info:
-            confidence_info = compute_confidence_score(similarity, rank)
-            candidates.append({
-                "book_id": book_id,
-                "title": book_info["title"],
-                "author": book_info["author"],
-                "image": book_info["image"],
-                **confidence_info
-            })
+    Returns:
+        Recognition result dict ("success" or "no_match")
+    """
+    candidates = assemble_candidates(result, row, books)
+    top_similarity = result.similarities[row, 0] if result.similarities.shape[1] > 0 else 0.0
     
     # Determine overall match status
     if top_similarity < CONFIDENCE_THRESHOLD:
@@ -263,6 +1077,32 @@ async def recognize_image(img: np.ndarray) -> Dict:
         }
 
 
+async def match_embeddings(embeddings: np.ndarray) -> List[Dict]:
+    """
+    Match a block of embeddings against the catalog
+    
+    One FAISS search and one DB query for the whole block.
+    
+    Args:
+        embeddings: (d,) or (N, d) embedding array
+    
+    Returns:
+        List of N recognition result dicts, in query order
+    """
+    if search_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service not ready. No books indexed yet."
+        )
+    
+    with span("search"):
+        result = search_service.search(embeddings)
+    with span("db"):
+        books = await db.get_books(search_service.unique_book_ids(result))
+    
+    return [build_match_response(result, row, books) for row in range(len(result))]
+
+
 @app.get("/")
 async def root():
     """Serve the web interface"""
@@ -281,6 +1121,34 @@ async def visualize():
     return FileResponse("static/index_visualize.html")
 
 
+def barcode_status() -> Optional[Dict]:
+    """ISBN fast-path hit ratio and latency (None when disabled)"""
+    if barcode_reader is None:
+        return None
+    return {"max_side": barcode_reader.max_side, **barcode_stats.stats()}
+
+
+def cascade_status() -> Optional[Dict]:
+    """Cascade settings and acceptance / agreement counters (None when disabled)"""
+    if cascade is None:
+        return None
+    return {**cascade.describe(), "active": cascade_in_sync, **cascade.stats.stats()}
+
+
+async def inference_status() -> Dict:
+    """Where forward passes run, with the shared server's batching counters"""
+    if inference_client is None:
+        return {"mode": "local"}
+    
+    status = {"mode": "server", "socket": INFERENCE_SOCKET}
+    try:
+        loop = asyncio.get_running_loop()
+        status["server"] = await loop.run_in_executor(None, inference_client.stats)
+    except Exception as e:
+        status["error"] = str(e)
+    return status
+
+
 @app.get("/health")
 async def health():
     """Enhanced health check with model and database status"""
@@ -288,35 +1156,57 @@ async def health():
     
     return {
         "status": "healthy",
+        "ready": ready,
+        "warmup": warmup_status,
         "version": "2.0.0",
         "model": "CLIP ViT-B/32",
         "search_algorithm": "HNSW" if USE_HNSW else "Flat",
+        "index": describe_index(faiss_index) if faiss_index is not None else None,
         "similarity_metric": "cosine",
         "books_indexed": book_count,
         "confidence_threshold": CONFIDENCE_THRESHOLD,
         "cache_size": len(embedding_cache),
-        "database": "sqlite"
+        "database": "sqlite",
+        "admission": admission.stats(),
+        "inference": await inference_status(),
+        "barcode": barcode_status(),
+        "cascade": cascade_status(),
+        "runtime": runtime_report(),
+        "replication": (
+            follower.status() if follower is not None
+            else {"role": "leader", "head_seq": await db.get_change_head()}
+        )
     }
 
 
-@app.post("/recognize")
-async def recognize(file: UploadFile):
-    """Recognize a book from an uploaded image with confidence scoring"""
+@app.get("/live")
+async def liveness():
+    """Liveness probe: the worker's event loop is responding (restart it if not)"""
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once warm-up is done, 503 before that and while shutting down"""
+    return JSONResponse(
+        {"ready": ready, "warmup": warmup_status},
+        status_code=200 if ready else 503
+    )
+
+
+@app.post("/recognize", openapi_extra=IMAGE_UPLOAD_BODY)
+async def recognize(request: Request, ctx: RequestContext = Depends(interactive_context)):
+    """Recognize a book from an uploaded image (form field "file") with confidence scoring"""
     try:
-        # Read and decode image
-        data = await file.read()
-        
-        # Check file size (limit to 20MB)
-        if len(data) > 20 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large (max 20MB)")
+        # Receive (size and type checked while streaming) and decode image
+        upload = await receive_upload(read_image_upload, request, ctx, max_bytes=MAX_UPLOAD_BYTES)
         
-        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        check_cancelled(ctx)
         
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image file")
+        img = decode_upload(upload)
         
         # Perform recognition
-        result = await recognize_image(img)
+        result = await recognize_image(img, ctx)
         
         return result
         
@@ -327,23 +1217,20 @@ async def recognize(file: UploadFile):
         raise HTTPException(status_code=500, detail=f"Recognition failed: {str(e)}")
 
 
-@app.post("/recognize_base64")
-async def recognize_base64(data: dict):
-    """Recognize a book from a base64 encoded image"""
+@app.post("/recognize_base64", openapi_extra=BASE64_IMAGE_BODY)
+async def recognize_base64(request: Request, ctx: RequestContext = Depends(interactive_context)):
+    """
+    Recognize a book from a base64 encoded image ({"image": "..."})
+    The string is decoded while the body streams in, not after buffering it
+    """
     try:
-        import base64
+        upload = await receive_upload(read_base64_image, request, ctx, max_bytes=MAX_UPLOAD_BYTES)
         
-        img_data = base64.b64decode(data["image"])
+        check_cancelled(ctx)
         
-        if len(img_data) > 20 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large (max 20MB)")
+        img = decode_upload(upload, "Invalid image data")
         
-        img = cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image data")
-        
-        result = await recognize_image(img)
+        result = await recognize_image(img, ctx)
         
         return result
         
@@ -354,32 +1241,31 @@ async def recognize_base64(data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/recognize_visualize")
-async def recognize_visualize(file: UploadFile):
+@app.post("/recognize_visualize", openapi_extra=IMAGE_UPLOAD_BODY)
+async def recognize_visualize(request: Request, ctx: RequestContext = Depends(interactive_context)):
     """
     Recognize a book and return visualization of processing steps
     Shows how the image is analyzed, preprocessed, and features extracted
     """
+    from utils.visualization import create_processing_pipeline, get_quality_metrics
+    
     try:
-        # Read and decode image
-        data = await file.read()
-        
-        if len(data) > 20 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large (max 20MB)")
+        # Receive and decode image
+        upload = await receive_upload(read_image_upload, request, ctx, max_bytes=MAX_UPLOAD_BYTES)
         
-        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        check_cancelled(ctx)
         
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Get quality metrics
-        quality_info = get_quality_metrics(img)
+        img = decode_upload(upload)
         
-        # Create visualization pipeline
-        processing_steps = create_processing_pipeline(img, quality_info)
+        with span("visualize"):
+            # Get quality metrics
+            quality_info = get_quality_metrics(img)
+            
+            # Create visualization pipeline
+            processing_steps = create_processing_pipeline(img, quality_info)
         
         # Perform recognition
-        recognition_result = await recognize_image(img)
+        recognition_result = await recognize_image(img, ctx)
         
         # Return combined result
         return {
@@ -397,6 +1283,311 @@ async def recognize_visualize(file: UploadFile):
         raise HTTPException(status_code=500, detail=f"Visualization failed: {str(e)}")
 
 
+@app.post("/recognize_batch", openapi_extra=BATCH_UPLOAD_BODY)
+async def recognize_batch(request: Request, ctx: RequestContext = Depends(bulk_context)):
+    """
+    Recognize several book covers in one request (form field "files", repeated)
+    Embeds all uncached images in one CLIP batch and runs one index search
+    Scheduled as bulk traffic unless X-Priority says otherwise
+    """
+    if search_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service not ready. No books indexed yet."
+        )
+    
+    # More than MAX_BATCH_SIZE files fails the request as soon as the extra
+    # file starts; an oversized or non-image file only fails its own entry
+    files = await receive_upload(
+        read_image_uploads, request, ctx,
+        max_files=MAX_BATCH_SIZE, max_bytes=MAX_UPLOAD_BYTES
+    )
+    
+    try:
+        results: List[Optional[Dict]] = [None] * len(files)
+        images: Dict[int, np.ndarray] = {}
+        hashes: Dict[int, str] = {}
+        
+        # Decode and quality-check every file; failures are reported per file
+        for i, file in enumerate(files):
+            check_cancelled(ctx)
+            if file.error is not None:
+                metrics.UPLOADS_REJECTED.labels(file.error.reason).inc()
+                results[i] = {"status": "error", "error": file.error.detail}
+                continue
+            
+            with span("decode"):
+                img = file.decode()
+            if img is None:
+                results[i] = {"status": "error", "error": "Invalid image file"}
+                continue
+            
+            with span("quality"):
+                is_acceptable, quality_msg = assess_image_quality(img)
+            if not is_acceptable:
+                results[i] = {
+                    "status": "error",
+                    "error": quality_msg,
+                    "suggestion": "Please provide a clearer, well-lit image"
+                }
+                continue
+            
+            images[i] = img
+            hashes[i] = hash_image(img)
+        
+        # Embed cache misses in a single forward pass
+        embeddings = {i: embedding_cache.get(hashes[i]) for i in images}
+        misses = [i for i, emb in embeddings.items() if emb is None]
+        metrics.CACHE_REQUESTS.labels("hit").inc(len(embeddings) - len(misses))
+        metrics.CACHE_REQUESTS.labels("miss").inc(len(misses))
+        
+        # ISBN barcodes answer misses from the database without embedding them
+        if misses and barcode_reader is not None:
+            answers = await barcode_fast_path([images[i] for i in misses])
+            for i, answer in zip(misses, answers):
+                results[i] = answer
+            misses = [i for i in misses if results[i] is None]
+            check_cancelled(ctx)
+        
+        # Cascade: MobileNet answers the decisive misses, CLIP embeds the rest
+        stage_one_ids: Dict[int, Optional[str]] = {}
+        if misses and cascade_ready():
+            answers, top_ids = await cascade_first_stage([images[i] for i in misses], ctx)
+            for i, answer, top_id in zip(misses, answers, top_ids):
+                if answer is not None:
+                    results[i] = answer
+                    schedule_cascade_audit(images[i], hashes[i], top_id)
+                else:
+                    stage_one_ids[i] = top_id
+            misses = list(stage_one_ids)
+            check_cancelled(ctx)
+        
+        if misses:
+            embed = cascade.stats.timed_clip(get_clip_embeddings_batch) if stage_one_ids else get_clip_embeddings_batch
+            new_embeddings = await run_inference(
+                embed, [images[i] for i in misses],
+                ctx=ctx, batch_size=len(misses)
+            )
+            for i, emb in zip(misses, new_embeddings):
+                embedding_cache[hashes[i]] = emb
+                embeddings[i] = emb
+            metrics.CACHE_SIZE.set(len(embedding_cache))
+        
+        order = [i for i in images if results[i] is None]
+        if order:
+            block = np.vstack([embeddings[i] for i in order])
+            matches = await match_embeddings(block)
+            for i, match in zip(order, matches):
+                results[i] = match
+            if stage_one_ids:
+                compare_with_stage_one(
+                    [stage_one_ids[i] for i in order if i in stage_one_ids],
+                    [match for i, match in zip(order, matches) if i in stage_one_ids]
+                )
+        
+        return {
+            "count": len(files),
+            "results": [
+                {"file": file.filename, **result}
+                for file, result in zip(files, results)
+            ]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch recognition error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch recognition failed: {str(e)}")
+
+
+@app.post("/recognize_shelf", openapi_extra=IMAGE_UPLOAD_BODY)
+async def recognize_shelf(request: Request, ctx: RequestContext = Depends(interactive_context)):
+    """
+    Recognize every book cover in a photo of a shelf or table
+    Cover regions are found with contour detection, all crops are embedded
+    in one CLIP batch and matched with one multi-query index search
+    """
+    if search_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service not ready. No books indexed yet."
+        )
+    
+    try:
+        upload = await receive_upload(read_image_upload, request, ctx, max_bytes=MAX_UPLOAD_BYTES)
+        
+        check_cancelled(ctx)
+        
+        img = decode_upload(upload)
+        
+        height, width = img.shape[:2]
+        loop = asyncio.get_running_loop()
+        with span("segment"):
+            regions = await loop.run_in_executor(
+                None, bind_context(detect_cover_regions, img, MAX_SHELF_REGIONS)
+            )
+        
+        # Nothing cover-like found: treat the frame as a single cover
+        segmented = bool(regions)
+        if not segmented:
+            regions = [Region(0, 0, width, height)]
+        
+        results: List[Optional[Dict]] = [None] * len(regions)
+        crops: Dict[int, np.ndarray] = {}
+        with span("quality"):
+            for i, region in enumerate(regions):
+                crop = region.crop(img)
+                is_acceptable, quality_msg = assess_image_quality(crop)
+                if is_acceptable:
+                    crops[i] = crop
+                else:
+                    results[i] = {"status": "error", "error": quality_msg}
+        
+        if crops:
+            check_cancelled(ctx)
+            order = list(crops)
+            embeddings = await run_inference(
+                get_clip_embeddings_batch, [crops[i] for i in order],
+                ctx=ctx, batch_size=len(order)
+            )
+            check_cancelled(ctx, include_deadline=False)
+            for i, match in zip(order, await match_embeddings(embeddings)):
+                results[i] = match
+        
+        return {
+            "count": len(regions),
+            "segmented": segmented,
+            "image_size": {"width": width, "height": height},
+            "regions": [
+                {"region": i + 1, "box": region.to_dict(), **result}
+                for i, (region, result) in enumerate(zip(regions, results))
+            ]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Shelf recognition error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Shelf recognition failed: {str(e)}")
+
+
+@app.websocket("/ws/recognize")
+async def recognize_stream(websocket: WebSocket):
+    """
+    Recognize a live camera feed
+    
+    The client sends encoded frames (JPEG/PNG) as binary messages. Only
+    the newest frame waits while one is being recognized (older ones are
+    dropped as stale), and frames whose thumbnail barely differs from the
+    last recognized frame are skipped. A "match" message is pushed as soon
+    as a confident match for a new book appears; the same book is pushed
+    again only after a frame without a match.
+    """
+    global open_streams
+    
+    await websocket.accept()
+    session = StreamStats()
+    mailbox = LatestFrame()
+    inflight: Dict[str, RequestContext] = {}
+    
+    def count(outcome: str):
+        session.record(outcome)
+        stream_stats.record(outcome)
+        metrics.STREAM_FRAMES.labels(outcome).inc()
+    
+    async def read_frames():
+        seq = 0
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    continue  # Text messages are ignored
+                seq += 1
+                if len(data) > STREAM_MAX_FRAME_BYTES:
+                    count(INVALID)
+                elif mailbox.put(seq, data) is not None:
+                    count(STALE)
+        finally:
+            mailbox.close()
+            # Abandon a recognition still waiting for an inference slot
+            if "frame" in inflight:
+                inflight["frame"].cancel(RequestContext.DISCONNECTED)
+    
+    open_streams += 1
+    metrics.OPEN_STREAMS.inc()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.create_task(read_frames())
+    last_thumbnail: Optional[np.ndarray] = None
+    pushed_book_id: Optional[str] = None
+    try:
+        await websocket.send_json({
+            "type": "ready",
+            "max_frame_bytes": STREAM_MAX_FRAME_BYTES,
+            "duplicate_threshold": STREAM_DUPLICATE_THRESHOLD
+        })
+        
+        while True:
+            frame = await mailbox.get()
+            if frame is None:
+                break
+            seq, data = frame
+            start = time.perf_counter()
+            
+            # Decoding a full camera frame would stall every other connection
+            img, thumbnail = await loop.run_in_executor(None, bind_context(decode_frame, data))
+            if img is None:
+                count(INVALID)
+                await websocket.send_json({"type": "error", "frame": seq, "error": "Invalid image data"})
+                continue
+            
+            if last_thumbnail is not None and thumbnail_difference(thumbnail, last_thumbnail) < STREAM_DUPLICATE_THRESHOLD:
+                count(DUPLICATE)
+                continue
+            
+            ctx = inflight["frame"] = admission.new_context(INTERACTIVE)
+            try:
+                result = await recognize_image(img, ctx)
+            except HTTPException as e:
+                if mailbox.closed:
+                    break
+                # Shed or timed out: tell the client and go on with the next frame
+                await websocket.send_json({"type": "error", "frame": seq, "error": e.detail})
+                continue
+            finally:
+                del inflight["frame"]
+            
+            count(PROCESSED)
+            last_thumbnail = thumbnail
+            if result.get("status") == "success":
+                book_id = result["top_match"]["book_id"]
+                if book_id != pushed_book_id:
+                    pushed_book_id = book_id
+                    session.matches_pushed += 1
+                    stream_stats.matches_pushed += 1
+                    await websocket.send_json({
+                        "type": "match",
+                        "frame": seq,
+                        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                        **result
+                    })
+            elif result.get("status") == "no_match":
+                # The book left the frame: announce it again if it comes back
+                pushed_book_id = None
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Stream recognition error: {e}", exc_info=True)
+    finally:
+        reader.cancel()
+        open_streams -= 1
+        metrics.OPEN_STREAMS.dec()
+        logger.info(f"Stream closed: {session.stats()}")
+
+
 @app.get("/books")
 async def list_books(limit: int = None, offset: int = 0):
     """List all indexed books with pagination"""
@@ -427,39 +1618,95 @@ async def search_books(q: str, limit: int = 10):
     return {"query": q, "count": len(results), "results": results}
 
 
+def read_covers(paths: List[str]) -> List[Optional[np.ndarray]]:
+    """Load cover images (blocking); None for missing or unreadable files"""
+    imgs = []
+    for path in paths:
+        img_path = Path(path)
+        if not img_path.exists():
+            logger.warning(f"Image not found: {img_path}")
+            imgs.append(None)
+            continue
+        
+        img = cv2.imread(str(img_path))
+        if img is None:
+            logger.warning(f"Cannot read image: {img_path}")
+        imgs.append(img)
+    return imgs
+
+
+def embed_covers(imgs: List[np.ndarray], stage_one: Optional[CascadeStage]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """CLIP vectors and, with a cascade, its MobileNet vectors for one batch of covers (blocking)"""
+    clip_embeddings = get_clip_embeddings_batch(imgs)
+    return clip_embeddings, stage_one.embed_fn(imgs) if stage_one is not None else None
+
+
+async def run_background_inference(fn, *args, batch_size: int):
+    """
+    run_inference() for background work: bulk lane, a fresh deadline per
+    call, and a shed or unavailable call is retried after Retry-After
+    """
+    for attempt in range(1, REGENERATE_MAX_ATTEMPTS + 1):
+        ctx = admission.new_context(BULK)
+        try:
+            return await run_inference(fn, *args, ctx=ctx, batch_size=batch_size)
+        except HTTPException as e:
+            if e.status_code != 503 or attempt == REGENERATE_MAX_ATTEMPTS:
+                raise
+            await asyncio.sleep(float((e.headers or {}).get("Retry-After", 1)))
+        finally:
+            ctx.close()
+
+
 async def regenerate_embeddings_async():
     """Regenerate all embeddings asynchronously (background task)"""
-    global embeddings_array, faiss_index, book_ids_list
-    
     logger.info("Starting background embedding regeneration...")
+    regeneration_start = time.perf_counter()
     
     try:
-        books = await db.get_all_books()
-        book_ids_list = [book['book_id'] for book in books]
+        # Embed in get_book_ids_sync() order, which is the row order
+        # load_embeddings_and_index (and snapshots) pair with embeddings.npy
+        books_by_id = {book['book_id']: book for book in await db.get_all_books()}
+        books = [books_by_id[book_id] for book_id in get_book_ids_sync() if book_id in books_by_id]
         embeddings = []
+        # MobileNet vectors for the cascade, keyed by the books actually embedded
+        stage_one = cascade
+        cascade_embeddings, cascade_ids = [], []
         
-        for book in books:
-            img_path = Path(book['image'])
-            if not img_path.exists():
-                logger.warning(f"Image not found: {img_path}")
+        # Batched forward passes in the bulk lane, so regeneration neither
+        # blocks the event loop nor starves interactive requests
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(books), REGENERATE_BATCH_SIZE):
+            batch = books[start:start + REGENERATE_BATCH_SIZE]
+            imgs = await loop.run_in_executor(None, read_covers, [book['image'] for book in batch])
+            loaded = [(book, img) for book, img in zip(batch, imgs) if img is not None]
+            if not loaded:
                 continue
             
-            img = cv2.imread(str(img_path))
-            if img is None:
-                logger.warning(f"Cannot read image: {img_path}")
-                continue
+            clip_embeddings, stage_one_embeddings = await run_background_inference(
+                embed_covers, [img for _, img in loaded], stage_one, batch_size=len(loaded)
+            )
+            embeddings.append(clip_embeddings)
             
-            emb = get_embedding(img, use_clip=True)
-            embeddings.append(emb)
+            if stage_one is not None:
+                cascade_embeddings.append(stage_one_embeddings)
+                cascade_ids.extend(book['book_id'] for book, _ in loaded)
         
         if embeddings:
-            embeddings_array = np.vstack(embeddings).astype("float32")
-            np.save("embeddings.npy", embeddings_array)
+            new_embeddings = np.vstack(embeddings).astype("float32")
+            await loop.run_in_executor(None, np.save, "embeddings.npy", new_embeddings)
             
             # Rebuild FAISS index
-            load_embeddings_and_index()
+            await reload_embeddings_and_index()
+            
+            if stage_one is not None:
+                save_cascade_embeddings(CASCADE_EMBEDDINGS, np.vstack(cascade_embeddings), cascade_ids, stage_one.model)
+                load_cascade()
             
-            logger.info(f"Successfully regenerated {len(embeddings)} embeddings")
+            metrics.REBUILD_DURATION.labels("regenerate_embeddings").observe(
+                time.perf_counter() - regeneration_start
+            )
+            logger.info(f"Successfully regenerated {len(new_embeddings)} embeddings")
         else:
             logger.warning("No embeddings generated")
             
@@ -469,16 +1716,21 @@ async def regenerate_embeddings_async():
 
 @app.post("/admin/add_book")
 async def add_book(
+    request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = None,
     title: str = Form(...),
     author: str = Form(...),
     isbn: str = Form(None),
-    publisher: str = Form(None)
+    publisher: str = Form(None),
+    ctx: RequestContext = Depends(bulk_context)
 ):
     """Admin endpoint to add a new book to the library"""
     import uuid
-    import shutil
+    
+    ensure_writable()
+    # The form is already parsed, so the connection can be watched right away
+    ctx.watch(request)
     
     try:
         # Generate unique book ID
@@ -489,6 +1741,19 @@ async def add_book(
         if existing:
             raise HTTPException(status_code=400, detail=f"Book {book_id} already exists")
         
+        # Embed the cover now so the change log carries the vector to replicas
+        # (behind the inference scheduler, off the event loop). Done from the
+        # upload before anything is written: a shed or cancelled request
+        # leaves no cover file behind
+        data = await file.read()
+        loop = asyncio.get_running_loop()
+        cover_img = await loop.run_in_executor(
+            None, cv2.imdecode, np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR
+        )
+        embedding = None
+        if cover_img is not None:
+            embedding = await run_inference(get_embedding, cover_img, True, ctx=ctx)
+        
         # Save cover image
         covers_dir = Path("covers")
         covers_dir.mkdir(exist_ok=True)
@@ -496,20 +1761,23 @@ async def add_book(
         file_extension = Path(file.filename).suffix or ".jpg"
         image_filename = f"{book_id}{file_extension}"
         image_path = covers_dir / image_filename
+        await loop.run_in_executor(None, image_path.write_bytes, data)
         
-        # Save uploaded file
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Add to database
-        success = await db.add_book(
-            book_id=book_id,
-            title=title,
-            author=author,
-            image_path=str(image_path),
-            isbn=isbn,
-            publisher=publisher
-        )
+        # Add to database; the cover goes again if the book is not added
+        success = False
+        try:
+            success = await db.add_book(
+                book_id=book_id,
+                title=title,
+                author=author,
+                image_path=str(image_path),
+                isbn=isbn,
+                publisher=publisher,
+                embedding=embedding
+            )
+        finally:
+            if not success:
+                image_path.unlink(missing_ok=True)
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to add book to database")
@@ -537,6 +1805,8 @@ async def add_book(
 @app.delete("/admin/delete_book/{book_id}")
 async def delete_book(book_id: str, background_tasks: BackgroundTasks):
     """Admin endpoint to delete a book from the library"""
+    ensure_writable()
+    
     book = await db.get_book(book_id)
     
     if not book:
@@ -576,6 +1846,8 @@ async def delete_book(book_id: str, background_tasks: BackgroundTasks):
 @app.post("/admin/rebuild_index")
 async def rebuild_index(background_tasks: BackgroundTasks):
     """Manually trigger index rebuild"""
+    ensure_writable()
+    
     background_tasks.add_task(regenerate_embeddings_async)
     return {
         "success": True,
@@ -583,6 +1855,69 @@ async def rebuild_index(background_tasks: BackgroundTasks):
     }
 
 
+@app.post("/admin/profile", dependencies=[Depends(require_admin_token)])
+async def profile_worker(
+    seconds: float = 10.0,
+    interval_ms: float = 10.0,
+    format: str = "collapsed",
+    include_idle: bool = False
+):
+    """
+    Sample this worker's Python stacks for a few seconds under live traffic
+    
+    Sampling runs on its own thread, so requests keep being served (and
+    show up in the profile). Each call profiles only the worker that
+    answered it. Returns collapsed stacks (text) or speedscope JSON.
+    """
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'speedscope'")
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}]")
+    
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    
+    def on_done(profile, error):
+        loop.call_soon_threadsafe(
+            lambda: done.done() or done.set_result((profile, error))
+        )
+    
+    profile_in_thread(seconds, interval_ms / 1000, include_idle, on_done=on_done)
+    profile, error = await done
+    
+    if isinstance(error, ProfilerBusy):
+        raise HTTPException(status_code=409, detail=str(error))
+    if error is not None:
+        logger.error(f"Profiling failed: {error}")
+        raise HTTPException(status_code=500, detail=f"Profiling failed: {error}")
+    
+    headers = {"X-Profile-Worker-Pid": str(os.getpid())}
+    if format == "speedscope":
+        return JSONResponse(profile.to_speedscope(name=f"book-ocr pid {os.getpid()}"), headers=headers)
+    return PlainTextResponse(profile.to_collapsed(), headers=headers)
+
+
+@app.get("/replication/changes")
+async def replication_changes(since: int = 0, limit: int = 500):
+    """Catalog change log entries after `since`, for read replicas to tail"""
+    limit = max(1, min(limit, 5000))
+    changes = await db.get_changes_since(since, limit=limit)
+    head_seq = await db.get_change_head()
+    
+    return {
+        "since": since,
+        "head_seq": head_seq,
+        "changes": [encode_change(c) for c in changes]
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics, aggregated across workers in multiprocess mode"""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/stats")
 async def get_stats():
     """Get system statistics"""
@@ -595,7 +1930,13 @@ async def get_stats():
         "cache_capacity": CACHE_SIZE,
         "model": "CLIP ViT-B/32",
         "confidence_threshold": CONFIDENCE_THRESHOLD,
-        "search_algorithm": "HNSW" if USE_HNSW else "Flat Index"
+        "search_algorithm": "HNSW" if USE_HNSW else "Flat Index",
+        "index": describe_index(faiss_index) if faiss_index is not None else None,
+        "barcode": barcode_status(),
+        "cascade": cascade_status(),
+        "streams": {"open": open_streams, **stream_stats.stats()},
+        "uploads": {"max_bytes": MAX_UPLOAD_BYTES, **upload_buffers.stats()},
+        "admission": admission.stats()
     }
 
 
@@ -10,35 +10,43 @@ from pathlib import Path
 import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-API_URL = "http://localhost:8000/recognize"
+API_URL = "http://localhost:8000/recognize_batch"
 MAX_WORKERS = 4  # Adjust based on your system
+BATCH_SIZE = 16  # Images per request (server limit is 32)
+# Bulk lane: interactive users are served first, batch jobs get a guaranteed share
+HEADERS = {"X-Priority": "bulk"}
 
 
-def process_image(image_path: Path):
-    """Process a single image"""
+def process_batch(image_paths: list):
+    """Process a chunk of images with one /recognize_batch request"""
+    handles = [open(p, 'rb') for p in image_paths]
     try:
-        with open(image_path, 'rb') as f:
-            response = requests.post(API_URL, files={"file": f}, timeout=30)
-            
+        files = [("files", (p.name, f)) for p, f in zip(image_paths, handles)]
+        response = requests.post(API_URL, files=files, headers=HEADERS, timeout=120)
+        
         if response.status_code == 200:
-            result = response.json()
-            return {
-                "file": image_path.name,
-                "status": "success",
-                "result": result
-            }
+            return [
+                {
+                    "file": item["file"],
+                    "status": "success" if item["status"] != "error" else "error",
+                    "result": item,
+                    "error": item.get("error")
+                }
+                for item in response.json()["results"]
+            ]
         else:
-            return {
-                "file": image_path.name,
-                "status": "error",
-                "error": response.text
-            }
+            return [
+                {"file": p.name, "status": "error", "error": response.text}
+                for p in image_paths
+            ]
     except Exception as e:
-        return {
-            "file": image_path.name,
-            "status": "error",
-            "error": str(e)
-        }
+        return [
+            {"file": p.name, "status": "error", "error": str(e)}
+            for p in image_paths
+        ]
+    finally:
+        for f in handles:
+            f.close()
 
 
 def batch_process(directory: str, output_file: str = None):
@@ -61,32 +69,36 @@ def batch_process(directory: str, output_file: str = None):
         return
     
     print(f"Found {len(image_files)} images to process")
-    print(f"Processing with {MAX_WORKERS} workers...\n")
+    print(f"Processing in batches of {BATCH_SIZE} with {MAX_WORKERS} workers...\n")
     
     results = []
+    batches = [
+        image_files[i:i + BATCH_SIZE]
+        for i in range(0, len(image_files), BATCH_SIZE)
+    ]
     
-    # Process images in parallel
+    # Process batches in parallel
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_file = {
-            executor.submit(process_image, img): img
-            for img in image_files
-        }
+        futures = [executor.submit(process_batch, batch) for batch in batches]
         
-        for i, future in enumerate(as_completed(future_to_file), 1):
-            result = future.result()
-            results.append(result)
-            
-            # Print progress
-            status_symbol = "✓" if result["status"] == "success" else "✗"
-            print(f"[{i}/{len(image_files)}] {status_symbol} {result['file']}")
-            
-            if result["status"] == "success":
-                candidates = result["result"]["candidates"]
-                distances = result["result"]["distance"]
-                print(f"    Top match: {candidates[0]} (distance: {distances[0]:.4f})")
-            else:
-                print(f"    Error: {result['error']}")
-            print()
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                
+                # Print progress
+                status_symbol = "✓" if result["status"] == "success" else "✗"
+                print(f"[{len(results)}/{len(image_files)}] {status_symbol} {result['file']}")
+                
+                if result["status"] == "success":
+                    recognition = result["result"]
+                    if recognition["status"] == "success":
+                        top = recognition["top_match"]
+                        print(f"    Top match: {top['title']} (similarity: {top['similarity']:.4f})")
+                    else:
+                        print(f"    No confident match (top similarity: {recognition['top_similarity']:.4f})")
+                else:
+                    print(f"    Error: {result['error']}")
+                print()
     
     # Save results to file if specified
     if output_file:
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the recognition pipeline
+Needs no server and no network: covers and catalogs are synthetic and CLIP is
+a randomly initialized ViT-B/32 unless --model local is given
+
+Usage:
+    python benchmark.py                                   # 1k/10k/100k catalogs -> bench_results.json
+    python benchmark.py --sizes 1000 --images 20          # quick run
+    python benchmark.py --output new.json --baseline bench_baseline.json
+    python benchmark.py --thread-sweep 1,2,4 --parallel 1,2   # pick thread settings
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import tempfile
+import logging
+import numpy as np
+import cv2
+import faiss
+import torch
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from utils.embedding_v2 import (
+    assess_image_quality,
+    get_clip_embedding,
+    get_clip_embeddings_batch,
+    initialize_clip_model,
+    initialize_offline_clip_model
+)
+from utils.database import BookDatabase
+from utils.search import SearchService, build_index, describe_index
+from utils.synthetic import (
+    encode_jpeg,
+    noisy_queries,
+    synthetic_books_db,
+    synthetic_catalog,
+    synthetic_cover
+)
+from utils.timing import collect_spans
+from utils.runtime import ThreadConfig, apply_thread_config
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+RESULTS_FORMAT_VERSION = 1
+DEFAULT_SIZES = "1000,10000,100000"
+# Keep in sync with app_v2.py
+TOP_K_RESULTS = 5
+USE_HNSW = True
+
+
+def summarize(samples: List[float], items_per_sample: int = 1) -> Dict:
+    """
+    Latency percentiles and throughput for a list of durations
+
+    Args:
+        samples: Durations in seconds
+        items_per_sample: Items processed per sample (batch size)
+
+    Returns:
+        Dict with count, mean/p50/p95/p99 in ms and items per second
+    """
+    arr = np.asarray(samples, dtype=np.float64)
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()) * 1000, 4),
+        "p50_ms": round(float(np.percentile(arr, 50)) * 1000, 4),
+        "p95_ms": round(float(np.percentile(arr, 95)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(arr, 99)) * 1000, 4),
+        "throughput_per_s": round(items_per_sample * arr.size / float(arr.sum()), 2) if arr.sum() else None
+    }
+
+
+def time_calls(fn: Callable, items: List, warmup: int = 3) -> List[float]:
+    """Call fn(item) for each item and return the durations (after warm-up calls)"""
+    for item in items[:warmup]:
+        fn(item)
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _timed(fn: Callable) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_image_stages(jpegs: List[bytes], images: List[np.ndarray], embed_batch: int) -> Dict:
+    """Decode, quality check, CLIP preprocessing and forward pass (catalog independent)"""
+    results = {}
+    results["decode"] = summarize(time_calls(
+        lambda data: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), jpegs
+    ))
+    results["quality"] = summarize(time_calls(assess_image_quality, images))
+
+    # Preprocess and forward are split with the same spans the service reports
+    for img in images[:2]:
+        get_clip_embedding(img)
+    preprocess, forward = [], []
+    for img in images:
+        with collect_spans() as timer:
+            get_clip_embedding(img)
+        preprocess.append(timer.stages["preprocess"])
+        forward.append(timer.stages["forward"])
+    results["preprocess"] = summarize(preprocess)
+    results["embed"] = summarize(forward)
+
+    if embed_batch > 1:
+        batches = [images[i:i + embed_batch] for i in range(0, len(images) - embed_batch + 1, embed_batch)]
+        if batches:
+            durations = time_calls(get_clip_embeddings_batch, batches, warmup=1)
+            results[f"embed_batch{embed_batch}"] = summarize(durations, items_per_sample=embed_batch)
+    return results
+
+
+def bench_catalog(size: int, jpegs: List[bytes], queries: int, rng: np.random.Generator,
+                  workdir: Path, use_hnsw: bool, shards: int) -> Dict:
+    """Index build, search, DB lookup and end-to-end latency for one catalog size"""
+    results = {}
+    catalog = synthetic_catalog(size, rng)
+    book_ids = synthetic_books_db(str(workdir / f"books_{size}.db"), size)
+    db = BookDatabase(str(workdir / f"books_{size}.db"))
+
+    start = time.perf_counter()
+    index = build_index(catalog, use_hnsw=use_hnsw, num_shards=shards)
+    results["index_build"] = summarize([time.perf_counter() - start])
+    service = SearchService(index, book_ids, top_k=TOP_K_RESULTS)
+
+    query_block, sources = noisy_queries(catalog, queries, rng)
+    results["search"] = summarize(time_calls(service.search, list(query_block)))
+    batch = service.search(query_block)
+    # Sanity check: perturbed copies should find their source row first
+    results["search"]["top1_self_hit"] = round(float(np.mean(batch.indices[:, 0] == sources)), 4)
+    results["search_batch"] = summarize([
+        _timed(lambda: service.search(query_block)) for _ in range(5)
+    ], items_per_sample=queries)
+
+    loop = asyncio.new_event_loop()
+    try:
+        id_lists = [service.unique_book_ids(service.search(q)) for q in query_block]
+        results["db_lookup"] = summarize(time_calls(
+            lambda ids: loop.run_until_complete(db.get_books(ids)), id_lists
+        ))
+
+        def end_to_end(data: bytes):
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            assess_image_quality(img)
+            result = service.search(get_clip_embedding(img))
+            loop.run_until_complete(db.get_books(service.unique_book_ids(result)))
+
+        results["end_to_end"] = summarize(time_calls(end_to_end, jpegs))
+    finally:
+        loop.close()
+
+    results["index"] = describe_index(index)
+    return results
+
+
+def bench_thread_sweep(images: List[np.ndarray], thread_counts: List[int], parallel_levels: List[int],
+                       embed_batch: int, catalog_size: int, queries: int, rng: np.random.Generator) -> Dict:
+    """
+    Embedding and search throughput for each thread setting
+
+    `parallel` callers run at once to stand in for concurrent requests
+    (or workers): each caller's forward pass gets its own team of
+    `threads` OpenMP threads, so parallel x threads > cores shows the cost
+    of oversubscription.
+
+    Returns:
+        Results keyed "threads{n}/parallel{p}/{stage}"
+    """
+    results = {}
+    catalog = synthetic_catalog(catalog_size, rng)
+    service = SearchService(build_index(catalog, use_hnsw=USE_HNSW), [str(i) for i in range(catalog_size)],
+                            top_k=TOP_K_RESULTS)
+    query_block, _ = noisy_queries(catalog, queries, rng)
+    batches = [images[i:i + embed_batch] for i in range(0, len(images) - embed_batch + 1, embed_batch)]
+
+    for threads in thread_counts:
+        apply_thread_config(ThreadConfig(
+            torch_threads=threads, faiss_threads=threads, opencv_threads=threads, onnx_threads=threads
+        ))
+        for parallel in parallel_levels:
+            prefix = f"threads{threads}/parallel{parallel}"
+            logger.info(f"Sweep: {threads} thread(s), {parallel} parallel caller(s)...")
+            with ThreadPoolExecutor(max_workers=parallel) as pool:
+                def run_parallel(fn: Callable, items: List) -> List[float]:
+                    # Each caller takes every parallel-th item; durations are per call
+                    lanes = [items[i::parallel] for i in range(parallel)]
+                    return [d for lane in pool.map(lambda lane: time_calls(fn, lane, warmup=1), lanes) for d in lane]
+
+                def throughput(fn: Callable, items: List, per_item: int = 1) -> Dict:
+                    start = time.perf_counter()
+                    durations = run_parallel(fn, items)
+                    stats = summarize(durations, items_per_sample=per_item)
+                    # Wall-clock rate across all callers, not one caller's rate
+                    stats["throughput_per_s"] = round(per_item * len(durations) / (time.perf_counter() - start), 2)
+                    return stats
+
+                results[f"{prefix}/embed"] = throughput(get_clip_embedding, images)
+                if batches:
+                    results[f"{prefix}/embed_batch{embed_batch}"] = throughput(
+                        get_clip_embeddings_batch, batches, per_item=embed_batch
+                    )
+                results[f"{prefix}/search@{catalog_size}"] = throughput(service.search, list(query_block))
+                results[f"{prefix}/search_batch@{catalog_size}"] = throughput(
+                    service.search, [query_block] * 5, per_item=queries
+                )
+    return results
+
+
+def best_thread_settings(results: Dict) -> Dict:
+    """Highest-throughput thread count per stage and parallelism level"""
+    best: Dict[str, Dict] = {}
+    for key, stats in results.items():
+        threads, parallel, stage = key.split("/", 2)
+        slot = f"{parallel}/{stage}"
+        if stats["throughput_per_s"] and stats["throughput_per_s"] > best.get(slot, {}).get("throughput_per_s", 0):
+            best[slot] = {"threads": int(threads[len("threads"):]), "throughput_per_s": stats["throughput_per_s"]}
+    return best
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[Dict]:
+    """
+    Find stages whose p50 or p95 got slower than the baseline
+
+    Args:
+        current: Results of this run
+        baseline: Saved results of an earlier run
+        tolerance: Allowed relative slowdown (0.15 = 15%)
+        min_delta_ms: Ignore absolute differences below this (timer noise)
+
+    Returns:
+        List of regressions (stage, metric, baseline, current, change)
+    """
+    regressions = []
+    for stage, stats in current["results"].items():
+        old = baseline.get("results", {}).get(stage)
+        if not old:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if metric not in stats or metric not in old or not old[metric]:
+                continue
+            delta = stats[metric] - old[metric]
+            change = delta / old[metric]
+            if change > tolerance and delta > min_delta_ms:
+                regressions.append({
+                    "stage": stage,
+                    "metric": metric,
+                    "baseline": old[metric],
+                    "current": stats[metric],
+                    "change": round(change, 4)
+                })
+    return regressions
+
+
+def print_table(results: Dict, baseline: Dict = None):
+    """Human-readable summary of a results dict"""
+    width = max([26] + [len(stage) + 2 for stage in results["results"]])
+    print(f"\n{'stage':<{width}}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>12}{'vs base p50':>14}")
+    for stage, stats in results["results"].items():
+        old = (baseline or {}).get("results", {}).get(stage, {})
+        change = ""
+        if old.get("p50_ms"):
+            change = f"{(stats['p50_ms'] - old['p50_ms']) / old['p50_ms']:+.1%}"
+        print(f"{stage:<{width}}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+              f"{stats['throughput_per_s'] or 0:>12.1f}{change:>14}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline recognition pipeline benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Catalog sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--images", type=int, default=50, help="Synthetic cover images (default: 50)")
+    parser.add_argument("--queries", type=int, default=500, help="Search queries per catalog (default: 500)")
+    parser.add_argument("--embed-batch", type=int, default=16, help="Batch size for the batched forward pass (default: 16)")
+    parser.add_argument("--flat", action="store_true", help="Benchmark the exact flat index instead of HNSW")
+    parser.add_argument("--shards", type=int, default=1, help="Index shards (default: 1)")
+    parser.add_argument("--model", choices=["offline", "local"], default="offline",
+                        help="offline = random ViT-B/32 weights; local = cached pretrained CLIP")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results.json", help="Results file (default: bench_results.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown vs baseline (default: 0.15)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore smaller absolute changes (default: 0.05)")
+    parser.add_argument("--thread-sweep", help="Instead of the stage suite, measure throughput at these "
+                                               "torch/FAISS/OpenCV thread counts, e.g. 1,2,4")
+    parser.add_argument("--parallel", default="1",
+                        help="Concurrent callers per thread setting in --thread-sweep, e.g. 1,2 (default: 1)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.model == "offline":
+        initialize_offline_clip_model(seed=args.seed)
+    else:
+        initialize_clip_model()
+
+    logger.info(f"Generating {args.images} synthetic covers...")
+    images = [synthetic_cover(rng) for _ in range(args.images)]
+    jpegs = [encode_jpeg(img) for img in images]
+    decoded = [cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) for data in jpegs]
+
+    output = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "faiss": faiss.__version__,
+            "faiss_threads": faiss.omp_get_max_threads(),
+            "opencv": cv2.__version__
+        },
+        "config": {
+            "sizes": [int(s) for s in args.sizes.split(",") if s],
+            "images": args.images,
+            "queries": args.queries,
+            "embed_batch": args.embed_batch,
+            "use_hnsw": USE_HNSW and not args.flat,
+            "shards": args.shards,
+            "model": args.model,
+            "seed": args.seed
+        },
+        "results": {}
+    }
+
+    if args.thread_sweep:
+        size = output["config"]["sizes"][0]
+        output["config"].update(
+            thread_sweep=[int(n) for n in args.thread_sweep.split(",")],
+            parallel=[int(p) for p in args.parallel.split(",")]
+        )
+        output["results"] = bench_thread_sweep(
+            decoded, output["config"]["thread_sweep"], output["config"]["parallel"],
+            args.embed_batch, size, args.queries, rng
+        )
+        output["best_thread_settings"] = best_thread_settings(output["results"])
+        Path(args.output).write_text(json.dumps(output, indent=2))
+        logger.info(f"Results written to {args.output}")
+        print_table(output)
+        print(f"\n{'parallel/stage':<40}{'best threads':>14}{'items/s':>12}")
+        for slot, best in output["best_thread_settings"].items():
+            print(f"{slot:<40}{best['threads']:>14}{best['throughput_per_s']:>12.1f}")
+        return
+
+    logger.info("Benchmarking image stages...")
+    output["results"].update(bench_image_stages(jpegs, decoded, args.embed_batch))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in output["config"]["sizes"]:
+            logger.info(f"Benchmarking catalog of {size} vectors...")
+            catalog_results = bench_catalog(
+                size, jpegs, args.queries, rng, Path(workdir),
+                use_hnsw=output["config"]["use_hnsw"], shards=args.shards
+            )
+            index_info = catalog_results.pop("index")
+            output["config"].setdefault("index", {})[str(size)] = index_info
+            for stage, stats in catalog_results.items():
+                output["results"][f"{stage}@{size}"] = stats
+
+    Path(args.output).write_text(json.dumps(output, indent=2))
+    logger.info(f"Results written to {args.output}")
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_table(output, baseline)
+
+    if baseline:
+        regressions = compare(output, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) over {args.tolerance:.0%}:")
+            for r in regressions:
+                print(f"  {r['stage']} {r['metric']}: {r['baseline']:.3f} -> {r['current']:.3f} ms ({r['change']:+.1%})")
+            sys.exit(1)
+        print(f"\n✓ No regressions over {args.tolerance:.0%} vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
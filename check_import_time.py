@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the app and the command-line tools
+Each module is imported in a fresh interpreter; fails when one gets slower
+than its budget or pulls in torch/transformers at import time, or when a
+metadata-only tool pulls in cv2/faiss
+
+Usage:
+    python check_import_time.py
+    python check_import_time.py --runs 5 --verbose
+"""
+import os
+import sys
+import json
+import subprocess
+
+# Only the code that embeds covers may load these, and only when it runs
+HEAVY_MODULES = ("torch", "transformers", "onnxruntime")
+
+# Image decoding and the vector index: the server and embedding tools load
+# these at import time, tools that only touch the database or a manifest must not
+NATIVE_MODULES = ("cv2", "faiss")
+METADATA_TOOLS = ("migrate_to_v2", "add_books_helper", "snapshot", "export_model")
+
+# Module -> seconds (best of --runs, interpreter start-up not included)
+BUDGETS = {
+    "app_v2": 1.0,
+    "utils.database": 0.5,
+    "utils.embedding_v2": 0.5,
+    "utils.search": 0.5,
+    "utils.snapshot": 0.5,
+    "utils.replication": 0.5,
+    "utils.inference": 0.5,
+    "utils.runtime": 0.5,
+    "migrate_to_v2": 0.5,
+    "add_books_helper": 0.5,
+    "snapshot": 0.5,
+    "export_model": 0.5,
+    "generate_embeddings_v2": 0.5,
+}
+
+_PROBE = """
+import sys, json, time, importlib
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def forbidden_imports(module: str) -> tuple:
+    """Modules `module` must not load at import time"""
+    return HEAVY_MODULES + (NATIVE_MODULES if module in METADATA_TOOLS else ())
+
+
+def measure(module: str) -> dict:
+    """Import `module` in a fresh interpreter from the repo root"""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE, module, *forbidden_imports(module)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_module(module: str, runs: int = 3) -> tuple:
+    """
+    Measure `module` against its budget and import expectations
+
+    Returns:
+        (seconds or None if the import failed, list of problems)
+    """
+    budget = BUDGETS.get(module, 0.5)
+    samples = [measure(module) for _ in range(max(1, runs))]
+    errors = [sample["error"] for sample in samples if "error" in sample]
+    if errors:
+        return None, [errors[0]]
+
+    seconds = min(sample["seconds"] for sample in samples)
+    heavy = sorted({name for sample in samples for name in sample["heavy"]})
+    problems = []
+    if seconds > budget:
+        problems.append("over budget")
+    if heavy:
+        problems.append(f"imports {', '.join(heavy)}")
+    return seconds, problems
+
+
+def slowest_imports(module: str, top: int = 8) -> list:
+    """Largest direct imports of `module`, from `python -X importtime`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Imports made directly by the module (one indent level); deeper
+        # ones are already counted in their parent's cumulative time
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check import times against their budgets")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all with a budget)")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="Imports per module; the fastest counts (default: 3)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the slowest imports of every module, not only failing ones")
+    args = parser.parse_args()
+
+    modules = args.modules or list(BUDGETS)
+    failures = 0
+    print(f"{'Module':<26} {'Import (s)':>10} {'Budget':>8}  Result")
+    for module in modules:
+        budget = BUDGETS.get(module, 0.5)
+        seconds, problems = check_module(module, args.runs)
+        if seconds is None:
+            print(f"{module:<26} {'-':>10} {budget:>8.2f}  FAIL: {problems[0]}")
+            failures += 1
+            continue
+
+        print(f"{module:<26} {seconds:>10.3f} {budget:>8.2f}  {'FAIL: ' + '; '.join(problems) if problems else 'ok'}")
+
+        if problems or args.verbose:
+            for cumulative, name in slowest_imports(module):
+                print(f"{'':<28}{cumulative:>8.3f}s  {name}")
+        failures += bool(problems)
+
+    if failures:
+        print(f"\n{failures} module(s) failed the import-time check")
+        sys.exit(1)
+    print("\nAll modules within budget")
+
+
+if __name__ == "__main__":
+    main()
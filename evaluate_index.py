@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Recall / latency evaluation of index configurations on the current catalog
+Builds a labelled query set from augmented covers (rotation, crop, blur,
+glare, perspective, dim), then reports top-1/top-5 accuracy, recall versus
+exact search, no-match rate at the confidence threshold and query latency
+for each index configuration
+
+Usage:
+    python evaluate_index.py                                  # default grid, queries from covers/
+    python evaluate_index.py --save-queries queries.npz       # keep the embedded query set
+    python evaluate_index.py --queries queries.npz --configs flat,hnsw:m=32:ef=16,hnsw:m=32:ef=64
+    python evaluate_index.py --queries queries.npz --pad-to 100000   # add random distractors
+    python evaluate_index.py --cascade embeddings_mobilenet.npz      # MobileNet -> CLIP cascade sweep
+"""
+import json
+import time
+import logging
+import numpy as np
+import cv2
+import faiss
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.database import DB_PATH, get_all_books_sync, get_book_ids_sync
+from utils.search import HNSW_EF_CONSTRUCTION, HNSW_M, SearchService, build_index, describe_index
+from utils.cascade import cascade_sweep, load_cascade_embeddings, mobilenet_embed_batch
+from utils.synthetic import AUGMENTATIONS, augment_cover, synthetic_catalog
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+# Keep in sync with app_v2.py
+CONFIDENCE_THRESHOLD = 0.65
+TOP_K_RESULTS = 5
+DEFAULT_CONFIGS = "flat,hnsw:m=16:ef=16,hnsw:m=32:ef=16,hnsw:m=32:ef=32,hnsw:m=32:ef=64,hnsw:m=32:ef=128"
+DEFAULT_THRESHOLDS = "0.55,0.6,0.65,0.7,0.75,0.8"
+DEFAULT_CASCADE_SIMILARITIES = "0.7,0.75,0.8,0.85,0.9"
+DEFAULT_CASCADE_MARGINS = "0.0,0.05,0.1,0.15,0.2"
+
+
+def parse_configs(spec: str) -> List[Dict]:
+    """
+    Parse `flat,hnsw:m=32:ef=64,hnsw:m=16:ef=32:efc=80:shards=2` into configs
+    """
+    configs = []
+    for item in spec.split(","):
+        kind, *params = item.strip().split(":")
+        if kind not in ("flat", "hnsw"):
+            raise ValueError(f"Unknown index type '{kind}' (flat or hnsw)")
+        values = dict(p.split("=", 1) for p in params)
+        configs.append({
+            "name": item.strip(),
+            "use_hnsw": kind == "hnsw",
+            "hnsw_m": int(values.get("m", HNSW_M)),
+            "ef_search": int(values.get("ef", 16)),
+            "ef_construction": int(values.get("efc", HNSW_EF_CONSTRUCTION)),
+            "shards": int(values.get("shards", 1))
+        })
+    return configs
+
+
+def load_catalog(embeddings_path: str, db_path: str) -> Tuple[np.ndarray, List[str]]:
+    """Catalog embeddings (normalized) and the book id of each row"""
+    embeddings = np.load(embeddings_path).astype("float32")
+    book_ids = get_book_ids_sync(db_path)
+    if len(book_ids) != len(embeddings):
+        raise SystemExit(
+            f"Mismatch: {len(book_ids)} books but {len(embeddings)} embeddings; "
+            "regenerate embeddings first"
+        )
+    faiss.normalize_L2(embeddings)
+    return embeddings, book_ids
+
+
+def build_query_set(db_path: str, augmentations: List[str], max_books: Optional[int],
+                    seed: int, batch_size: int = 16, cascade: bool = False) -> Dict:
+    """
+    Embed augmented copies of every catalog cover
+
+    Args:
+        cascade: Also embed the copies with MobileNet (cascade stage one)
+
+    Returns:
+        Dict with embeddings (Q, d), labels (book ids) and kinds (augmentation);
+        with cascade, also stage_one_embeddings and the seconds per image of
+        each model (clip_seconds, stage_one_seconds)
+    """
+    from utils.embedding_v2 import get_clip_embeddings_batch, initialize_clip_model
+
+    initialize_clip_model()
+    rng = np.random.default_rng(seed)
+    books = get_all_books_sync(db_path)
+    book_ids = sorted(books)
+    if max_books and len(book_ids) > max_books:
+        book_ids = sorted(rng.choice(book_ids, size=max_books, replace=False).tolist())
+
+    images, labels, kinds = [], [], []
+    for book_id in book_ids:
+        img = cv2.imread(books[book_id]['image'])
+        if img is None:
+            logger.warning(f"Cannot read cover of {book_id}: {books[book_id]['image']}")
+            continue
+        for kind in augmentations:
+            images.append(augment_cover(img, kind, rng))
+            labels.append(book_id)
+            kinds.append(kind)
+
+    logger.info(f"Embedding {len(images)} augmented covers of {len(book_ids)} books...")
+    start = time.perf_counter()
+    embeddings = np.vstack([
+        get_clip_embeddings_batch(images[i:i + batch_size])
+        for i in range(0, len(images), batch_size)
+    ]) if images else np.empty((0, 0), dtype=np.float32)
+    queries = {"embeddings": embeddings, "labels": np.array(labels), "kinds": np.array(kinds)}
+
+    if cascade and images:
+        queries["clip_seconds"] = np.array((time.perf_counter() - start) / len(images))
+        logger.info("Embedding them again with MobileNet for the cascade...")
+        start = time.perf_counter()
+        queries["stage_one_embeddings"] = mobilenet_embed_batch(images)
+        queries["stage_one_seconds"] = np.array((time.perf_counter() - start) / len(images))
+
+    return queries
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 4)
+
+
+def _timed_search(index: faiss.Index, block: np.ndarray, k: int) -> float:
+    start = time.perf_counter()
+    index.search(block, k)
+    return time.perf_counter() - start
+
+
+def evaluate_config(config: Dict, catalog: np.ndarray, row_ids: np.ndarray, queries: Dict,
+                    exact_indices: np.ndarray, threshold: float, k: int) -> Dict:
+    """Build one index configuration and score it against the query set"""
+    start = time.perf_counter()
+    index = build_index(
+        catalog, use_hnsw=config["use_hnsw"], num_shards=config["shards"], hnsw_min_size=0,
+        hnsw_m=config["hnsw_m"], ef_construction=config["ef_construction"], ef_search=config["ef_search"]
+    )
+    build_seconds = time.perf_counter() - start
+
+    block = np.ascontiguousarray(queries["embeddings"], dtype="float32")
+    for row in block[:10]:
+        index.search(row.reshape(1, -1), k)  # warm-up
+    latencies = []
+    for row in block:
+        t0 = time.perf_counter()
+        index.search(row.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - t0)
+    similarities, indices = index.search(block, k)
+
+    found_ids = np.where(indices >= 0, row_ids[np.clip(indices, 0, None)], None)
+    labels = queries["labels"]
+    top1_correct = found_ids[:, 0] == labels
+    accepted = similarities[:, 0] >= threshold
+
+    recall = np.mean([
+        len(set(indices[i]) & set(exact_indices[i])) / k for i in range(len(block))
+    ])
+
+    return {
+        "config": config["name"],
+        "index": describe_index(index),
+        "build_seconds": round(build_seconds, 3),
+        "memory_bytes": int(faiss.serialize_index(index).size) if config["shards"] == 1 else None,
+        "top1_accuracy": round(float(np.mean(top1_correct)), 4),
+        f"top{k}_accuracy": round(float(np.mean([labels[i] in found_ids[i] for i in range(len(block))])), 4),
+        f"recall@{k}_vs_exact": round(float(recall), 4),
+        "no_match_rate": round(float(np.mean(~accepted)), 4),
+        "false_accept_rate": round(float(np.mean(accepted & ~top1_correct)), 4),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "batch_qps": round(len(block) / max(_timed_search(index, block, k), 1e-9), 1)
+    }
+
+
+def threshold_sweep(similarities: np.ndarray, correct: np.ndarray, thresholds: List[float]) -> List[Dict]:
+    """No-match and false-accept rates of exact search at each threshold"""
+    sweep = []
+    for t in thresholds:
+        accepted = similarities >= t
+        sweep.append({
+            "threshold": t,
+            "no_match_rate": round(float(np.mean(~accepted)), 4),
+            "false_accept_rate": round(float(np.mean(accepted & ~correct)), 4),
+            "accepted_accuracy": round(float(np.mean(correct[accepted])), 4) if accepted.any() else None
+        })
+    return sweep
+
+
+def evaluate_cascade(args, queries: Dict, clip_top_ids: np.ndarray) -> List[Dict]:
+    """Sweep the cascade's stage-one thresholds against CLIP-only (exact search)"""
+    embeddings, book_ids, _ = load_cascade_embeddings(args.cascade)
+    stage_one = SearchService(build_index(embeddings, use_hnsw=False), book_ids, top_k=TOP_K_RESULTS)
+    block = np.ascontiguousarray(queries["stage_one_embeddings"], dtype="float32")
+    faiss.normalize_L2(block)
+    return cascade_sweep(
+        stage_one.search(block), clip_top_ids, queries["labels"],
+        [float(t) for t in args.cascade_similarities.split(",")],
+        [float(m) for m in args.cascade_margins.split(",")],
+        stage_one_cost=float(queries["stage_one_seconds"]),
+        clip_cost=float(queries["clip_seconds"])
+    )
+
+
+def print_cascade_sweep(sweep: List[Dict], max_accuracy_drop: float):
+    print(f"\nCascade (MobileNet -> CLIP), CLIP-only top-1 {sweep[0]['clip_top1_accuracy']:.3f}")
+    print(f"{'min sim':>8}{'margin':>8}{'accepted':>10}{'acc@accepted':>14}{'top1':>7}{'agree':>7}{'cpu':>7}")
+    for row in sweep:
+        accepted_accuracy = f"{row['accepted_accuracy']:.3f}" if row["accepted_accuracy"] is not None else "-"
+        print(f"{row['min_similarity']:>8.2f}{row['min_margin']:>8.2f}{row['acceptance_rate']:>10.3f}"
+              f"{accepted_accuracy:>14}{row['cascade_top1_accuracy']:>7.3f}{row['agreement_with_clip']:>7.3f}"
+              f"{row['relative_cpu']:>7.2f}")
+
+    eligible = [
+        row for row in sweep
+        if row["cascade_top1_accuracy"] >= row["clip_top1_accuracy"] - max_accuracy_drop
+    ]
+    if eligible:
+        best = min(eligible, key=lambda row: row["relative_cpu"])
+        print(f"\n✓ Cheapest cascade within {max_accuracy_drop:.1%} of CLIP-only top-1: "
+              f"CASCADE_MIN_SIMILARITY={best['min_similarity']}, CASCADE_MIN_MARGIN={best['min_margin']} "
+              f"({best['acceptance_rate']:.0%} answered by MobileNet, {best['relative_cpu']:.0%} of CLIP-only CPU)")
+    else:
+        print(f"\n✗ No cascade setting is within {max_accuracy_drop:.1%} of CLIP-only top-1 accuracy")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluate index configurations on the current catalog")
+    parser.add_argument("--db", default=DB_PATH, help=f"SQLite database (default: {DB_PATH})")
+    parser.add_argument("--embeddings", default="embeddings.npy", help="Catalog embeddings (default: embeddings.npy)")
+    parser.add_argument("--queries", help="Saved query set (.npz) instead of embedding augmented covers")
+    parser.add_argument("--save-queries", help="Save the generated query set (.npz) for later runs")
+    parser.add_argument("--augmentations", default=",".join(AUGMENTATIONS),
+                        help=f"Augmentations per cover (default: {','.join(AUGMENTATIONS)})")
+    parser.add_argument("--max-books", type=int, default=None, help="Only use covers of N random books")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="Index configurations to compare")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help=f"Confidence threshold (default: {CONFIDENCE_THRESHOLD})")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="Thresholds for the sweep")
+    parser.add_argument("--pad-to", type=int, default=0,
+                        help="Add random distractor vectors up to this catalog size")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.005,
+                        help="Top-1 accuracy a config may lose vs exact search (default: 0.005)")
+    parser.add_argument("--cascade", help="MobileNet vectors (.npz) to evaluate the MobileNet -> CLIP cascade with")
+    parser.add_argument("--cascade-similarities", default=DEFAULT_CASCADE_SIMILARITIES,
+                        help="Stage-one top-1 thresholds for the cascade sweep")
+    parser.add_argument("--cascade-margins", default=DEFAULT_CASCADE_MARGINS,
+                        help="Stage-one top-1 vs runner-up margins for the cascade sweep")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    k = TOP_K_RESULTS
+    catalog, book_ids = load_catalog(args.embeddings, args.db)
+
+    if args.queries:
+        data = np.load(args.queries, allow_pickle=False)
+        queries = {name: data[name] for name in data.files}
+        if args.cascade and "stage_one_embeddings" not in queries:
+            raise SystemExit(f"{args.queries} has no MobileNet embeddings; rebuild it with --cascade")
+    else:
+        queries = build_query_set(
+            args.db, args.augmentations.split(","), args.max_books, args.seed, cascade=bool(args.cascade)
+        )
+        if args.save_queries:
+            np.savez(args.save_queries, **queries)
+            logger.info(f"Query set saved to {args.save_queries}")
+    if not len(queries["labels"]):
+        raise SystemExit("Empty query set (no readable covers?)")
+    faiss.normalize_L2(queries["embeddings"])
+
+    row_ids = np.asarray(book_ids, dtype=object)
+    if args.pad_to > len(catalog):
+        extra = args.pad_to - len(catalog)
+        distractors = synthetic_catalog(extra, np.random.default_rng(args.seed), dim=catalog.shape[1])
+        catalog = np.vstack([catalog, distractors])
+        row_ids = np.concatenate([row_ids, np.array([f"DISTRACTOR{i}" for i in range(extra)], dtype=object)])
+        logger.info(f"Padded catalog with {extra} random distractors")
+
+    # Exact search is the reference for recall and the threshold sweep
+    exact = faiss.IndexFlatIP(catalog.shape[1])
+    exact.add(catalog)
+    exact_sims, exact_indices = exact.search(queries["embeddings"], k)
+    exact_correct = row_ids[exact_indices[:, 0]] == queries["labels"]
+
+    by_kind = {
+        kind: round(float(np.mean(exact_correct[queries["kinds"] == kind])), 4)
+        for kind in sorted(set(queries["kinds"].tolist()))
+    }
+
+    results = []
+    for config in parse_configs(args.configs):
+        logger.info(f"Evaluating {config['name']}...")
+        results.append(evaluate_config(
+            config, catalog, row_ids, queries, exact_indices, args.threshold, k
+        ))
+
+    thresholds = sorted({float(t) for t in args.thresholds.split(",")} | {args.threshold})
+    report = {
+        "catalog_size": len(catalog),
+        "books": len(book_ids),
+        "queries": int(len(queries["labels"])),
+        "threshold": args.threshold,
+        "exact_top1_accuracy_by_augmentation": by_kind,
+        "threshold_sweep": threshold_sweep(exact_sims[:, 0], exact_correct, thresholds),
+        "configs": results
+    }
+
+    if args.cascade:
+        report["cascade_sweep"] = evaluate_cascade(args, queries, row_ids[exact_indices[:, 0]])
+
+    exact_top1 = float(np.mean(exact_correct))
+    eligible = [r for r in results if r["top1_accuracy"] >= exact_top1 - args.max_accuracy_drop]
+    if eligible:
+        report["recommended"] = min(eligible, key=lambda r: r["p95_ms"])["config"]
+
+    print(f"\n{len(book_ids)} books ({len(catalog)} vectors), {report['queries']} queries, "
+          f"threshold {args.threshold}")
+    print(f"{'config':<26}{'top1':>7}{'top' + str(k):>7}{'recall':>8}{'no-match':>10}{'false-acc':>10}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}")
+    for r in results:
+        print(f"{r['config']:<26}{r['top1_accuracy']:>7.3f}{r[f'top{k}_accuracy']:>7.3f}"
+              f"{r[f'recall@{k}_vs_exact']:>8.3f}{r['no_match_rate']:>10.3f}{r['false_accept_rate']:>10.3f}"
+              f"{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['build_seconds']:>9.2f}")
+
+    print("\nExact top-1 accuracy by augmentation: " + ", ".join(f"{kind}={acc:.3f}" for kind, acc in by_kind.items()))
+    print(f"\n{'threshold':>10}{'no-match':>10}{'false-acc':>11}{'acc@accepted':>14}")
+    for row in report["threshold_sweep"]:
+        accepted_accuracy = f"{row['accepted_accuracy']:.3f}" if row["accepted_accuracy"] is not None else "-"
+        print(f"{row['threshold']:>10.2f}{row['no_match_rate']:>10.3f}{row['false_accept_rate']:>11.3f}{accepted_accuracy:>14}")
+
+    if "recommended" in report:
+        print(f"\n✓ Cheapest config within {args.max_accuracy_drop:.1%} of exact top-1: {report['recommended']}")
+    else:
+        print(f"\n✗ No config is within {args.max_accuracy_drop:.1%} of exact top-1 accuracy")
+
+    if args.cascade:
+        print_cascade_sweep(report["cascade_sweep"], args.max_accuracy_drop)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
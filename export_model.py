@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Export, inspect and verify the local CLIP model artifact
+Run export once on a machine with network access (or from a local checkpoint);
+initialize_clip_model then loads the vision tower offline from models/
+
+Usage:
+    python export_model.py export
+    python export_model.py export --source /mnt/usb/clip-vit-base-patch32
+    python export_model.py inspect
+    python export_model.py verify
+"""
+import sys
+import json
+import time
+import logging
+
+from utils.model_store import (
+    ModelStoreError,
+    export_vision_model,
+    load_vision_model,
+    read_manifest,
+    store_dir_for
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keep in sync with utils.embedding_v2.DEFAULT_CLIP_MODEL
+DEFAULT_MODEL_ID = "openai/clip-vit-base-patch32"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local CLIP model artifacts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write the vision tower to the model store")
+    export_parser.add_argument("--model-id", default=DEFAULT_MODEL_ID, help=f"Model to export (default: {DEFAULT_MODEL_ID})")
+    export_parser.add_argument("--source", default=None,
+                               help="Read the checkpoint from here instead of the hub (a local Hugging Face model dir)")
+    export_parser.add_argument("--output", default=None,
+                               help="Artifact directory (default: $BOOK_OCR_MODEL_DIR/<model> or models/<model>)")
+
+    for name, help_text in (("inspect", "Print an artifact's manifest"),
+                            ("verify", "Check checksums and load the model")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("store_dir", nargs="?", default=None,
+                         help="Artifact directory (default: the one initialize_clip_model uses)")
+        sub.add_argument("--model-id", default=DEFAULT_MODEL_ID, help=f"Model id (default: {DEFAULT_MODEL_ID})")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            manifest = export_vision_model(args.model_id, output_dir=args.output, source=args.source)
+            logger.info(f"✓ {manifest['model_id']}: {manifest['parameters']:,} parameters, "
+                        f"embedding_dim={manifest['embedding_dim']}")
+
+        elif args.command == "inspect":
+            print(json.dumps(read_manifest(args.store_dir or store_dir_for(args.model_id)), indent=2))
+
+        elif args.command == "verify":
+            store_dir = args.store_dir or store_dir_for(args.model_id)
+            start = time.perf_counter()
+            artifact = load_vision_model(store_dir, expected_model_id=args.model_id, reuse_verified=False)
+            logger.info(f"✓ Artifact OK: {artifact.manifest['model_id']} loaded from {store_dir} "
+                        f"in {time.perf_counter() - start:.2f}s")
+
+    except (ModelStoreError, OSError) as e:
+        logger.error(f"✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
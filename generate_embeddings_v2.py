@@ -6,7 +6,8 @@ Uses the new CLIP model and SQLite database
 import os
 import numpy as np
 from utils.embedding_v2 import initialize_clip_model, get_embedding
-from utils.database import get_all_books_sync, get_book_ids_sync, DB_PATH
+from utils.database import get_all_books_sync, get_book_ids_sync, initialize_database, DB_PATH
+from utils.cascade import DEFAULT_CASCADE_EMBEDDINGS, mobilenet_embed_batch, save_cascade_embeddings
 import cv2
 from pathlib import Path
 import logging
@@ -17,6 +18,7 @@ logger = logging.getLogger(__name__)
 
 BASE_PATH = Path(__file__).parent
 OUTPUT_EMBEDDINGS = BASE_PATH / "embeddings.npy"
+OUTPUT_CASCADE_EMBEDDINGS = BASE_PATH / DEFAULT_CASCADE_EMBEDDINGS
 
 
 def generate_embeddings(use_clip: bool = True):
@@ -34,6 +36,7 @@ def generate_embeddings(use_clip: bool = True):
         initialize_clip_model()
     
     # Load books from database
+    initialize_database(DB_PATH)
     books = get_all_books_sync(DB_PATH)
     book_ids = get_book_ids_sync(DB_PATH)
     
@@ -101,6 +104,34 @@ def generate_embeddings(use_clip: bool = True):
     logger.info("="*50)
 
 
+def generate_cascade_embeddings(output_path: Path = OUTPUT_CASCADE_EMBEDDINGS):
+    """
+    Generate MobileNet embeddings for the cascade's first stage
+    
+    Saved with their book ids (see utils.cascade), so covers that cannot
+    be read are simply left out of the stage-one index
+    """
+    initialize_database(DB_PATH)
+    books = get_all_books_sync(DB_PATH)
+    
+    embeddings, book_ids = [], []
+    for book_id in tqdm(get_book_ids_sync(DB_PATH), desc="Generating MobileNet embeddings"):
+        book_info = books.get(book_id)
+        img = cv2.imread(str(BASE_PATH / book_info["image"])) if book_info else None
+        if img is None:
+            logger.warning(f"Skipping {book_id}: cover not readable")
+            continue
+        embeddings.append(mobilenet_embed_batch([img]))
+        book_ids.append(book_id)
+    
+    if not embeddings:
+        logger.error("No MobileNet embeddings were generated!")
+        return
+    
+    save_cascade_embeddings(str(output_path), np.vstack(embeddings), book_ids)
+    logger.info(f"✓ Generated {len(book_ids)} MobileNet embeddings for the cascade → {output_path}")
+
+
 if __name__ == "__main__":
     import argparse
     
@@ -111,6 +142,11 @@ if __name__ == "__main__":
         default="clip",
         help="Model to use for embeddings (default: clip)"
     )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help=f"Also write MobileNet vectors for the two-stage cascade ({DEFAULT_CASCADE_EMBEDDINGS})"
+    )
     
     args = parser.parse_args()
     
@@ -118,4 +154,7 @@ if __name__ == "__main__":
     
     logger.info(f"Using model: {args.model.upper()}")
     generate_embeddings(use_clip=use_clip)
+    
+    if args.cascade:
+        generate_cascade_embeddings()
 
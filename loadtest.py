@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+HTTP load generator for the recognition service
+Drives /recognize, /recognize_batch and /books at a fixed request rate (open
+loop) or a fixed concurrency (closed loop), against a running server or an
+in-process app instance, and reports throughput, errors and latency over time
+
+Usage:
+    python loadtest.py --url http://localhost:8000 --rate 5 --duration 60
+    python loadtest.py --url http://localhost:8000 --concurrency 4 --mix recognize=8,books=2
+    python loadtest.py --in-process --offline-model --concurrency 2 --duration 20
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import numpy as np
+import httpx
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ("recognize", "recognize_batch", "books")
+DEFAULT_MIX = "recognize=1"
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse `recognize=8,books=2` into endpoint weights"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def load_image_pool(images_dir: Optional[str], synthetic: int, seed: int) -> List[Tuple[str, bytes]]:
+    """
+    Sample images as (filename, JPEG bytes)
+
+    Repeated images are answered from the server's embedding cache, so use
+    more distinct images (or --synthetic) to measure uncached inference.
+    """
+    pool = []
+    if images_dir:
+        for path in sorted(Path(images_dir).iterdir()):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                pool.append((path.name, path.read_bytes()))
+    if synthetic:
+        from utils.synthetic import encode_jpeg, synthetic_cover
+        rng = np.random.default_rng(seed)
+        pool += [(f"synthetic_{i:05d}.jpg", encode_jpeg(synthetic_cover(rng))) for i in range(synthetic)]
+    return pool
+
+
+class Recorder:
+    """Per-request outcomes, reported in fixed time windows and overall"""
+
+    def __init__(self):
+        self.records: List[Tuple[float, str, float, str]] = []  # (finished_at, endpoint, latency, outcome)
+
+    def add(self, endpoint: str, latency: float, outcome: str):
+        self.records.append((time.perf_counter(), endpoint, latency, outcome))
+
+    @staticmethod
+    def summarize(records: List[Tuple], elapsed: float) -> Dict:
+        latencies = np.array([r[2] for r in records if r[3] == "ok"], dtype=np.float64) * 1000
+        outcomes: Dict[str, int] = {}
+        for r in records:
+            outcomes[r[3]] = outcomes.get(r[3], 0) + 1
+        total = len(records)
+        return {
+            "requests": total,
+            "throughput_per_s": round(total / elapsed, 2) if elapsed else None,
+            "ok_per_s": round(outcomes.get("ok", 0) / elapsed, 2) if elapsed else None,
+            "error_rate": round(1 - outcomes.get("ok", 0) / total, 4) if total else 0.0,
+            "outcomes": outcomes,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies.size else None,
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2) if latencies.size else None,
+            "max_ms": round(float(latencies.max()), 2) if latencies.size else None
+        }
+
+    def window(self, start: float, end: float) -> Dict:
+        return self.summarize([r for r in self.records if start <= r[0] < end], end - start)
+
+
+class LoadGenerator:
+    """Issues weighted requests against an httpx client"""
+
+    def __init__(self, client: httpx.AsyncClient, pool: List[Tuple[str, bytes]],
+                 mix: Dict[str, float], batch_size: int, headers: Dict[str, str],
+                 recorder: Recorder, seed: int):
+        self.client = client
+        self.pool = pool
+        self.endpoints = list(mix)
+        self.weights = list(mix.values())
+        self.batch_size = batch_size
+        self.headers = headers
+        self.recorder = recorder
+        self.random = random.Random(seed)
+
+    async def one_request(self, scheduled_at: Optional[float] = None):
+        """
+        Send one request and record its latency
+
+        Args:
+            scheduled_at: Intended send time (open loop). Latency is measured
+                from it, so client-side queueing is not hidden (coordinated omission)
+        """
+        endpoint = self.random.choices(self.endpoints, self.weights)[0]
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        try:
+            if endpoint == "recognize":
+                name, data = self.random.choice(self.pool)
+                response = await self.client.post(
+                    "/recognize", files={"file": (name, data, "image/jpeg")}, headers=self.headers
+                )
+            elif endpoint == "recognize_batch":
+                files = [("files", (name, data, "image/jpeg"))
+                         for name, data in self.random.choices(self.pool, k=self.batch_size)]
+                response = await self.client.post("/recognize_batch", files=files, headers=self.headers)
+            else:
+                response = await self.client.get(
+                    "/books", params={"limit": 20, "offset": self.random.randint(0, 100)}
+                )
+            outcome = "ok" if response.status_code < 400 else str(response.status_code)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        self.recorder.add(endpoint, time.perf_counter() - start, outcome)
+
+    async def run_rate(self, rate: float, duration: float, poisson: bool, max_outstanding: int):
+        """Open loop: start requests on a fixed schedule regardless of responses"""
+        outstanding = set()
+        start = time.perf_counter()
+        next_at = start
+        while next_at - start < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(outstanding) >= max_outstanding:
+                # Client-side overload: count it instead of silently slowing down
+                self.recorder.add("dropped", 0.0, "client_dropped")
+            else:
+                task = asyncio.create_task(self.one_request(scheduled_at=next_at))
+                outstanding.add(task)
+                task.add_done_callback(outstanding.discard)
+            next_at += self.random.expovariate(rate) if poisson else 1.0 / rate
+        if outstanding:
+            await asyncio.wait(outstanding)
+
+    async def run_concurrency(self, concurrency: int, duration: float):
+        """Closed loop: N workers each send the next request when the last one finishes"""
+        end = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < end:
+                await self.one_request()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def report_progress(recorder: Recorder, start: float, interval: float, timeline: List[Dict]):
+    """Print one line per interval and keep the windows for the JSON report"""
+    window_start = start
+    while True:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        stats = recorder.window(window_start, now)
+        stats["t"] = round(now - start, 1)
+        timeline.append(stats)
+        logger.info(
+            f"[{stats['t']:>6.1f}s] {stats['throughput_per_s'] or 0:>7.2f} req/s  "
+            f"err {stats['error_rate']:>6.1%}  p50 {stats['p50_ms'] or 0:>8.1f}ms  "
+            f"p95 {stats['p95_ms'] or 0:>8.1f}ms  p99 {stats['p99_ms'] or 0:>8.1f}ms"
+        )
+        window_start = now
+
+
+async def run(args) -> Dict:
+    pool = load_image_pool(args.images, args.synthetic, args.seed)
+    mix = parse_mix(args.mix)
+    if not pool and ({"recognize", "recognize_batch"} & set(mix)):
+        raise SystemExit("No sample images: pass --images DIR and/or --synthetic N")
+
+    headers = {"X-Priority": args.priority} if args.priority else {}
+    limits = httpx.Limits(max_connections=max(args.concurrency or 0, args.max_outstanding))
+    recorder = Recorder()
+    timeline: List[Dict] = []
+
+    if args.in_process:
+        import app_v2
+        if args.offline_model:
+            from utils.embedding_v2 import initialize_offline_clip_model
+            app_v2.initialize_clip_model = lambda *a, **kw: initialize_offline_clip_model()
+        lifespan = app_v2.app.router.lifespan_context(app_v2.app)
+        transport = httpx.ASGITransport(app=app_v2.app)
+        base_url = "http://in-process"
+    else:
+        lifespan = None
+        transport = None
+        base_url = args.url
+
+    async def drive():
+        async with httpx.AsyncClient(base_url=base_url, transport=transport,
+                                     timeout=args.timeout, limits=limits) as client:
+            generator = LoadGenerator(client, pool, mix, args.batch_size, headers, recorder, args.seed)
+            start = time.perf_counter()
+            progress = asyncio.create_task(report_progress(recorder, start, args.report_interval, timeline))
+            try:
+                if args.rate:
+                    await generator.run_rate(args.rate, args.duration, args.poisson, args.max_outstanding)
+                else:
+                    await generator.run_concurrency(args.concurrency, args.duration)
+            finally:
+                progress.cancel()
+            return time.perf_counter() - start
+
+    if lifespan is not None:
+        async with lifespan:
+            elapsed = await drive()
+    else:
+        elapsed = await drive()
+
+    by_endpoint = {}
+    for endpoint in set(r[1] for r in recorder.records):
+        by_endpoint[endpoint] = Recorder.summarize([r for r in recorder.records if r[1] == endpoint], elapsed)
+
+    return {
+        "target": "in-process" if args.in_process else args.url,
+        "mode": {"rate": args.rate, "poisson": args.poisson} if args.rate else {"concurrency": args.concurrency},
+        "mix": mix,
+        "duration_s": round(elapsed, 2),
+        "images": len(pool),
+        "overall": Recorder.summarize(recorder.records, elapsed),
+        "endpoints": by_endpoint,
+        "timeline": timeline
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test the recognition service")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+    target.add_argument("--in-process", action="store_true", help="Drive app_v2.app in this process (no server)")
+    parser.add_argument("--offline-model", action="store_true",
+                        help="With --in-process: random-weight CLIP, no download")
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rate", type=float, help="Requests per second (open loop)")
+    mode.add_argument("--concurrency", type=int, default=None, help="Concurrent clients (closed loop, default 4)")
+    parser.add_argument("--poisson", action="store_true", help="With --rate: exponential inter-arrival times")
+    parser.add_argument("--max-outstanding", type=int, default=256,
+                        help="With --rate: requests in flight before new ones are dropped (default: 256)")
+
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run (default: 30)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--images", default=None, help="Directory of sample images (e.g. covers/)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Add N synthetic covers to the pool")
+    parser.add_argument("--batch-size", type=int, default=8, help="Files per /recognize_batch request (default: 8)")
+    parser.add_argument("--priority", choices=["interactive", "bulk"], help="Send X-Priority")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (default: 60)")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="Seconds per progress line (default: 5)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the full report (with timeline) as JSON")
+    args = parser.parse_args()
+
+    if not args.rate and not args.concurrency:
+        args.concurrency = 4
+    if args.images is None and not args.synthetic and Path("covers").exists():
+        args.images = "covers"
+
+    report = asyncio.run(run(args))
+
+    overall = report["overall"]
+    print(f"\n{report['overall']['requests']} requests in {report['duration_s']}s "
+          f"({overall['throughput_per_s']} req/s, {overall['ok_per_s']} ok/s), "
+          f"error rate {overall['error_rate']:.1%}")
+    print(f"{'endpoint':<18}{'requests':>10}{'req/s':>9}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in sorted(report["endpoints"].items()):
+        print(f"{endpoint:<18}{stats['requests']:>10}{stats['throughput_per_s'] or 0:>9.2f}"
+              f"{stats['error_rate']:>9.1%}{stats['p50_ms'] or 0:>10.1f}{stats['p95_ms'] or 0:>10.1f}"
+              f"{stats['p99_ms'] or 0:>10.1f}")
+    if overall["outcomes"]:
+        print("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(overall["outcomes"].items())))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.output}")
+
+    sys.exit(0 if overall["requests"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Shared inference server: one process holds CLIP and batches for all workers
+HTTP workers started with BOOK_OCR_INFERENCE_SOCKET set send it their
+preprocessed images instead of loading a model of their own
+
+Usage:
+    python serve_inference.py --socket /run/book-ocr-inference/inference.sock
+    BOOK_OCR_INFERENCE_SOCKET=/run/book-ocr-inference/inference.sock python serve_prefork.py --workers 4
+"""
+import os
+import asyncio
+import signal
+import logging
+
+import torch
+
+from utils import embedding_v2
+from utils.inference import DEFAULT_MAX_BATCH, DEFAULT_MAX_WAIT_MS, InferenceServer
+from utils.shm_slab import DEFAULT_SLOTS, TensorSlab
+from utils.runtime import ThreadConfig, apply_thread_config, available_cpus, parse_cpu_list
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("inference")
+
+DEFAULT_SOCKET = "/run/book-ocr-inference/inference.sock"
+
+
+async def run_until_signalled(server: InferenceServer):
+    """Serve until SIGTERM/SIGINT, then close the socket cleanly"""
+    task = asyncio.create_task(server.serve())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve CLIP forward passes to app_v2 workers over a Unix socket")
+    parser.add_argument("--socket", default=os.environ.get("BOOK_OCR_INFERENCE_SOCKET", DEFAULT_SOCKET),
+                        help=f"Unix socket path (default: $BOOK_OCR_INFERENCE_SOCKET or {DEFAULT_SOCKET})")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help=f"Images per forward pass (default: {DEFAULT_MAX_BATCH})")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help=f"How long a request waits for others to batch with (default: {DEFAULT_MAX_WAIT_MS:g})")
+    parser.add_argument("--slab-slots", type=int, default=DEFAULT_SLOTS,
+                        help=f"Shared-memory input slots for zero-copy handoff, 0 = send pixels over the socket "
+                             f"(default: {DEFAULT_SLOTS})")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch intra-op threads (default: all CPUs it may run on)")
+    parser.add_argument("--cpu-affinity", default=None, help="Pin to a CPU list such as 2-3")
+    parser.add_argument("--offline-model", action="store_true",
+                        help="Randomly initialized CLIP (no download; for load tests)")
+    args = parser.parse_args()
+
+    affinity = parse_cpu_list(args.cpu_affinity) if args.cpu_affinity else None
+    threads = args.threads or len(affinity or available_cpus())
+    apply_thread_config(ThreadConfig(
+        torch_threads=threads, torch_interop_threads=1, faiss_threads=1, opencv_threads=1,
+        cpu_affinity=affinity
+    ))
+    if args.offline_model:
+        embedding_v2.initialize_offline_clip_model()
+    else:
+        embedding_v2.initialize_clip_model()
+
+    # One pass up front so the first request does not pay for lazy initialization
+    embedding_v2.embed_pixels(torch.zeros((1, 3, 224, 224)).numpy())
+    logger.info(f"CLIP ready with {threads} threads")
+
+    socket_dir = os.path.dirname(args.socket)
+    if socket_dir:
+        os.makedirs(socket_dir, exist_ok=True)
+
+    # Named per server process, so workers notice a restart and re-attach
+    slab = None
+    if args.slab_slots > 0:
+        slab = TensorSlab.create(
+            f"book-ocr-slab-{os.getpid()}", args.slab_slots, lock_path=f"{args.socket}.slab.lock"
+        )
+
+    server = InferenceServer(
+        args.socket, embedding_v2.embed_pixels,
+        max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, slab=slab
+    )
+    try:
+        asyncio.run(run_until_signalled(server))
+        logger.info(f"Inference server stopped: {server.stats()}")
+    finally:
+        if slab is not None:
+            slab.close(unlink=True)
+
+
+if __name__ == "__main__":
+    main()
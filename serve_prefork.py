@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Pre-fork launcher: load CLIP and the catalog index once, then fork workers
+Workers share the model weights and index pages copy-on-write instead of
+each loading their own copy (as `uvicorn --workers N` does)
+
+Usage:
+    python serve_prefork.py --workers 2 --host 0.0.0.0 --port 8000
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+
+from utils.runtime import SINGLE_THREADED, ThreadConfig, apply_thread_config, available_cpus, parse_cpu_list, split_cpus
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("prefork")
+
+RESTART_DELAY = 1.0  # Seconds before replacing a worker that died
+MAX_FAST_FAILURES = 5  # Give up after this many workers in a row die within FAST_FAILURE_WINDOW of starting
+FAST_FAILURE_WINDOW = 10.0
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Listening socket created by the master and inherited by every worker"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def worker_thread_config(args, index: int) -> ThreadConfig:
+    """Thread budget and CPU pinning for worker `index`"""
+    if args.cpu_affinity == "auto":
+        affinity = split_cpus(available_cpus(), args.workers, index)
+    elif args.cpu_affinity:
+        affinity = parse_cpu_list(args.cpu_affinity)
+    else:
+        affinity = None
+    return ThreadConfig(
+        torch_threads=args.torch_threads,
+        torch_interop_threads=1,
+        faiss_threads=args.faiss_threads,
+        opencv_threads=args.opencv_threads,
+        onnx_threads=args.torch_threads,
+        cpu_affinity=affinity
+    )
+
+
+def run_worker(sock: socket.socket, args, index: int):
+    """Child process: serve HTTP on the inherited socket until told to stop"""
+    import uvicorn
+    import app_v2
+
+    # Default signal handling; uvicorn installs its own graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+
+    # Marks the process as configured, so app startup keeps these settings
+    apply_thread_config(worker_thread_config(args, index))
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving")
+
+    config = uvicorn.Config(app_v2.app, log_level=args.log_level, access_log=not args.no_access_log)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+class Master:
+    """Load once, fork workers, replace crashed workers, forward shutdown signals"""
+
+    def __init__(self, sock: socket.socket, args):
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> (worker index, start time)
+        self.stopping = False
+        self.fast_failures = 0  # Consecutive worker deaths right after start
+
+    def record_exit(self, uptime: float) -> bool:
+        """
+        Count a worker death; True when workers are crash-looping
+
+        A worker that ran past FAST_FAILURE_WINDOW proves the service can
+        start, so it resets the count: occasional crashes days apart never
+        add up to a shutdown.
+        """
+        if uptime >= FAST_FAILURE_WINDOW:
+            self.fast_failures = 0
+            return False
+        self.fast_failures += 1
+        return self.fast_failures >= MAX_FAST_FAILURES
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.args, index)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                # Never fall back into the master's loop
+                os._exit(code)
+        self.workers[pid] = (index, time.monotonic())
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            logger.info(f"Received signal {signum}; stopping {len(self.workers)} workers")
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = self.workers.pop(pid, (None, None))
+            if index is None or self.stopping:
+                continue
+
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+            if self.record_exit(time.monotonic() - started):
+                logger.error("Workers keep dying right after start; shutting down")
+                self.stop(signal.SIGTERM, None)
+                continue
+            time.sleep(RESTART_DELAY)
+            self.spawn(index)
+
+        logger.info("All workers stopped")
+
+
+def main():
+    import argparse
+
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser(description="Serve app_v2 with a pre-forked, shared model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes (default: 2)")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="torch intra-op threads per worker (default: CPUs / workers)")
+    parser.add_argument("--faiss-threads", type=int, default=1, help="FAISS OpenMP threads per worker (default: 1)")
+    parser.add_argument("--opencv-threads", type=int, default=1, help="OpenCV threads per worker (default: 1)")
+    parser.add_argument("--cpu-affinity", default=None,
+                        help="Pin workers: 'auto' = disjoint share of the CPUs each, or a CPU list like 0-3 for all")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+
+    if args.torch_threads is None:
+        args.torch_threads = max(1, cpus // args.workers)
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port}; loading model and catalog once...")
+
+    # Objects created while loading are frozen below so workers' garbage
+    # collections do not write to (and un-share) their pages
+    # GNU OpenMP pools do not survive fork(): a child inheriting a started
+    # pool can deadlock. With one thread the master never starts one, and
+    # workers size their own pools after forking.
+    gc.disable()
+    apply_thread_config(SINGLE_THREADED)
+
+    import app_v2
+    start = time.perf_counter()
+    app_v2.load_model_and_catalog()
+    logger.info(f"Model and catalog loaded in {time.perf_counter() - start:.1f}s; forking {args.workers} workers")
+
+    gc.collect()
+    gc.freeze()
+
+    Master(sock, args).run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Export, inspect and verify catalog snapshot bundles
+A new node started with BOOK_OCR_SNAPSHOT=<bundle> is ready without re-embedding covers
+
+Usage:
+    python snapshot.py export catalog.snapshot
+    python snapshot.py inspect catalog.snapshot
+    python snapshot.py verify catalog.snapshot
+"""
+import sys
+import json
+import logging
+
+from utils.database import DB_PATH
+from utils.embedding_v2 import DEFAULT_CLIP_MODEL
+from utils.snapshot import SnapshotError, export_snapshot, load_snapshot, read_manifest
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Catalog snapshot bundles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write a snapshot of the local catalog")
+    export_parser.add_argument("output", help="Bundle file to create")
+    export_parser.add_argument("--db", default=DB_PATH, help=f"SQLite database (default: {DB_PATH})")
+    export_parser.add_argument("--embeddings", default="embeddings.npy", help="Embeddings file (default: embeddings.npy)")
+    export_parser.add_argument("--model-id", default=DEFAULT_CLIP_MODEL, help="Model the embeddings were made with")
+    export_parser.add_argument("--flat", action="store_true", help="Serialize an exact flat index instead of HNSW")
+
+    inspect_parser = subparsers.add_parser("inspect", help="Print a bundle's manifest")
+    inspect_parser.add_argument("bundle")
+
+    verify_parser = subparsers.add_parser("verify", help="Check checksums and load the index")
+    verify_parser.add_argument("bundle")
+    verify_parser.add_argument("--model-id", default=None, help="Also require this model id")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            manifest = export_snapshot(
+                args.output,
+                model_id=args.model_id,
+                db_path=args.db,
+                embeddings_path=args.embeddings,
+                use_hnsw=not args.flat
+            )
+            logger.info(f"✓ {manifest['count']} books, dim={manifest['embedding_dim']}, "
+                        f"index={manifest['index']['type']}, change_seq={manifest['change_seq']}")
+
+        elif args.command == "inspect":
+            print(json.dumps(read_manifest(args.bundle), indent=2))
+
+        elif args.command == "verify":
+            snapshot = load_snapshot(args.bundle, expected_model_id=args.model_id)
+            logger.info(f"✓ Snapshot OK: {snapshot.manifest['count']} books, "
+                        f"index holds {snapshot.index.ntotal} vectors")
+
+    except (SnapshotError, FileNotFoundError) as e:
+        logger.error(f"✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import requests
 import json
 import time
 from pathlib import Path
+from typing import Optional
 import sys
 
 # Color codes for output
@@ -45,6 +46,960 @@ def print_info(message: str):
     print(f"  {YELLOW}ℹ{RESET} {message}")
 
 
+def check(condition: bool, message: str, failure: Optional[str] = None) -> bool:
+    """Record one unit-test assertion"""
+    if condition:
+        print_pass(message)
+    else:
+        print_fail(failure or message)
+    return condition
+
+
+# ---------------------------------------------------------------------------
+# Unit tests: exercise utils/ and app_v2 logic in-process, no server needed
+# ---------------------------------------------------------------------------
+
+def test_confidence_buckets():
+    """Test that the vectorized confidence buckets match the old per-candidate thresholds"""
+    print_test("Confidence Buckets (unit)")
+    
+    import numpy as np
+    from utils.search import confidence_buckets
+    
+    threshold = 0.65
+    
+    def per_candidate(similarity):
+        # The if/elif chain compute_confidence_score used before batching
+        if similarity >= 0.85:
+            return "very_high", "excellent"
+        elif similarity >= 0.75:
+            return "high", "good"
+        elif similarity >= threshold:
+            return "medium", "acceptable"
+        return "low", "poor"
+    
+    boundaries = [threshold, 0.75, 0.85]
+    table = [-1.0, 0.0, 0.5, 0.8, 0.95, 1.0]
+    for bound in boundaries:
+        table += [np.nextafter(bound, -np.inf), bound, np.nextafter(bound, np.inf)]
+    
+    for dtype in ("float64", "float32"):
+        similarities = np.array(table, dtype=dtype).reshape(-1, 3)  # (queries, k) like a batch
+        confidence, quality = confidence_buckets(similarities, threshold)
+        wrong = [
+            (float(value), (str(c), str(q)), per_candidate(value))
+            for value, c, q in zip(similarities.ravel(), confidence.ravel(), quality.ravel())
+            if (str(c), str(q)) != per_candidate(value)
+        ]
+        check(confidence.shape == similarities.shape and not wrong,
+              f"{dtype}: {similarities.size} scores bucketed like the per-candidate thresholds",
+              f"{dtype}: mismatches (value, got, expected): {wrong}")
+    
+    exact = {bound: tuple(str(label) for label in confidence_buckets(np.asarray(bound), threshold))
+             for bound in boundaries}
+    check(exact == {threshold: ("medium", "acceptable"), 0.75: ("high", "good"), 0.85: ("very_high", "excellent")},
+          "A score equal to a boundary falls in the higher bucket", f"Boundary buckets: {exact}")
+
+
+def test_sharded_search():
+    """Test that a sharded flat index answers like the unsharded one"""
+    print_test("Sharded Index Search (unit)")
+    
+    import numpy as np
+    from utils.search import SearchService, build_index, describe_index
+    
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((500, 32)).astype("float32")
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    book_ids = [f"B{i:04d}" for i in range(len(embeddings))]
+    queries = embeddings[rng.choice(len(embeddings), 20, replace=False)] + 0.05 * rng.standard_normal((20, 32)).astype("float32")
+    
+    single = SearchService(build_index(embeddings, use_hnsw=False), book_ids)
+    sharded_index = build_index(embeddings, use_hnsw=False, num_shards=4)
+    sharded = SearchService(sharded_index, book_ids)
+    
+    layout = describe_index(sharded_index)
+    check(layout["shards"] == 4 and sum(layout["shard_sizes"]) == len(embeddings),
+          f"4 shards covering all {len(embeddings)} vectors", f"Unexpected shard layout: {layout}")
+    
+    expected, actual = single.search(queries), sharded.search(queries)
+    check((expected.book_ids == actual.book_ids).all(), "Same top-k books as the unsharded index",
+          "Sharded search returned different books")
+    check(np.allclose(expected.similarities, actual.similarities, atol=1e-5), "Same similarities as the unsharded index",
+          "Sharded search returned different similarities")
+    
+    tiny = build_index(embeddings[:3], use_hnsw=False, num_shards=8)
+    check(describe_index(tiny)["shards"] == 3, "Shard count is capped at the catalog size",
+          f"Expected 3 shards for 3 vectors, got {describe_index(tiny)['shards']}")
+
+
+def _change(seq: int, op: str, book_id: str, embedding=None) -> dict:
+    """A catalog change log entry as the leader serves it"""
+    payload = {"title": book_id, "author": "Test", "image_path": ""} if op == "add" else None
+    return {"seq": seq, "op": op, "book_id": book_id, "payload": payload,
+            "embedding": embedding, "created_at": None}
+
+
+def test_replication_apply():
+    """Test that only one worker per node applies replicated changes"""
+    print_test("Replication Apply Path (unit)")
+    
+    import asyncio
+    import os
+    import tempfile
+    import numpy as np
+    from utils.database import apply_changes_sync, get_book_ids_sync, initialize_database
+    from utils.replication import ApplierLock, ChangeLogFollower, FileChangeLogTransport
+    
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        leader_db, node_db = os.path.join(tmp, "leader.db"), os.path.join(tmp, "node.db")
+        initialize_database(leader_db)
+        initialize_database(node_db)
+        apply_changes_sync([
+            _change(seq, "add", f"B{seq}", rng.standard_normal(8).astype("float32"))
+            for seq in (1, 2, 3)
+        ], leader_db)
+        
+        calls = []
+        
+        def worker(name: str) -> ChangeLogFollower:
+            async def on_applied(changes, persist):
+                calls.append((name, len(changes), persist))
+            
+            return ChangeLogFollower(
+                FileChangeLogTransport(leader_db),
+                on_applied=on_applied,
+                db_path=node_db,
+                lock=ApplierLock(node_db + ".replica.lock")
+            )
+        
+        async def scenario():
+            first, second = worker("first"), worker("second")
+            await first.poll_once()
+            await second.poll_once()
+            check(first.applies and not second.applies, "Exactly one worker applies changes",
+                  f"applies: first={first.applies}, second={second.applies}")
+            check(calls == [("first", 3, True), ("second", 3, False)],
+                  "Other worker reloads the same changes without persisting", f"Callbacks: {calls}")
+            check(get_book_ids_sync(node_db) == ["B1", "B2", "B3"], "Changes written to the node database once",
+                  f"Node books: {get_book_ids_sync(node_db)}")
+            
+            # The applying worker exits: the other one takes over from its position
+            first.lock.release()
+            apply_changes_sync([_change(4, "delete", "B1")], leader_db)
+            await second.poll_once()
+            check(second.applies and second.position == 4 and get_book_ids_sync(node_db) == ["B2", "B3"],
+                  "Second worker takes over when the lock is free",
+                  f"applies={second.applies}, position={second.position}, books={get_book_ids_sync(node_db)}")
+            second.lock.release()
+        
+        asyncio.run(scenario())
+
+
+def test_replicated_delete_of_last_book():
+    """Test that deleting the last book leaves nothing matchable"""
+    print_test("Replicated Delete of the Last Book (unit)")
+    
+    import asyncio
+    import os
+    import tempfile
+    import numpy as np
+    import app_v2
+    
+    embeddings = np.eye(2, 8, dtype="float32")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            app_v2.set_catalog_index(embeddings, ["B0", "B1"])
+            asyncio.run(app_v2.apply_catalog_changes([_change(1, "delete", "B0"), _change(2, "delete", "B1")]))
+            check(app_v2.search_service is None and app_v2.faiss_index is None,
+                  "Index cleared", "Deleted books are still in the live index")
+            saved = np.load("embeddings.npy")
+            check(saved.shape == (0, 8), "Empty embeddings.npy saved", f"embeddings.npy has shape {saved.shape}")
+            
+            app_v2.load_embeddings_and_index()
+            check(app_v2.search_service is None, "Empty embeddings.npy loads as an empty catalog",
+                  "Empty embeddings.npy produced an index")
+            
+            os.remove("embeddings.npy")
+            app_v2.set_catalog_index(embeddings, ["B0", "B1"])
+            asyncio.run(app_v2.apply_catalog_changes([_change(3, "delete", "B0")], persist=False))
+            check(app_v2.book_ids_list == ["B1"] and not os.path.exists("embeddings.npy"),
+                  "Non-applying workers update the index without writing embeddings.npy",
+                  f"books={app_v2.book_ids_list}, file written={os.path.exists('embeddings.npy')}")
+            
+            # Appends extend a copy: the index being served is never modified
+            live = app_v2.faiss_index
+            asyncio.run(app_v2.apply_catalog_changes([_change(4, "add", "B2", np.ones(8, dtype="float32"))],
+                                                     persist=False))
+            check(live.ntotal == 1 and app_v2.faiss_index.ntotal == 2 and app_v2.book_ids_list == ["B1", "B2"],
+                  "Appended books go into a copy of the live index",
+                  f"live index {live.ntotal} rows, new index {app_v2.faiss_index.ntotal}, books={app_v2.book_ids_list}")
+        finally:
+            app_v2.clear_catalog_index()
+            os.chdir(cwd)
+
+
+def test_admission_shedding():
+    """Test that admission control sheds and abandons work it cannot serve"""
+    print_test("Admission Control and Shedding (unit)")
+    
+    import asyncio
+    from utils.admission import AdmissionController, Overloaded, RequestCancelled, RequestContext
+    
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=2, default_timeout=60.0)
+        holder = controller.new_context()
+        await controller.acquire(holder)
+        
+        waiting = [controller.new_context() for _ in range(2)]
+        tasks = [asyncio.create_task(controller.acquire(ctx)) for ctx in waiting]
+        await asyncio.sleep(0)
+        check(controller.queue_depth == 2, "Requests queue while the slot is busy",
+              f"Queue depth {controller.queue_depth}")
+        
+        try:
+            await controller.acquire(controller.new_context())
+            print_fail("Request beyond max_queue was admitted")
+        except Overloaded as e:
+            check(e.reason == "queue_full" and e.retry_after >= 1, "Full queue sheds with a Retry-After hint",
+                  f"Shed as {e.reason}, retry_after={e.retry_after}")
+        
+        waiting[0].cancel(RequestContext.DISCONNECTED)
+        try:
+            await tasks[0]
+            print_fail("Disconnected request kept its place in the queue")
+        except RequestCancelled:
+            check(controller.abandoned_in_queue == 1, "Disconnected request leaves the queue",
+                  f"abandoned_in_queue={controller.abandoned_in_queue}")
+        
+        controller.service_time = 30.0
+        try:
+            await controller.acquire(controller.new_context(timeout_ms=100))
+            print_fail("Request that cannot meet its deadline was queued")
+        except Overloaded as e:
+            check(e.reason == "deadline", "Request that cannot meet its deadline is shed up front",
+                  f"Shed as {e.reason}")
+        
+        controller.release(0.01)
+        await tasks[1]
+        check(controller.in_flight == 1 and controller.queue_depth == 0,
+              "Freed slot goes to the next live waiter",
+              f"in_flight={controller.in_flight}, queue_depth={controller.queue_depth}")
+        controller.release(0.01)
+        check(controller.in_flight == 0, "Slot freed when nobody waits", f"in_flight={controller.in_flight}")
+    
+    asyncio.run(scenario())
+
+
+def test_priority_lanes():
+    """Test that interactive requests go first while bulk keeps its minimum share"""
+    print_test("Priority Lanes (unit)")
+    
+    import asyncio
+    from utils.admission import AdmissionController, BULK, INTERACTIVE, parse_priority
+    
+    check(parse_priority(" Bulk ") == BULK and parse_priority("urgent") == INTERACTIVE
+          and parse_priority(None, BULK) == BULK, "X-Priority values parsed, unknown ones use the default",
+          "X-Priority parsing is wrong")
+    
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=8, default_timeout=60.0, bulk_min_share=0.25)
+        holder = controller.new_context()
+        await controller.acquire(holder)
+        order = []
+        
+        async def request(name: str, priority: str):
+            async with controller.slot(controller.new_context(priority)):
+                order.append(name)
+        
+        # Bulk queued first, interactive after it
+        tasks = [asyncio.create_task(request(f"b{i}", BULK)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request(f"i{i}", INTERACTIVE)) for i in range(4)]
+        await asyncio.sleep(0)
+        controller.release(0.01)
+        await asyncio.gather(*tasks)
+        return order
+    
+    order = asyncio.run(scenario())
+    # One grant in four goes to bulk while both lanes wait (bulk_min_share=0.25)
+    expected = ["i0", "i1", "i2", "b0", "i3", "b1", "b2", "b3"]
+    check(order == expected, f"Grant order {order}", f"Expected grant order {expected}, got {order}")
+    check(order[0].startswith("i") and order.index("b0") < order.index("i3"),
+          "Interactive overtakes queued bulk, bulk is not starved", "Lane scheduling is wrong")
+
+
+def test_server_timing():
+    """Test that stage spans, including executor threads, end up in Server-Timing"""
+    print_test("Server-Timing Header (unit)")
+    
+    import asyncio
+    import time as _time
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+    from utils.timing import ServerTimingMiddleware, bind_context, span
+    
+    def forward():
+        with span("forward"):
+            _time.sleep(0.01)
+    
+    async def recognize(request):
+        for _ in range(2):
+            with span("decode"):
+                _time.sleep(0.005)
+        await asyncio.get_running_loop().run_in_executor(None, bind_context(forward))
+        return PlainTextResponse("ok")
+    
+    finished = []
+    app = Starlette(routes=[Route("/recognize", recognize, methods=["POST"]), Route("/books", recognize)])
+    app.add_middleware(ServerTimingMiddleware, paths=["/recognize"],
+                       on_finish=lambda scope, status, timer: finished.append((scope["path"], status)))
+    
+    with TestClient(app) as client:
+        header = client.post("/recognize").headers.get("server-timing", "")
+        untimed = client.get("/books").headers.get("server-timing")
+    
+    stages = {}
+    for part in header.split(", "):
+        name, _, dur = part.partition(";dur=")
+        stages[name] = float(dur) if dur else None
+    check(list(stages) == ["decode", "forward", "total"], f"Header stages: {header}",
+          f"Unexpected Server-Timing header: {header!r}")
+    check(stages.get("decode", 0) >= 10.0, "Repeated spans are summed (2 x 5ms decode)",
+          f"decode={stages.get('decode')}ms")
+    check(stages.get("forward", 0) >= 10.0, "Spans in executor threads are recorded via bind_context",
+          f"forward={stages.get('forward')}ms")
+    check(stages.get("total", 0) >= stages.get("decode", 0) + stages.get("forward", 0),
+          "Total covers all stages", f"total={stages.get('total')}ms")
+    check(untimed is None and finished == [("/recognize", 200)], "Paths outside `paths` are not timed",
+          f"header on /books: {untimed!r}, observed: {finished}")
+
+
+def test_metrics_exports():
+    """Test that utils.metrics exports every metric it defines"""
+    print_test("Metrics Exports (unit)")
+    
+    from prometheus_client.metrics import MetricWrapperBase
+    from utils import metrics
+    
+    defined = {name for name, value in vars(metrics).items() if isinstance(value, MetricWrapperBase)}
+    missing = sorted(defined - set(metrics.__all__))
+    check(not missing, f"All {len(defined)} metrics listed in __all__", f"Missing from __all__: {missing}")
+    unknown = [name for name in metrics.__all__ if not hasattr(metrics, name)]
+    check(not unknown, "__all__ names exist", f"Unknown names in __all__: {unknown}")
+
+
+def test_prefork_crash_loop_guard():
+    """Test that only consecutive fast worker deaths stop the pre-fork master"""
+    print_test("Pre-Fork Crash-Loop Guard (unit)")
+    
+    from serve_prefork import FAST_FAILURE_WINDOW, MAX_FAST_FAILURES, Master
+    
+    master = Master(sock=None, args=None)
+    fast, stable = FAST_FAILURE_WINDOW / 2, FAST_FAILURE_WINDOW * 100
+    
+    # Crashes spread over days, each after a stable run
+    tripped = False
+    for _ in range(MAX_FAST_FAILURES * 3):
+        tripped = tripped or master.record_exit(fast) or master.record_exit(stable)
+    check(not tripped and master.fast_failures == 0, "Stable runs reset the fast-failure count",
+          f"Guard tripped on spread-out crashes (count {master.fast_failures})")
+    
+    results = [master.record_exit(fast) for _ in range(MAX_FAST_FAILURES)]
+    check(results == [False] * (MAX_FAST_FAILURES - 1) + [True],
+          f"{MAX_FAST_FAILURES} deaths in a row right after start stop the master",
+          f"Guard results for a crash loop: {results}")
+
+
+def test_slab_assemble():
+    """Test that a batch mixing inline and slab jobs keeps every job's own rows"""
+    print_test("Slab Batch Assembly (unit)")
+    
+    import os
+    import tempfile
+    import numpy as np
+    from utils.inference import InferenceServer, _Job
+    from utils.shm_slab import TensorSlab
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        slab = TensorSlab.create(f"book_ocr_test_{os.getpid()}", slots=8, slot_shape=(3, 2, 2),
+                                 lock_path=os.path.join(tmp, "slab.lock"))
+        try:
+            for slot in range(8):
+                slab.write([slot], np.full((1, 3, 2, 2), slot, dtype=np.float32))
+            server = InferenceServer(os.path.join(tmp, "inference.sock"), embed_fn=None, slab=slab)
+            
+            # Non-consecutive slots go through the gather path
+            jobs = [_Job(None, pixels=np.full((1, 3, 2, 2), 99, dtype=np.float32)),
+                    _Job(None, slots=[0, 2]), _Job(None, slots=[5, 7])]
+            rows = server._assemble(jobs)[:, 0, 0, 0].tolist()
+            check(rows == [99, 0, 2, 5, 7], "Inline and gathered slab jobs keep their own pixels",
+                  f"Assembled rows {rows}, expected [99, 0, 2, 5, 7]")
+            
+            rows = server._assemble([_Job(None, slots=[1, 3]), _Job(None, slots=[6])])[:, 0, 0, 0].tolist()
+            check(rows == [1, 3, 6], "Slab-only batch gathers every job", f"Assembled rows {rows}")
+            server._executor.shutdown()
+        finally:
+            slab.close(unlink=True)
+
+
+def test_cover_segmentation():
+    """Test that shelf segmentation splits a table of covers but not a single cover"""
+    print_test("Cover Segmentation (unit)")
+    
+    import cv2
+    import numpy as np
+    from utils.segmentation import detect_cover_regions
+    
+    rng = np.random.default_rng(0)
+    
+    def cover(height=300, width=200):
+        # Plain background with a title and an inner artwork panel
+        img = np.full((height, width, 3), rng.integers(40, 220, 3), dtype=np.uint8)
+        art_h, art_w = height // 2, int(width * 0.7)
+        y, x = int(height * 0.3), (width - art_w) // 2
+        img[y:y + art_h, x:x + art_w] = cv2.GaussianBlur(
+            rng.integers(0, 256, (art_h, art_w, 3), dtype=np.uint8), (9, 9), 0)
+        cv2.putText(img, "TITLE", (width // 8, int(height * 0.15)),
+                    cv2.FONT_HERSHEY_SIMPLEX, width / 250, (255, 255, 255), 2)
+        return img
+    
+    # Two rows of three covers on a table, 60px apart
+    table = np.clip(rng.normal(110, 18, (780, 840, 3)), 0, 255).astype(np.uint8)
+    table = cv2.GaussianBlur(table, (7, 7), 0)
+    expected = [(60 + col * 260, 60 + row * 360) for row in range(2) for col in range(3)]
+    for x, y in expected:
+        table[y:y + 300, x:x + 200] = cover()
+    regions = detect_cover_regions(table)
+    found = [(r.x, r.y) for r in regions]
+    check(len(regions) == 6 and all(abs(fx - x) <= 5 and abs(fy - y) <= 5
+                                    for (fx, fy), (x, y) in zip(found, expected)),
+          "Six covers on a table found in reading order", f"Regions: {regions}")
+    
+    # One cover filling the frame: its artwork panel is not a cover of its own
+    regions = detect_cover_regions(cv2.resize(cover(), (400, 600)))
+    check(regions == [], "A single cover filling the frame is not segmented", f"Regions: {regions}")
+
+
+def test_streaming_ingest():
+    """Test that uploads are refused while they arrive and base64 bodies decode"""
+    print_test("Streaming Upload Ingestion (unit)")
+    
+    import asyncio
+    import base64
+    import cv2
+    import numpy as np
+    from utils.ingest import (NOT_AN_IMAGE, TOO_LARGE, BufferPool, UploadRejected,
+                              read_base64_image, read_image_upload, read_image_uploads)
+    
+    class FakeRequest:
+        """Headers plus a body delivered in chunks, counting the chunks read"""
+        def __init__(self, content_type, chunks, content_length=None):
+            self.headers = {"content-type": content_type}
+            if content_length is not None:
+                self.headers["content-length"] = str(content_length)
+            self.chunks = chunks
+            self.read = 0
+        
+        async def stream(self):
+            for chunk in self.chunks:
+                self.read += 1
+                yield chunk
+    
+    def multipart(files, field="file", chunk_size=1024):
+        body = b"".join(
+            b"--b\r\nContent-Disposition: form-data; name=\"" + field.encode() + b"\"; filename=\"" + name.encode()
+            + b"\"\r\nContent-Type: application/octet-stream\r\n\r\n" + data + b"\r\n"
+            for name, data in files
+        ) + b"--b--\r\n"
+        return FakeRequest("multipart/form-data; boundary=b",
+                           [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)])
+    
+    def rejection(reader, request, **kwargs):
+        try:
+            asyncio.run(reader(request, pool=BufferPool(), **kwargs))
+        except UploadRejected as e:
+            return e.status_code, e.reason
+        return None
+    
+    img = np.zeros((64, 48, 3), dtype=np.uint8)
+    img[:, 24:] = 200
+    jpeg = cv2.imencode(".jpg", img)[1].tobytes()
+    
+    # Oversized: refused mid-stream, without reading the rest of the body
+    request = multipart([("big.jpg", jpeg + b"\0" * 200_000)])
+    result = rejection(read_image_upload, request, max_bytes=64 * 1024)
+    check(result == (413, TOO_LARGE) and request.read < len(request.chunks) / 2,
+          "Oversized upload refused mid-stream",
+          f"Got {result} after {request.read}/{len(request.chunks)} chunks")
+    
+    request = FakeRequest("multipart/form-data; boundary=b", [b""], content_length=10 ** 9)
+    result = rejection(read_image_upload, request)
+    check(result == (413, TOO_LARGE) and request.read == 0, "Oversized Content-Length refused before reading",
+          f"Got {result} after {request.read} chunks")
+    
+    # Not an image: refused after the first chunk
+    request = multipart([("notes.txt", b"plain text, not an image" * 1000)])
+    result = rejection(read_image_upload, request)
+    check(result == (415, NOT_AN_IMAGE) and request.read == 1, "Non-image refused from its first chunk",
+          f"Got {result} after {request.read} chunks")
+    
+    # Batch: per-file errors, the other files still decode
+    files = asyncio.run(read_image_uploads(
+        multipart([("a.jpg", jpeg), ("b.txt", b"not an image at all"), ("c.jpg", jpeg)], field="files"),
+        pool=BufferPool()))
+    errors = [f.error.status_code if f.error else None for f in files]
+    decoded = [f.decode() is not None for f in files if f.error is None]
+    check(errors == [None, 415, None] and decoded == [True, True], "Batch upload reports errors per file",
+          f"Errors {errors}, decoded {decoded}")
+    
+    # Base64 with JSON escapes, split at awkward places
+    encoded = base64.encodebytes(jpeg).decode().replace("\n", "\\n").replace("/", "\\/")
+    body = ('{"image": "' + encoded + '", "other": 1}').encode()
+    request = FakeRequest("application/json", [body[i:i + 7] for i in range(0, len(body), 7)])
+    payload = asyncio.run(read_base64_image(request, pool=BufferPool()))
+    decoded = payload.decode()
+    check(decoded is not None and decoded.shape == img.shape, "Escaped base64 image decoded chunk by chunk",
+          f"Decoded {None if decoded is None else decoded.shape}")
+
+
+def test_replication_recovery():
+    """Test that a batch the index could not take is retried or rebuilt, never skipped"""
+    print_test("Replication Failure Recovery (unit)")
+    
+    import asyncio
+    import os
+    import tempfile
+    import numpy as np
+    import app_v2
+    from utils.database import apply_changes_sync, initialize_database
+    from utils.replication import ChangeLogFollower, FileChangeLogTransport
+    
+    rng = np.random.default_rng(0)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            initialize_database("leader.db")
+            initialize_database("books.db")
+            apply_changes_sync([
+                _change(seq, "add", f"B{seq}", rng.standard_normal(8).astype("float32"))
+                for seq in (1, 2, 3)
+            ], "leader.db")
+            
+            async def failing(changes, persist):
+                raise RuntimeError("index update failed")
+            
+            async def scenario():
+                follower = ChangeLogFollower(FileChangeLogTransport("leader.db"), on_applied=failing,
+                                             db_path="books.db")
+                try:
+                    await follower.poll_once()
+                    print_fail("Failed index update was swallowed")
+                except RuntimeError:
+                    check(follower.position == 0 and follower.applied_total == 0,
+                          "Position stays put when the index update fails",
+                          f"position={follower.position}, applied_total={follower.applied_total}")
+                
+                taken = []
+                
+                async def taking(changes, persist):
+                    taken.extend(change["seq"] for change in changes)
+                
+                follower.on_applied = taking
+                await follower.poll_once()
+                check(taken == [1, 2, 3] and follower.position == 3, "Failed batch is retried on the next poll",
+                      f"Retried seqs {taken}, position {follower.position}")
+                
+                # With on_resync the index is rebuilt from books.db instead
+                apply_changes_sync([_change(4, "add", "B4", rng.standard_normal(8).astype("float32"))],
+                                   "leader.db")
+                follower.on_applied, follower.on_resync = failing, app_v2.rebuild_catalog_index
+                await follower.poll_once()
+                check(follower.position == 4 and app_v2.book_ids_list == ["B1", "B2", "B3", "B4"],
+                      "Index rebuilt from books.db after a failed update",
+                      f"position={follower.position}, indexed={app_v2.book_ids_list}")
+                check(np.load("embeddings.npy").shape == (4, 8), "Rebuilt vectors saved to embeddings.npy",
+                      f"embeddings.npy has shape {np.load('embeddings.npy').shape}")
+            
+            asyncio.run(scenario())
+        finally:
+            app_v2.clear_catalog_index()
+            os.chdir(cwd)
+
+
+def test_stream_frames():
+    """Test that a stream keeps only its newest frame and skips near-duplicate frames"""
+    print_test("Live Stream Frames (unit)")
+    
+    import asyncio
+    import cv2
+    import numpy as np
+    from app_v2 import STREAM_DUPLICATE_THRESHOLD
+    from utils.streaming import (PROCESSED, STALE, LatestFrame, StreamStats,
+                                 frame_thumbnail, thumbnail_difference)
+    
+    async def scenario():
+        mailbox, stats = LatestFrame(), StreamStats()
+        recognized = []
+        
+        def put(seq):
+            # Counted the way the /ws/recognize reader counts it
+            if mailbox.put(seq, f"frame {seq}".encode()) is not None:
+                stats.record(STALE)
+        
+        put(1)
+        first = await mailbox.get()  # Frame 1 is now in flight
+        for seq in range(2, 7):
+            put(seq)
+        recognized.append(first[0])
+        stats.record(PROCESSED)
+        
+        newest = await mailbox.get()
+        recognized.append(newest[0])
+        stats.record(PROCESSED)
+        
+        waiter = asyncio.create_task(mailbox.get())
+        await asyncio.sleep(0)
+        mailbox.close()
+        return recognized, newest, await asyncio.wait_for(waiter, 1.0), stats.stats()
+    
+    recognized, newest, after_close, stats = asyncio.run(scenario())
+    check(recognized == [1, 6] and newest[1] == b"frame 6", "Only the newest frame survives while one is in flight",
+          f"Recognized frames {recognized}")
+    check(stats["frames_stale"] == 4 and stats["frames_received"] == 6,
+          "Replaced frames counted as stale", f"Stats: {stats}")
+    check(after_close is None, "A waiting recognizer wakes up with None on close", f"Got {after_close}")
+    
+    def desk(cover_at, color):
+        # A book cover with a title band lying on a shaded desk
+        img = np.tile(np.linspace(60, 120, 640, dtype=np.uint8)[None, :, None], (480, 1, 3))
+        x, y = cover_at
+        cv2.rectangle(img, (x, y), (x + 200, y + 300), color, -1)
+        cv2.rectangle(img, (x + 20, y + 40), (x + 180, y + 90), (240, 240, 240), -1)
+        return img
+    
+    scene = desk((200, 90), (30, 60, 200))
+    shifted = np.roll(scene, (3, 4), axis=(0, 1))  # Hand-held camera drifting a few pixels
+    other = desk((40, 150), (200, 160, 20))  # The next book put down
+    
+    drift = thumbnail_difference(frame_thumbnail(shifted), frame_thumbnail(scene))
+    change = thumbnail_difference(frame_thumbnail(other), frame_thumbnail(scene))
+    check(drift < STREAM_DUPLICATE_THRESHOLD, f"Slightly shifted frame is a duplicate ({drift:.4f})",
+          f"Shifted frame differs by {drift:.4f} (threshold {STREAM_DUPLICATE_THRESHOLD})")
+    check(change >= STREAM_DUPLICATE_THRESHOLD, f"A different scene is not a duplicate ({change:.4f})",
+          f"Different scene differs by only {change:.4f} (threshold {STREAM_DUPLICATE_THRESHOLD})")
+
+
+def test_cascade_decisions():
+    """Test the cascade's stage-one decisions, its stats and the threshold sweep"""
+    print_test("Cascade Decisions and Stats (unit)")
+    
+    import numpy as np
+    from utils.cascade import CascadeStats, cascade_sweep, decisive_rows
+    from utils.search import BatchSearchResult
+    
+    # Rows: clear lead, too close to the runner-up, below the threshold, no runner-up
+    sims = np.array([[0.9, 0.7], [0.9, 0.85], [0.79, 0.5], [0.9, 0.0]], dtype=np.float32)
+    valid = np.array([[True, True], [True, True], [True, True], [True, False]])
+    book_ids = np.array([["A", "Z"], ["B", "Z"], ["C", "Z"], ["D", ""]])
+    labels_k = np.full(sims.shape, "", dtype=object)
+    stage_one = BatchSearchResult(sims, np.zeros(sims.shape, dtype=np.int64), book_ids, valid, labels_k, labels_k)
+    
+    accepted = decisive_rows(stage_one, min_similarity=0.8, min_margin=0.1).tolist()
+    check(accepted == [True, False, False, True], "Threshold, margin and missing runner-up decide acceptance",
+          f"Accepted rows {accepted}")
+    
+    stats = CascadeStats()
+    stats.record_decisions(10, 8)
+    for agreed in (True, True, True, False):
+        stats.record_audit(agreed)
+    stats.record_shadow(True)
+    stats.record_shadow(False)
+    stats.record_stage_one(10, 0.01)
+    stats.record_clip(2, 0.02)
+    report = stats.stats()
+    expected = {"acceptance_rate": 0.8, "accepted_agreement_with_clip": 0.75, "agreement_with_clip": 0.8,
+                "fell_through_stage_one_agreement": 0.5, "estimated_cpu_ms_per_recognition": 3.0,
+                "estimated_cpu_saving": 0.7}
+    wrong = {key: report.get(key) for key, value in expected.items() if report.get(key) != value}
+    check(not wrong, "CascadeStats acceptance, agreement and saving", f"Unexpected values: {wrong}")
+    
+    labels = np.array(["A", "X", "C", "D"])
+    clip_top_ids = np.array(["A", "B", "X", "D"])
+    rows = cascade_sweep(stage_one, clip_top_ids, labels, [0.8, 0.0], [0.1, 0.0], stage_one_cost=0.1, clip_cost=1.0)
+    strict = rows[0]
+    check(strict["acceptance_rate"] == 0.5 and strict["accepted_accuracy"] == 1.0
+          and strict["cascade_top1_accuracy"] == 0.5 and strict["clip_top1_accuracy"] == 0.5
+          and strict["agreement_with_clip"] == 1.0 and strict["relative_cpu"] == 0.6,
+          "Sweep reports acceptance and accuracy at strict thresholds", f"Row: {strict}")
+    loose = rows[-1]
+    check(loose["acceptance_rate"] == 1.0 and loose["accepted_accuracy"] == 0.75
+          and loose["cascade_top1_accuracy"] == 0.75 and loose["agreement_with_clip"] == 0.75,
+          "Sweep reports acceptance and accuracy with no thresholds", f"Row: {loose}")
+
+
+def test_isbn_lookup():
+    """Test ISBN normalization and the catalog lookup behind the barcode fast path"""
+    print_test("ISBN Normalization and Lookup (unit)")
+    
+    import asyncio
+    import os
+    import sqlite3
+    import tempfile
+    from utils.barcode import isbn_lookup_keys, normalize_isbn
+    from utils.database import ISBN_KEY, BookDatabase, initialize_database
+    
+    cases = {
+        "0-8044-2957-X": "9780804429573",  # ISBN-10 with an X check digit
+        "080442957x": "9780804429573",
+        "978-0-306-40615-7": "9780306406157",
+        "978 0 306 40615 7": "9780306406157",
+        "978-0-306-40615-8": None,  # Bad checksum
+        "0-8044-2957-1": None,
+        "4006381333931": None,  # Valid EAN-13, but not a book (no 978/979 prefix)
+        "": None
+    }
+    wrong = {text: normalize_isbn(text) for text, isbn in cases.items() if normalize_isbn(text) != isbn}
+    check(not wrong, "ISBN-10/13 normalized, invalid codes rejected", f"Wrong results: {wrong}")
+    
+    keys = isbn_lookup_keys("9780804429573")
+    check(keys == ["9780804429573", "080442957X"], "ISBN-13 looked up as itself and its ISBN-10",
+          f"Lookup keys {keys}")
+    check(isbn_lookup_keys("9791090636071") == ["9791090636071"], "979 ISBNs have no ISBN-10 form",
+          f"Lookup keys {isbn_lookup_keys('9791090636071')}")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "books.db")
+        initialize_database(db_path)
+        db = BookDatabase(db_path)
+        
+        async def scenario():
+            await db.add_book("TEN", "Stored as ISBN-10", "Test", "", isbn="0-8044-2957-x")
+            await db.add_book("THIRTEEN", "Stored hyphenated", "Test", "", isbn="978-0-306-40615-7")
+            await db.add_book("NONE", "No ISBN", "Test", "")
+            ten = await db.get_book_by_isbn(isbn_lookup_keys(normalize_isbn("9780804429573")))
+            thirteen = await db.get_book_by_isbn(isbn_lookup_keys(normalize_isbn("0306406152")))
+            missing = await db.get_book_by_isbn(isbn_lookup_keys("9780000000002"))
+            return ten, thirteen, missing
+        
+        ten, thirteen, missing = asyncio.run(scenario())
+        check(ten is not None and ten["book_id"] == "TEN", "Scanned ISBN-13 finds a book stored as ISBN-10",
+              f"Found {ten}")
+        check(thirteen is not None and thirteen["book_id"] == "THIRTEEN",
+              "Scanned ISBN-10 finds a book stored as hyphenated ISBN-13", f"Found {thirteen}")
+        check(missing is None, "Unknown ISBN finds nothing", f"Found {missing}")
+        
+        conn = sqlite3.connect(db_path)
+        plan = " ".join(str(row) for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT book_id FROM books WHERE {ISBN_KEY} IN (?, ?)", ["a", "b"]))
+        conn.close()
+        check("idx_books_isbn" in plan, "Lookup uses the ISBN expression index", f"Query plan: {plan}")
+
+
+def test_snapshot_round_trip():
+    """Test that a snapshot bundle restores the same catalog and refuses bad bundles"""
+    print_test("Snapshot Bundle Round Trip (unit)")
+    
+    import io
+    import os
+    import tarfile
+    import tempfile
+    import numpy as np
+    from utils.database import (apply_changes_sync, get_book_embeddings_sync, get_book_ids_sync,
+                                get_change_head_sync, initialize_database)
+    from utils.snapshot import SnapshotError, export_snapshot, load_snapshot, restore_books
+    
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3, 8)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        leader_db, node_db = os.path.join(tmp, "leader.db"), os.path.join(tmp, "node.db")
+        embeddings_path, bundle = os.path.join(tmp, "embeddings.npy"), os.path.join(tmp, "catalog.tar")
+        initialize_database(leader_db)
+        apply_changes_sync([_change(seq, "add", f"B{seq}", vectors[seq - 1]) for seq in (1, 2, 3)]
+                           + [_change(4, "delete", "B2")], leader_db)
+        np.save(embeddings_path, vectors[[0, 2]])
+        
+        export_snapshot(bundle, "test-model", db_path=leader_db, embeddings_path=embeddings_path)
+        snapshot = load_snapshot(bundle, expected_model_id="test-model")
+        restore_books(snapshot, node_db)
+        
+        restored = get_book_embeddings_sync(node_db)
+        check(get_book_ids_sync(node_db) == ["B1", "B3"] and snapshot.book_ids == ["B1", "B3"],
+              "Book ids survive the round trip", f"Restored ids {get_book_ids_sync(node_db)}")
+        check(all(np.allclose(vector, expected) for (_, vector), expected in zip(restored, vectors[[0, 2]])),
+              "Vectors survive the round trip", "Restored vectors differ from the exported ones")
+        _, found = snapshot.index.search(vectors[[2]], 1)
+        check(found[0, 0] == 1, "Serialized index finds its own vectors", f"Index returned row {found[0, 0]}")
+        check(get_change_head_sync(node_db) == 4, "Change log position survives the round trip",
+              f"Node change head {get_change_head_sync(node_db)}")
+        
+        try:
+            load_snapshot(bundle, expected_model_id="other-model")
+            print_fail("Snapshot from another model was loaded")
+        except SnapshotError:
+            print_pass("Snapshot from another model refused")
+        
+        # Same manifest, one member altered
+        tampered = os.path.join(tmp, "tampered.tar")
+        with tarfile.open(bundle) as source, tarfile.open(tampered, "w") as target:
+            for member in source.getmembers():
+                data = source.extractfile(member).read()
+                if member.name == "vectors.npy":
+                    data = data[:-4] + b"\0\0\0\0"
+                member.size = len(data)
+                target.addfile(member, io.BytesIO(data))
+        try:
+            load_snapshot(tampered)
+            print_fail("Tampered snapshot was loaded")
+        except SnapshotError as e:
+            check("vectors.npy" in str(e), "Tampered member refused by its checksum", f"Refused for: {e}")
+
+
+def test_inference_server_round_trip():
+    """Test the shared inference server end to end: slab slots, inline pixels, slab re-attach"""
+    print_test("Inference Server Round Trip (unit)")
+    
+    import asyncio
+    import os
+    import tempfile
+    import threading
+    import time
+    import numpy as np
+    from multiprocessing import resource_tracker
+    from utils.inference import InferenceClient, InferenceServer
+    from utils.shm_slab import TensorSlab
+    
+    def embed_fn(pixels):
+        # Row mean and row size identify each image in the reply
+        flat = pixels.reshape(len(pixels), -1)
+        return np.stack([flat.mean(axis=1), np.full(len(flat), flat.shape[1])], axis=1).astype(np.float32)
+    
+    def images(count, side=2):
+        return np.stack([np.full((3, side, side), i + 1, dtype=np.float32) for i in range(count)])
+    
+    def expected(pixels):
+        return [[i + 1.0, pixels[0].size] for i in range(len(pixels))]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "inference.sock")
+        slabs = [TensorSlab.create(f"book_ocr_test_{os.getpid()}_{n}", slots=8, slot_shape=(3, 2, 2),
+                                   lock_path=os.path.join(tmp, f"slab{n}.lock")) for n in (1, 2)]
+        server = InferenceServer(socket_path, embed_fn, max_wait_ms=1, slab=slabs[0])
+        loop = asyncio.new_event_loop()
+        serving = loop.create_task(server.serve())
+        
+        def run_server():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(serving)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.close()
+        
+        thread = threading.Thread(target=run_server, daemon=True)
+        thread.start()
+        client = InferenceClient(socket_path, timeout=5)
+        try:
+            for _ in range(100):
+                if os.path.exists(socket_path):
+                    break
+                time.sleep(0.02)
+            
+            pixels = images(3)
+            result = client.embed(pixels).tolist()
+            check(result == expected(pixels) and client.slab_requests == 1 and server.slab_requests == 1,
+                  "Pixels sent through slab slots", f"Result {result}, slab requests {client.slab_requests}")
+            
+            # A shape the slots do not hold goes inline
+            pixels = images(2, side=4)
+            result = client.embed(pixels).tolist()
+            check(result == expected(pixels) and client.inline_requests == 1 and server.inline_requests == 1,
+                  "Pixels sent inline", f"Result {result}, inline requests {client.inline_requests}")
+            
+            # Server restarted with a new slab: the client re-attaches and retries
+            server.slab = slabs[1]
+            pixels = images(4)
+            result = client.embed(pixels).tolist()
+            check(result == expected(pixels) and client._slab.name == slabs[1].name
+                  and client.slab_requests == 2 and client.inline_requests == 1,
+                  "Stale slab re-attached without falling back to inline",
+                  f"Result {result}, slab {client._slab.name if client._slab else None}")
+        finally:
+            client._drop_slab()
+            client._disconnect()
+            loop.call_soon_threadsafe(serving.cancel)
+            thread.join(timeout=5)
+            for slab in slabs:
+                if sys.version_info < (3, 13):
+                    # attach() stopped tracking the block, expecting to run in another
+                    # process than the server; track it again so unlink() is clean
+                    resource_tracker.register(slab.shm._name, "shared_memory")
+                slab.close(unlink=True)
+
+
+def test_import_budgets():
+    """Test every module's import time and import expectations (check_import_time.py)"""
+    print_test("Import-Time Budgets (unit)")
+    
+    from check_import_time import BUDGETS, check_module
+    
+    for module in BUDGETS:
+        seconds, problems = check_module(module)
+        if seconds is None:
+            print_fail(f"{module} failed to import: {problems[0]}")
+        else:
+            check(not problems, f"{module} imports in {seconds:.3f}s",
+                  f"{module} ({seconds:.3f}s, budget {BUDGETS[module]}s): {'; '.join(problems)}")
+
+
+UNIT_TESTS = [
+    test_confidence_buckets,
+    test_sharded_search,
+    test_replication_apply,
+    test_replicated_delete_of_last_book,
+    test_replication_recovery,
+    test_admission_shedding,
+    test_priority_lanes,
+    test_server_timing,
+    test_metrics_exports,
+    test_prefork_crash_loop_guard,
+    test_slab_assemble,
+    test_inference_server_round_trip,
+    test_cover_segmentation,
+    test_streaming_ingest,
+    test_stream_frames,
+    test_cascade_decisions,
+    test_isbn_lookup,
+    test_snapshot_round_trip,
+    test_import_budgets
+]
+
+
+def run_unit_tests():
+    """Run every unit test; an exception fails that test only"""
+    for test in UNIT_TESTS:
+        try:
+            test()
+        except Exception as e:
+            print_fail(f"{test.__name__} raised {type(e).__name__}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Live tests: need the service running at BASE_URL
+# ---------------------------------------------------------------------------
+
 def test_health():
     """Test enhanced health endpoint"""
     print_test("Enhanced Health Check")
@@ -233,6 +1188,48 @@ def test_recognition_with_confidence():
             print_fail(f"{img_path.name}: {e}")
 
 
+def test_batch_recognition():
+    """Test multi-image batch recognition"""
+    print_test("Batch Recognition")
+    
+    test_images = list(Path("covers").glob("*.*"))[:4] if Path("covers").exists() else []
+    
+    if not test_images:
+        print_info("No test images found")
+        print_info("Skipping batch recognition test")
+        return
+    
+    handles = [open(p, 'rb') for p in test_images]
+    try:
+        files = [("files", (p.name, f)) for p, f in zip(test_images, handles)]
+        response = requests.post(f"{BASE_URL}/recognize_batch", files=files, timeout=60)
+        
+        if response.status_code == 200:
+            data = response.json()
+            results = data.get("results", [])
+            
+            if len(results) == len(test_images):
+                print_pass(f"Got {len(results)} results for {len(test_images)} images")
+            else:
+                print_fail(f"Expected {len(test_images)} results, got {len(results)}")
+            
+            if [r.get("file") for r in results] == [p.name for p in test_images]:
+                print_pass("Results returned in upload order")
+            else:
+                print_fail("Results not in upload order")
+            
+            for r in results:
+                print_info(f"  {r.get('file')}: {r.get('status')}")
+        else:
+            print_fail(f"Batch recognition failed with status {response.status_code}")
+    
+    except Exception as e:
+        print_fail(f"Batch recognition failed: {e}")
+    finally:
+        for f in handles:
+            f.close()
+
+
 def test_caching():
     """Test caching functionality"""
     print_test("Caching Performance")
@@ -330,10 +1327,22 @@ def print_summary():
 
 def main():
     """Run all tests"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Book Cover OCR v2 test suite")
+    parser.add_argument("--unit", action="store_true",
+                        help="Run only the unit tests (no running service needed)")
+    args = parser.parse_args()
+    
     print(f"\n{BLUE}{'='*60}{RESET}")
     print(f"{BLUE}Book Cover OCR v2 - Comprehensive Test Suite{RESET}")
     print(f"{BLUE}{'='*60}{RESET}")
     
+    run_unit_tests()
+    if args.unit:
+        print_summary()
+        sys.exit(0 if TEST_FAILED == 0 else 1)
+    
     # Check if service is running
     try:
         requests.get(f"{BASE_URL}/health", timeout=2)
@@ -350,6 +1359,7 @@ def main():
     test_search()
     test_database()
     test_recognition_with_confidence()
+    test_batch_recognition()
     test_caching()
     
     # Print summary
@@ -0,0 +1,362 @@
+"""
+Admission control for CPU-bound inference
+Caps in-flight work, keeps bounded per-priority wait queues with per-request
+deadlines, sheds requests early when they could not be served in time and
+abandons work whose client has gone away
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries a Retry-After hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RequestCancelled(Exception):
+    """Raised when a request's work is abandoned (client gone or deadline passed)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RequestContext:
+    """
+    Per-request scheduling state: priority, deadline and cancellation
+
+    A watcher task polls the client connection; once the client disconnects
+    (or the deadline passes) the context is cancelled and any queued or
+    not-yet-started inference for it is dropped.
+    """
+
+    DISCONNECTED = "client_disconnected"
+    DEADLINE = "deadline"
+
+    def __init__(self, deadline: float, priority: str = None):
+        self.deadline = deadline
+        self.priority = priority or INTERACTIVE
+        self.reason: Optional[str] = None
+        self._event = asyncio.Event()
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and time.monotonic() > self.deadline:
+            self.cancel(self.DEADLINE)
+        return self.reason is not None
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+            self._event.set()
+
+    def check(self, include_deadline: bool = True):
+        """
+        Raise RequestCancelled if the request should be abandoned
+
+        Args:
+            include_deadline: Also abandon when the deadline has passed; pass
+                False once the expensive work is done and only a client
+                disconnect makes finishing pointless
+        """
+        if include_deadline:
+            if self.cancelled:
+                raise RequestCancelled(self.reason)
+        elif self.reason == self.DISCONNECTED:
+            raise RequestCancelled(self.reason)
+
+    async def wait_cancelled(self):
+        await self._event.wait()
+
+    def watch(self, request, interval: float = 0.1):
+        """Start polling `request.is_disconnected()` (a Starlette Request)"""
+        async def poll():
+            while self.reason is None:
+                if await request.is_disconnected():
+                    self.cancel(self.DISCONNECTED)
+                    return
+                await asyncio.sleep(interval)
+
+        self._watcher = asyncio.get_running_loop().create_task(poll())
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+
+def parse_priority(value: Optional[str], default: str = INTERACTIVE) -> str:
+    """Normalize an X-Priority header value to a known lane"""
+    if value and value.strip().lower() in PRIORITIES:
+        return value.strip().lower()
+    return default
+
+
+class _Lane:
+    """Wait queue and counters for one priority class"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.served = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    def pop_live(self) -> Optional[asyncio.Future]:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                return waiter
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.depth,
+            "served": self.served,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline
+        }
+
+
+class AdmissionController:
+    """
+    Priority scheduler in front of inference with deadline-aware shedding
+
+    Freed slots go to interactive waiters first. Bulk waiters earn
+    `bulk_min_share` credit per grant and take a slot whenever they hold a
+    full credit, so bulk traffic keeps at least that share of throughput
+    while it has work queued.
+
+    A request is rejected immediately if its lane's queue is full or if the
+    estimated wait would push it past its deadline; otherwise it waits, and
+    is shed if the deadline passes before a slot frees up.
+    """
+
+    def __init__(self, max_inflight: int = 2, max_queue: int = 16,
+                 default_timeout: float = 10.0, initial_service_time: float = 0.2,
+                 bulk_min_share: float = 0.2, bulk_timeout: Optional[float] = None):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.bulk_timeout = bulk_timeout or default_timeout
+        self.bulk_min_share = bulk_min_share
+
+        self.in_flight = 0
+        self.lanes = {name: _Lane(name) for name in PRIORITIES}
+        self._bulk_credit = 0.0
+        # Exponentially weighted moving average of time spent holding a slot
+        self.service_time = initial_service_time
+
+        # Work dropped because the client left or the deadline passed
+        self.abandoned_in_queue = 0
+        self.abandoned_before_start = 0
+        self.abandoned_by_reason = {RequestContext.DISCONNECTED: 0, RequestContext.DEADLINE: 0}
+        self.seconds_saved = 0.0
+
+    def new_context(self, priority: str = INTERACTIVE, timeout_ms: Optional[int] = None) -> RequestContext:
+        """Create a request context with the lane's default deadline (or timeout_ms)"""
+        if timeout_ms:
+            timeout = timeout_ms / 1000
+        else:
+            timeout = self.bulk_timeout if priority == BULK else self.default_timeout
+        return RequestContext(time.monotonic() + timeout, priority)
+
+    def _abandon(self, ctx: RequestContext, in_queue: bool) -> RequestCancelled:
+        if in_queue:
+            self.abandoned_in_queue += 1
+        else:
+            self.abandoned_before_start += 1
+        self.abandoned_by_reason[ctx.reason] = self.abandoned_by_reason.get(ctx.reason, 0) + 1
+        self.seconds_saved += self.service_time
+        return RequestCancelled(ctx.reason)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(lane.depth for lane in self.lanes.values())
+
+    def estimated_wait(self, priority: str, position: int) -> float:
+        """Expected seconds until a request at `position` in its lane gets a slot"""
+        per_slot = self.service_time / self.max_inflight
+        if priority == INTERACTIVE:
+            share = 1.0 - self.bulk_min_share if self.lanes[BULK].depth else 1.0
+            return position * per_slot / share
+        # Bulk waits behind interactive traffic, but never longer than its guaranteed share allows
+        behind_interactive = (self.lanes[INTERACTIVE].depth + position) * per_slot
+        guaranteed = position * per_slot / self.bulk_min_share if self.bulk_min_share else behind_interactive
+        return min(behind_interactive, guaranteed)
+
+    def retry_after(self, priority: str = INTERACTIVE) -> int:
+        """Retry-After hint: time to drain the lane's queue, at least 1s"""
+        position = self.lanes[priority].depth + 1
+        return max(1, math.ceil(self.estimated_wait(priority, position)))
+
+    def _shed(self, lane: _Lane, reason: str) -> Overloaded:
+        if reason == "queue_full":
+            lane.shed_queue_full += 1
+        else:
+            lane.shed_deadline += 1
+        return Overloaded(reason, self.retry_after(lane.name))
+
+    async def acquire(self, ctx: RequestContext):
+        """
+        Wait for an inference slot
+
+        Args:
+            ctx: Request context (priority, deadline, cancellation)
+
+        Raises:
+            Overloaded: The request was shed
+            RequestCancelled: The client went away (or the deadline passed)
+                before the work started
+        """
+        lane = self.lanes[ctx.priority]
+        if ctx.cancelled:
+            raise self._abandon(ctx, in_queue=False)
+
+        now = time.monotonic()
+        if self.in_flight < self.max_inflight and self.queue_depth == 0:
+            self.in_flight += 1
+            return
+
+        position = lane.depth + 1
+        if position > self.max_queue:
+            raise self._shed(lane, "queue_full")
+        if now + self.estimated_wait(ctx.priority, position) > ctx.deadline:
+            raise self._shed(lane, "deadline")
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        lane.queued += 1
+
+        cancel_wait = asyncio.ensure_future(ctx.wait_cancelled())
+        try:
+            await asyncio.wait(
+                {waiter, cancel_wait},
+                timeout=max(0.0, ctx.deadline - now),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            self._withdraw(waiter)
+            raise
+        finally:
+            cancel_wait.cancel()
+
+        if waiter.done() and not ctx.cancelled:
+            return
+
+        # Timed out or cancelled while queued: give back a slot handed over
+        # in the meantime, and make sure nobody hands us one later
+        self._withdraw(waiter)
+        if ctx.reason == RequestContext.DISCONNECTED:
+            raise self._abandon(ctx, in_queue=True)
+        raise self._shed(lane, "deadline")
+
+    def _withdraw(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            self._release_slot()
+        else:
+            waiter.cancel()
+
+    def _next_lane(self) -> Optional[_Lane]:
+        """Pick the lane that receives the next free slot"""
+        interactive, bulk = self.lanes[INTERACTIVE], self.lanes[BULK]
+        if not bulk.depth:
+            self._bulk_credit = 0.0
+            return interactive if interactive.depth else None
+        if not interactive.depth:
+            return bulk
+
+        self._bulk_credit += self.bulk_min_share
+        if self._bulk_credit >= 1.0:
+            self._bulk_credit -= 1.0
+            return bulk
+        return interactive
+
+    def _release_slot(self):
+        """Hand the slot to the next waiter by priority, or free it"""
+        lane = self._next_lane()
+        while lane is not None:
+            waiter = lane.pop_live()
+            if waiter is not None:
+                waiter.set_result(True)
+                return
+            lane = self._next_lane()
+        self.in_flight -= 1
+
+    def release(self, service_time: Optional[float], priority: str = INTERACTIVE):
+        """Return a slot after work finished, updating the service time estimate"""
+        if service_time is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * service_time
+        self.lanes[priority].served += 1
+        self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self, ctx: RequestContext):
+        """async with controller.slot(ctx): ... (holds one inference slot)"""
+        await self.acquire(ctx)
+        if ctx.cancelled:
+            # Client left between the slot handoff and the start of the work
+            self._release_slot()
+            raise self._abandon(ctx, in_queue=False)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start, ctx.priority)
+
+    def stats(self) -> Dict:
+        """Counters for /health and /stats"""
+        lanes = {name: lane.stats() for name, lane in self.lanes.items()}
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "bulk_min_share": self.bulk_min_share,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "served": sum(lane["served"] for lane in lanes.values()),
+            "queued": sum(lane["queued"] for lane in lanes.values()),
+            "shed_queue_full": sum(lane["shed_queue_full"] for lane in lanes.values()),
+            "shed_deadline": sum(lane["shed_deadline"] for lane in lanes.values()),
+            "shed_total": sum(lane["shed_queue_full"] + lane["shed_deadline"] for lane in lanes.values()),
+            "service_time_ewma_ms": round(self.service_time * 1000, 1),
+            "lanes": lanes,
+            "cancellation": {
+                "abandoned_in_queue": self.abandoned_in_queue,
+                "abandoned_before_start": self.abandoned_before_start,
+                "by_reason": dict(self.abandoned_by_reason),
+                "estimated_seconds_saved": round(self.seconds_saved, 3)
+            }
+        }
+
+
+__all__ = [
+    'AdmissionController',
+    'Overloaded',
+    'RequestCancelled',
+    'RequestContext',
+    'parse_priority',
+    'INTERACTIVE',
+    'BULK'
+]
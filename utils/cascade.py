@@ -0,0 +1,273 @@
+"""
+Two-stage recognition: a cheap MobileNet search answers decisive queries
+and only the rest pay for a CLIP forward pass
+Stage one has its own index (MobileNet vectors keyed by book id); a query is
+decisive when its top-1 score is high and clearly ahead of the runner-up
+"""
+import time
+import numpy as np
+import faiss
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from .search import BatchSearchResult, SearchService, build_index
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CASCADE_EMBEDDINGS = "embeddings_mobilenet.npz"
+MOBILENET_MODEL = "mobilenet"
+
+
+def mobilenet_embed_batch(imgs: List[np.ndarray]) -> np.ndarray:
+    """
+    MobileNet embeddings of BGR images (utils.embedding, ONNX)
+
+    Returns:
+        (N, d) float32 array, L2-normalized
+    """
+    # Imported here: utils.embedding opens its ONNX session on import
+    from .embedding import get_embedding
+
+    return np.vstack([get_embedding(img) for img in imgs]).astype("float32")
+
+
+def save_cascade_embeddings(path: str, embeddings: np.ndarray, book_ids: Sequence[str],
+                            model: str = MOBILENET_MODEL):
+    """Write stage-one vectors with their book ids (rows need not match embeddings.npy)"""
+    np.savez(
+        path,
+        embeddings=np.asarray(embeddings, dtype="float32"),
+        book_ids=np.asarray(list(book_ids)),
+        model=np.asarray(model)
+    )
+
+
+def load_cascade_embeddings(path: str) -> Tuple[np.ndarray, List[str], str]:
+    """
+    Read stage-one vectors written by save_cascade_embeddings
+
+    Returns:
+        Tuple of (normalized (N, d) embeddings, book ids, model name)
+    """
+    with np.load(path, allow_pickle=False) as data:
+        embeddings = np.ascontiguousarray(data["embeddings"], dtype="float32")
+        book_ids = data["book_ids"].tolist()
+        model = str(data["model"]) if "model" in data else MOBILENET_MODEL
+    if len(book_ids) != len(embeddings):
+        raise ValueError(f"{path}: {len(book_ids)} book ids but {len(embeddings)} embeddings")
+    faiss.normalize_L2(embeddings)
+    return embeddings, book_ids, model
+
+
+def decisive_rows(result: BatchSearchResult, min_similarity: float, min_margin: float) -> np.ndarray:
+    """
+    Which query rows stage one may answer on its own
+
+    Args:
+        result: Stage-one search result (k >= 2 for a meaningful margin)
+        min_similarity: Top-1 score required
+        min_margin: Lead of top-1 over the runner-up required (a missing
+            runner-up counts as 0)
+
+    Returns:
+        (N,) bool array
+    """
+    sims = result.similarities
+    if sims.shape[1] == 0:
+        return np.zeros(len(result), dtype=bool)
+    top1 = sims[:, 0]
+    runner_up = np.where(result.valid[:, 1], sims[:, 1], 0.0) if sims.shape[1] > 1 else np.zeros_like(top1)
+    return result.valid[:, 0] & (top1 >= min_similarity) & (top1 - runner_up >= min_margin)
+
+
+class CascadeStats:
+    """
+    How often stage one answers, how often it agrees with CLIP, and what it saves
+
+    Agreement comes from two sources: a sample of stage-one answers that
+    are re-checked with CLIP (audits), and every fall-through, where both
+    stages' top-1 are known anyway (shadow comparisons).
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.accepted = 0
+        self.audited = 0
+        self.audit_agreed = 0
+        self.shadow_compared = 0
+        self.shadow_agreed = 0
+        # Seconds per image, exponentially weighted
+        self.stage_one_seconds: Optional[float] = None
+        self.clip_seconds: Optional[float] = None
+
+    @staticmethod
+    def _ewma(current: Optional[float], sample: float) -> float:
+        return sample if current is None else 0.9 * current + 0.1 * sample
+
+    def record_decisions(self, images: int, accepted: int):
+        self.queries += images
+        self.accepted += accepted
+
+    def record_stage_one(self, images: int, seconds: float):
+        if images:
+            self.stage_one_seconds = self._ewma(self.stage_one_seconds, seconds / images)
+
+    def record_clip(self, images: int, seconds: float):
+        if images:
+            self.clip_seconds = self._ewma(self.clip_seconds, seconds / images)
+
+    def record_audit(self, agreed: bool):
+        self.audited += 1
+        self.audit_agreed += int(agreed)
+
+    def record_shadow(self, agreed: bool):
+        self.shadow_compared += 1
+        self.shadow_agreed += int(agreed)
+
+    def timed_clip(self, fn: Callable[[List[np.ndarray]], np.ndarray]) -> Callable:
+        """Wrap a batch CLIP embedding function so its cost per image is recorded"""
+        def wrapper(imgs: List[np.ndarray]) -> np.ndarray:
+            start = time.perf_counter()
+            embeddings = fn(imgs)
+            self.record_clip(len(imgs), time.perf_counter() - start)
+            return embeddings
+        return wrapper
+
+    def stats(self) -> Dict:
+        acceptance = self.accepted / self.queries if self.queries else None
+        audit_agreement = self.audit_agreed / self.audited if self.audited else None
+        stats = {
+            "queries": self.queries,
+            "accepted": self.accepted,
+            "fell_through": self.queries - self.accepted,
+            "acceptance_rate": round(acceptance, 4) if acceptance is not None else None,
+            # Accepted answers are the only ones that can differ from CLIP-only
+            "audited": self.audited,
+            "accepted_agreement_with_clip": round(audit_agreement, 4) if audit_agreement is not None else None,
+            "agreement_with_clip": (
+                round(1 - acceptance * (1 - audit_agreement), 4)
+                if acceptance is not None and audit_agreement is not None else None
+            ),
+            "shadow_compared": self.shadow_compared,
+            "fell_through_stage_one_agreement": (
+                round(self.shadow_agreed / self.shadow_compared, 4) if self.shadow_compared else None
+            ),
+            "stage_one_ms_per_image": round(self.stage_one_seconds * 1000, 2) if self.stage_one_seconds else None,
+            "clip_ms_per_image": round(self.clip_seconds * 1000, 2) if self.clip_seconds else None
+        }
+        if acceptance is not None and self.stage_one_seconds and self.clip_seconds:
+            per_query = self.stage_one_seconds + (1 - acceptance) * self.clip_seconds
+            stats["estimated_cpu_ms_per_recognition"] = round(per_query * 1000, 2)
+            stats["estimated_cpu_saving"] = round(1 - per_query / self.clip_seconds, 4)
+        return stats
+
+
+class CascadeStage:
+    """
+    Stage one of the cascade: cheap embedding plus a search of its own index
+
+    Args:
+        embed_fn: Batch embedding function (BGR images -> (N, d) normalized)
+        embeddings: (N, d) stage-one catalog vectors, normalized
+        book_ids: Book id of each row
+        min_similarity: Top-1 score a stage-one answer needs
+        min_margin: Lead over the runner-up a stage-one answer needs
+        top_k: Candidates returned with a stage-one answer
+        threshold: Confidence threshold for the candidate labels
+        model: Name reported with stage-one answers
+    """
+
+    def __init__(self, embed_fn: Callable[[List[np.ndarray]], np.ndarray], embeddings: np.ndarray,
+                 book_ids: Sequence[str], min_similarity: float, min_margin: float,
+                 top_k: int = 5, threshold: float = 0.65, model: str = MOBILENET_MODEL):
+        self.embed_fn = embed_fn
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.model = model
+        self.book_ids = frozenset(book_ids)
+        # Exact search: the margin rule relies on the true runner-up
+        self.service = SearchService(
+            build_index(embeddings, use_hnsw=False), book_ids, top_k=max(top_k, 2), threshold=threshold
+        )
+        self.stats = CascadeStats()
+
+    def covers(self, book_ids: Sequence[str]) -> bool:
+        """Whether the stage-one index holds exactly this catalog"""
+        return self.book_ids == frozenset(book_ids)
+
+    def embed(self, imgs: List[np.ndarray]) -> np.ndarray:
+        """Stage-one embeddings (its cost per image goes into stats)"""
+        start = time.perf_counter()
+        with span("cascade_embed"):
+            embeddings = self.embed_fn(imgs)
+        self.stats.record_stage_one(len(imgs), time.perf_counter() - start)
+        return embeddings
+
+    def search(self, embeddings: np.ndarray) -> Tuple[BatchSearchResult, np.ndarray]:
+        """Search the stage-one index; returns the result and the decisive-row mask"""
+        result = self.service.search(embeddings)
+        return result, decisive_rows(result, self.min_similarity, self.min_margin)
+
+    def describe(self) -> Dict:
+        return {
+            "model": self.model,
+            "books": len(self.book_ids),
+            "min_similarity": self.min_similarity,
+            "min_margin": self.min_margin
+        }
+
+
+def cascade_sweep(stage_one: BatchSearchResult, clip_top_ids: np.ndarray, labels: np.ndarray,
+                  min_similarities: Sequence[float], margins: Sequence[float],
+                  stage_one_cost: float = 0.0, clip_cost: float = 1.0) -> List[Dict]:
+    """
+    Acceptance and accuracy of the cascade at each threshold pair, versus CLIP only
+
+    Args:
+        stage_one: Stage-one search result for a labelled query set
+        clip_top_ids: CLIP top-1 book id per query
+        labels: True book id per query
+        min_similarities: Stage-one top-1 thresholds to try
+        margins: Stage-one margins to try
+        stage_one_cost: Seconds per image of stage one
+        clip_cost: Seconds per image of CLIP
+
+    Returns:
+        One dict per (min_similarity, margin) pair
+    """
+    stage_one_ids = stage_one.book_ids[:, 0]
+    stage_one_correct = stage_one_ids == labels
+    clip_correct = clip_top_ids == labels
+    clip_accuracy = float(np.mean(clip_correct))
+
+    rows = []
+    for min_similarity in min_similarities:
+        for margin in margins:
+            accepted = decisive_rows(stage_one, min_similarity, margin)
+            cascade_correct = np.where(accepted, stage_one_correct, clip_correct)
+            acceptance = float(np.mean(accepted))
+            relative_cpu = (stage_one_cost + (1 - acceptance) * clip_cost) / clip_cost if clip_cost else None
+            rows.append({
+                "min_similarity": min_similarity,
+                "min_margin": margin,
+                "acceptance_rate": round(acceptance, 4),
+                "accepted_accuracy": round(float(np.mean(stage_one_correct[accepted])), 4) if accepted.any() else None,
+                "cascade_top1_accuracy": round(float(np.mean(cascade_correct)), 4),
+                "clip_top1_accuracy": round(clip_accuracy, 4),
+                "agreement_with_clip": round(float(np.mean(np.where(accepted, stage_one_ids == clip_top_ids, True))), 4),
+                "relative_cpu": round(relative_cpu, 4) if relative_cpu is not None else None
+            })
+    return rows
+
+
+__all__ = [
+    'CascadeStage',
+    'CascadeStats',
+    'DEFAULT_CASCADE_EMBEDDINGS',
+    'cascade_sweep',
+    'decisive_rows',
+    'load_cascade_embeddings',
+    'mobilenet_embed_batch',
+    'save_cascade_embeddings'
+]
@@ -4,14 +4,20 @@ Database module for managing book metadata with SQLite
 import sqlite3
 import json
 import aiosqlite
+import numpy as np
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from .metrics import observe_db_query
+
 logger = logging.getLogger(__name__)
 
 DB_PATH = "books.db"
 
+# ISBNs are stored as typed (with or without hyphens); lookups compare this form
+ISBN_KEY = "REPLACE(REPLACE(UPPER(isbn), '-', ''), ' ', '')"
+
 
 def initialize_database(db_path: str = DB_PATH):
     """
@@ -43,6 +49,23 @@ def initialize_database(db_path: str = DB_PATH):
         CREATE INDEX IF NOT EXISTS idx_books_author ON books(author)
     """)
     
+    # ISBN barcode lookups; the expression must match BookDatabase.get_book_by_isbn
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_books_isbn ON books({ISBN_KEY})
+    """.format(ISBN_KEY=ISBN_KEY))
+    
+    # Append-only change log of catalog edits, tailed by read replicas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            book_id TEXT NOT NULL,
+            payload TEXT,
+            embedding BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
     # Create metadata table for system info
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS metadata (
@@ -100,12 +123,46 @@ def migrate_from_json(json_path: str = "meta.json", db_path: str = DB_PATH):
         raise
 
 
+CHANGE_INSERT_SQL = """
+    INSERT INTO catalog_changes (op, book_id, payload, embedding)
+    VALUES (?, ?, ?, ?)
+"""
+
+CHANGE_SELECT_SQL = """
+    SELECT seq, op, book_id, payload, embedding, created_at
+    FROM catalog_changes
+    WHERE seq > ?
+    ORDER BY seq
+    LIMIT ?
+"""
+
+
+def _embedding_to_blob(embedding: Optional[np.ndarray]) -> Optional[bytes]:
+    """Serialize an embedding as raw float32 bytes"""
+    if embedding is None:
+        return None
+    return np.asarray(embedding, dtype=np.float32).ravel().tobytes()
+
+
+def _change_from_row(row: Tuple) -> Dict:
+    """Convert a catalog_changes row to a change dict"""
+    return {
+        'seq': row[0],
+        'op': row[1],
+        'book_id': row[2],
+        'payload': json.loads(row[3]) if row[3] else None,
+        'embedding': np.frombuffer(row[4], dtype=np.float32).copy() if row[4] else None,
+        'created_at': row[5]
+    }
+
+
 class BookDatabase:
     """Async database interface for books"""
     
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
     
+    @observe_db_query
     async def get_book(self, book_id: str) -> Optional[Dict]:
         """Get a single book by ID"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -125,6 +182,54 @@ class BookDatabase:
                     }
                 return None
     
+    @observe_db_query
+    async def get_book_by_isbn(self, isbns: List[str]) -> Optional[Dict]:
+        """Get the book with any of these ISBNs (hyphen-free; uses idx_books_isbn)"""
+        if not isbns:
+            return None
+        placeholders = ", ".join("?" for _ in isbns)
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                f"SELECT book_id, title, author, isbn, publisher, image_path FROM books WHERE {ISBN_KEY} IN ({placeholders}) LIMIT 1",
+                list(isbns)
+            ) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return {
+                        'book_id': row[0],
+                        'title': row[1],
+                        'author': row[2],
+                        'isbn': row[3],
+                        'publisher': row[4],
+                        'image': row[5]
+                    }
+                return None
+    
+    @observe_db_query
+    async def get_books(self, book_ids: List[str]) -> Dict[str, Dict]:
+        """Get several books by ID in one query (book_id -> book info)"""
+        if not book_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in book_ids)
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                f"SELECT book_id, title, author, isbn, publisher, image_path FROM books WHERE book_id IN ({placeholders})",
+                list(book_ids)
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return {
+                    row[0]: {
+                        'book_id': row[0],
+                        'title': row[1],
+                        'author': row[2],
+                        'isbn': row[3],
+                        'publisher': row[4],
+                        'image': row[5]
+                    }
+                    for row in rows
+                }
+    
+    @observe_db_query
     async def get_all_books(self, limit: int = None, offset: int = 0) -> List[Dict]:
         """Get all books with optional pagination"""
         query = "SELECT book_id, title, author, isbn, publisher, image_path FROM books ORDER BY created_at DESC"
@@ -146,21 +251,33 @@ class BookDatabase:
                     for row in rows
                 ]
     
+    @observe_db_query
     async def add_book(self, book_id: str, title: str, author: str, 
-                       image_path: str, isbn: str = None, publisher: str = None) -> bool:
-        """Add a new book"""
+                       image_path: str, isbn: str = None, publisher: str = None,
+                       embedding: Optional[np.ndarray] = None) -> bool:
+        """Add a new book (and record it in the change log)"""
+        embedding_blob = _embedding_to_blob(embedding)
+        payload = {
+            'title': title,
+            'author': author,
+            'isbn': isbn,
+            'publisher': publisher,
+            'image_path': image_path
+        }
         try:
             async with aiosqlite.connect(self.db_path) as db:
                 await db.execute("""
-                    INSERT INTO books (book_id, title, author, isbn, publisher, image_path)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (book_id, title, author, isbn, publisher, image_path))
+                    INSERT INTO books (book_id, title, author, isbn, publisher, image_path, embedding_vector)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (book_id, title, author, isbn, publisher, image_path, embedding_blob))
+                await db.execute(CHANGE_INSERT_SQL, ('add', book_id, json.dumps(payload), embedding_blob))
                 await db.commit()
                 return True
         except Exception as e:
             logger.error(f"Failed to add book {book_id}: {e}")
             return False
     
+    @observe_db_query
     async def update_book(self, book_id: str, **kwargs) -> bool:
         """Update book metadata"""
         allowed_fields = ['title', 'author', 'isbn', 'publisher', 'image_path']
@@ -178,23 +295,43 @@ class BookDatabase:
                     f"UPDATE books SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE book_id = ?",
                     values
                 )
+                await db.execute(CHANGE_INSERT_SQL, ('update', book_id, json.dumps(updates), None))
                 await db.commit()
                 return True
         except Exception as e:
             logger.error(f"Failed to update book {book_id}: {e}")
             return False
     
+    @observe_db_query
     async def delete_book(self, book_id: str) -> bool:
         """Delete a book"""
         try:
             async with aiosqlite.connect(self.db_path) as db:
                 await db.execute("DELETE FROM books WHERE book_id = ?", (book_id,))
+                await db.execute(CHANGE_INSERT_SQL, ('delete', book_id, None, None))
                 await db.commit()
                 return True
         except Exception as e:
             logger.error(f"Failed to delete book {book_id}: {e}")
             return False
     
+    @observe_db_query
+    async def get_changes_since(self, since: int, limit: int = 500) -> List[Dict]:
+        """Get change log entries with seq > since, oldest first"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(CHANGE_SELECT_SQL, (since, limit)) as cursor:
+                rows = await cursor.fetchall()
+                return [_change_from_row(row) for row in rows]
+    
+    @observe_db_query
+    async def get_change_head(self) -> int:
+        """Get the newest change log sequence number (0 if empty)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("SELECT COALESCE(MAX(seq), 0) FROM catalog_changes") as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else 0
+    
+    @observe_db_query
     async def count_books(self) -> int:
         """Get total number of books"""
         async with aiosqlite.connect(self.db_path) as db:
@@ -202,6 +339,7 @@ class BookDatabase:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
     
+    @observe_db_query
     async def search_books(self, query: str, limit: int = 10) -> List[Dict]:
         """Search books by title or author"""
         search_query = f"%{query}%"
@@ -261,15 +399,128 @@ def get_book_ids_sync(db_path: str = DB_PATH) -> List[str]:
     """Get all book IDs synchronously"""
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    cursor.execute("SELECT book_id FROM books ORDER BY created_at")
+    cursor.execute("SELECT book_id FROM books ORDER BY created_at, rowid")
     book_ids = [row[0] for row in cursor.fetchall()]
     conn.close()
     return book_ids
 
 
-# Initialize database on module import
-try:
-    initialize_database()
-except Exception as e:
-    logger.error(f"Failed to initialize database: {e}")
+def get_book_embeddings_sync(db_path: str = DB_PATH) -> List[Tuple[str, Optional[np.ndarray]]]:
+    """Get (book_id, stored embedding or None) for every book, in get_book_ids_sync() order"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT book_id, embedding_vector FROM books ORDER BY created_at, rowid")
+        return [
+            (row[0], np.frombuffer(row[1], dtype=np.float32).copy() if row[1] else None)
+            for row in cursor.fetchall()
+        ]
+    finally:
+        conn.close()
+
+
+def get_changes_since_sync(since: int, limit: int = 500, db_path: str = DB_PATH) -> List[Dict]:
+    """
+    Read change log entries with seq > since (read-only, safe on a leader's file)
+    """
+    conn = sqlite3.connect(f"file:{Path(db_path).resolve()}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CHANGE_SELECT_SQL, (since, limit))
+        return [_change_from_row(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def get_change_head_sync(db_path: str = DB_PATH) -> int:
+    """Get the newest change log sequence number synchronously (0 if empty)"""
+    conn = sqlite3.connect(f"file:{Path(db_path).resolve()}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM catalog_changes")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
 
+def apply_changes_sync(changes: List[Dict], db_path: str = DB_PATH) -> int:
+    """
+    Apply replicated change log entries to a follower database
+    
+    Each entry is copied into the local change log with the leader's seq in
+    the same transaction as the book mutation, so the local MAX(seq) is
+    always the replication position. Already-applied entries are skipped.
+    
+    Returns:
+        Number of entries applied
+    """
+    conn = sqlite3.connect(db_path)
+    applied = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM catalog_changes")
+        position = cursor.fetchone()[0]
+        
+        for change in changes:
+            if change['seq'] <= position:
+                continue
+            
+            book_id = change['book_id']
+            payload = change['payload'] or {}
+            embedding_blob = _embedding_to_blob(change['embedding'])
+            
+            if change['op'] == 'add':
+                cursor.execute("""
+                    INSERT OR REPLACE INTO books
+                    (book_id, title, author, isbn, publisher, image_path, embedding_vector, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, (
+                    book_id,
+                    payload.get('title', ''),
+                    payload.get('author', ''),
+                    payload.get('isbn'),
+                    payload.get('publisher'),
+                    payload.get('image_path', ''),
+                    embedding_blob,
+                    change.get('created_at')
+                ))
+            elif change['op'] == 'update':
+                allowed_fields = ['title', 'author', 'isbn', 'publisher', 'image_path']
+                updates = {k: v for k, v in payload.items() if k in allowed_fields}
+                if embedding_blob is not None:
+                    updates['embedding_vector'] = embedding_blob
+                if updates:
+                    set_clause = ", ".join(f"{k} = ?" for k in updates.keys())
+                    cursor.execute(
+                        f"UPDATE books SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE book_id = ?",
+                        list(updates.values()) + [book_id]
+                    )
+            elif change['op'] == 'delete':
+                cursor.execute("DELETE FROM books WHERE book_id = ?", (book_id,))
+            elif change['op'] == 'snapshot':
+                pass  # Position marker left by a snapshot restore
+            else:
+                logger.warning(f"Unknown change op {change['op']!r} at seq {change['seq']}")
+            
+            cursor.execute("""
+                INSERT INTO catalog_changes (seq, op, book_id, payload, embedding, created_at)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, (
+                change['seq'],
+                change['op'],
+                book_id,
+                json.dumps(change['payload']) if change['payload'] is not None else None,
+                embedding_blob,
+                change.get('created_at')
+            ))
+            position = change['seq']
+            applied += 1
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    return applied
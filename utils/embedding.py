@@ -1,6 +1,7 @@
 import cv2, numpy as np, onnxruntime as ort
+from .runtime import onnx_session_options
 
-session = ort.InferenceSession("models/mobilenet.onnx")
+session = ort.InferenceSession("models/mobilenet.onnx", sess_options=onnx_session_options())
 
 def get_embedding(img):
     img = cv2.resize(img, (224, 224))
@@ -1,26 +1,42 @@
 """
 Enhanced embedding module with CLIP support and better preprocessing
+torch and transformers are imported when a model is first loaded, and cv2
+when an image is first preprocessed, so importing this module stays cheap
 """
-import cv2
 import numpy as np
 from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 import logging
 
+if TYPE_CHECKING:
+    from transformers import CLIPModel, CLIPProcessor
+
+from . import model_store
+from .timing import span
+
 logger = logging.getLogger(__name__)
 
 # Global model instances (loaded once)
-_clip_model: Optional[CLIPModel] = None
-_clip_processor: Optional[CLIPProcessor] = None
+_clip_model: Optional["CLIPModel"] = None
+_clip_processor: Optional["CLIPProcessor"] = None
 _device: Optional[str] = None
+_inference_client = None  # Set by use_inference_server()
 
+DEFAULT_CLIP_MODEL = "openai/clip-vit-base-patch32"
 
-def initialize_clip_model(model_name: str = "openai/clip-vit-base-patch32"):
+
+def initialize_clip_model(model_name: str = DEFAULT_CLIP_MODEL, store_dir: Optional[str] = None):
     """
     Initialize CLIP model globally (called once at startup)
     Using ViT-B/32 for balance between accuracy and speed on CPU
+    
+    Loads the exported vision tower from the local model store when there
+    is one (offline, checksummed, see export_model.py), otherwise the full
+    checkpoint through Hugging Face.
+    
+    Args:
+        model_name: Hugging Face model id
+        store_dir: Artifact directory (default: model_store.store_dir_for(model_name))
     """
     global _clip_model, _clip_processor, _device
     
@@ -28,13 +44,24 @@ def initialize_clip_model(model_name: str = "openai/clip-vit-base-patch32"):
         logger.info("CLIP model already initialized")
         return
     
+    import torch
+    from transformers import CLIPModel, CLIPProcessor
+    
+    store_dir = store_dir or model_store.store_dir_for(model_name)
     try:
-        logger.info(f"Loading CLIP model: {model_name}")
         _device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Using device: {_device}")
         
-        _clip_model = CLIPModel.from_pretrained(model_name).to(_device)
-        _clip_processor = CLIPProcessor.from_pretrained(model_name)
+        if model_store.has_artifact(store_dir):
+            logger.info(f"Loading CLIP vision model {model_name} from {store_dir}")
+            artifact = model_store.load_vision_model(store_dir, expected_model_id=model_name)
+            _clip_model = artifact.model.to(_device)
+            _clip_processor = artifact.processor
+        else:
+            logger.info(f"Loading CLIP model: {model_name} (no artifact in {store_dir}; "
+                        f"run export_model.py once to load offline)")
+            _clip_model = CLIPModel.from_pretrained(model_name).to(_device)
+            _clip_processor = CLIPProcessor.from_pretrained(model_name)
         
         # Set to eval mode and disable gradients for inference
         _clip_model.eval()
@@ -46,6 +73,27 @@ def initialize_clip_model(model_name: str = "openai/clip-vit-base-patch32"):
         raise
 
 
+def initialize_offline_clip_model(seed: int = 0):
+    """
+    Install a randomly initialized ViT-B/32 CLIP (no download, no weights)
+    
+    Same architecture and preprocessing as the real model, so timings are
+    representative; embeddings are meaningless. Used by benchmarks.
+    """
+    global _clip_model, _clip_processor, _device
+    import torch
+    from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel
+    
+    torch.manual_seed(seed)
+    _device = "cpu"
+    _clip_model = CLIPModel(CLIPConfig()).to(_device)
+    _clip_model.eval()
+    # CLIPImageProcessor defaults match openai/clip-vit-base-patch32
+    _clip_processor = CLIPImageProcessor()
+    torch.set_grad_enabled(False)
+    logger.info("Using randomly initialized CLIP ViT-B/32 (offline)")
+
+
 def preprocess_image(img: np.ndarray) -> Image.Image:
     """
     Enhanced image preprocessing for better recognition
@@ -56,6 +104,8 @@ def preprocess_image(img: np.ndarray) -> Image.Image:
     Returns:
         PIL Image ready for CLIP processing
     """
+    import cv2
+
     # Convert BGR to RGB
     img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     
@@ -72,6 +122,90 @@ def preprocess_image(img: np.ndarray) -> Image.Image:
     return pil_img
 
 
+def initialize_clip_processor(model_name: str = DEFAULT_CLIP_MODEL):
+    """
+    Load only the CLIP preprocessing config (no weights)
+    
+    For processes that preprocess locally but run the forward pass on a
+    shared inference server (see use_inference_server)
+    """
+    global _clip_processor
+    from transformers import CLIPImageProcessor
+    
+    if _clip_processor is None:
+        store_dir = model_store.store_dir_for(model_name)
+        if model_store.has_artifact(store_dir):
+            _clip_processor = model_store.load_processor(store_dir)
+        else:
+            _clip_processor = CLIPImageProcessor.from_pretrained(model_name)
+        logger.info(f"Loaded CLIP preprocessing for {model_name}")
+
+
+def use_inference_server(client):
+    """
+    Send forward passes to a shared inference server instead of a local model
+    
+    Args:
+        client: Object with embed(pixel_values) -> (N, d) embeddings, e.g.
+            utils.inference.InferenceClient (None = use the local model)
+    """
+    global _inference_client
+    _inference_client = client
+
+
+def preprocess_batch(imgs: List[np.ndarray]) -> np.ndarray:
+    """
+    Turn images into the CLIP input tensor
+    
+    Args:
+        imgs: List of OpenCV images (BGR format)
+    
+    Returns:
+        (N, 3, 224, 224) float32 pixel values
+    """
+    if _clip_processor is None:
+        raise RuntimeError("CLIP model not initialized. Call initialize_clip_model() first.")
+    
+    with span("preprocess"):
+        pil_imgs = [preprocess_image(img) for img in imgs]
+        pixel_values = _clip_processor(images=pil_imgs, return_tensors="np")["pixel_values"]
+    
+    return pixel_values.astype(np.float32, copy=False)
+
+
+def embed_pixels(pixel_values: np.ndarray) -> np.ndarray:
+    """
+    Forward pass over preprocessed pixels (local model or inference server)
+    
+    Args:
+        pixel_values: (N, 3, 224, 224) float32 tensor from preprocess_batch
+    
+    Returns:
+        (N, 512) array of normalized embeddings
+    """
+    if _inference_client is not None:
+        with span("forward"):
+            return _inference_client.embed(pixel_values)
+    
+    if _clip_model is None:
+        raise RuntimeError("CLIP model not initialized. Call initialize_clip_model() first.")
+    
+    import torch
+    
+    with span("forward"), torch.no_grad():
+        pixels = torch.from_numpy(pixel_values).to(_device)
+        if hasattr(_clip_model, "get_image_features"):
+            image_features = _clip_model.get_image_features(pixel_values=pixels)
+        else:
+            # Vision tower only (model store): same projection, no text model
+            image_features = _clip_model(pixel_values=pixels).image_embeds
+    
+    embeddings = image_features.cpu().numpy()
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    return embeddings.astype(np.float32)
+
+
 def get_clip_embedding(img: np.ndarray) -> np.ndarray:
     """
     Get CLIP visual embedding from an image
@@ -82,24 +216,23 @@ def get_clip_embedding(img: np.ndarray) -> np.ndarray:
     Returns:
         Normalized embedding vector (512-dim for ViT-B/32)
     """
-    if _clip_model is None or _clip_processor is None:
-        raise RuntimeError("CLIP model not initialized. Call initialize_clip_model() first.")
-    
-    # Preprocess image
-    pil_img = preprocess_image(img)
-    
-    # Process through CLIP
-    inputs = _clip_processor(images=pil_img, return_tensors="pt")
-    inputs = {k: v.to(_device) for k, v in inputs.items()}
+    return embed_pixels(preprocess_batch([img]))[0]
+
+
+def get_clip_embeddings_batch(imgs: List[np.ndarray]) -> np.ndarray:
+    """
+    Get CLIP visual embeddings for several images in one forward pass
     
-    with torch.no_grad():
-        image_features = _clip_model.get_image_features(**inputs)
+    Args:
+        imgs: List of OpenCV images (BGR format)
     
-    # Normalize embedding (for cosine similarity)
-    embedding = image_features.cpu().numpy()[0]
-    embedding = embedding / np.linalg.norm(embedding)
+    Returns:
+        (N, 512) array of normalized embeddings, one row per image
+    """
+    if not imgs:
+        return np.empty((0, 0), dtype=np.float32)
     
-    return embedding.astype(np.float32)
+    return embed_pixels(preprocess_batch(imgs))
 
 
 def get_embedding(img: np.ndarray, use_clip: bool = True) -> np.ndarray:
@@ -147,6 +280,8 @@ def assess_image_quality(img: np.ndarray) -> Tuple[bool, str]:
     Returns:
         Tuple of (is_acceptable, reason)
     """
+    import cv2
+
     h, w = img.shape[:2]
     
     # Check minimum resolution
@@ -170,8 +305,14 @@ def assess_image_quality(img: np.ndarray) -> Tuple[bool, str]:
 # Backward compatibility
 __all__ = [
     'initialize_clip_model',
+    'initialize_offline_clip_model',
+    'initialize_clip_processor',
+    'use_inference_server',
+    'preprocess_batch',
+    'embed_pixels',
     'get_embedding',
     'get_clip_embedding',
+    'get_clip_embeddings_batch',
     'compute_similarity',
     'assess_image_quality',
     'preprocess_image'
@@ -0,0 +1,484 @@
+"""
+Shared inference server: one process owns CLIP and batches across workers
+HTTP workers preprocess images themselves and hand the pixel tensors over via
+a shared-memory slab (or inline on the Unix socket); the server groups
+requests from every worker into one forward pass
+"""
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .shm_slab import SlabExhausted, TensorSlab
+
+logger = logging.getLogger(__name__)
+
+# Frame: header length and payload length (network order), JSON header, raw payload
+_FRAME = struct.Struct("!II")
+MAX_HEADER_BYTES = 64 * 1024
+
+DEFAULT_MAX_BATCH = 16  # Images per forward pass
+DEFAULT_MAX_WAIT_MS = 5.0  # How long the first request of a batch waits for company
+
+
+class InferenceUnavailable(RuntimeError):
+    """Raised when the inference server cannot be reached"""
+
+
+class _StaleSlab(RuntimeError):
+    """The server no longer serves the slab a request referred to (it restarted)"""
+
+
+def _encode_frame(header: Dict, payload_len: int = 0) -> bytes:
+    body = json.dumps(header).encode()
+    return _FRAME.pack(len(body), payload_len) + body
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytearray:
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Inference server closed the connection")
+        received += count
+    return buffer
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[Dict, bytes]:
+    header_len, payload_len = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    if header_len > MAX_HEADER_BYTES:
+        raise ValueError(f"Frame header too large ({header_len} bytes)")
+    header = json.loads(await reader.readexactly(header_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+class _Job:
+    """One embed request waiting for a forward pass (inline pixels or slab slots)"""
+
+    __slots__ = ("pixels", "slots", "size", "future", "enqueued")
+
+    def __init__(self, future: asyncio.Future, pixels: Optional[np.ndarray] = None,
+                 slots: Optional[List[int]] = None):
+        self.pixels = pixels
+        self.slots = slots
+        self.size = len(slots) if slots is not None else len(pixels)
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class InferenceServer:
+    """
+    Unix socket server running one micro-batching loop over a model
+
+    Requests carry already-preprocessed pixel tensors. The first queued
+    request waits up to `max_wait_ms` for others (from any worker) to join,
+    then up to `max_batch` images go through `embed_fn` together. Forward
+    passes run one at a time on a dedicated thread, so requests arriving
+    during a pass form the next batch without any extra wait.
+
+    With a `slab`, clients write pixels into shared memory and send only
+    slot indices; a batch over consecutive slots is passed to the model
+    as a view of the slab, without copying.
+    """
+
+    def __init__(self, socket_path: str, embed_fn: Callable[[np.ndarray], np.ndarray],
+                 max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 slab: Optional[TensorSlab] = None):
+        self.socket_path = socket_path
+        self.embed_fn = embed_fn
+        self.slab = slab
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._carry: Optional[_Job] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="forward")
+        self.started = time.time()
+
+        self.connections = 0
+        self.requests = 0
+        self.images = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.errors = 0
+        self.slab_requests = 0
+        self.inline_requests = 0
+        self.forward_time = 0.0
+        self.queue_time = 0.0
+
+    async def serve(self):
+        """Listen on the socket and batch forever"""
+        self._queue = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Stale socket from a previous run
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(
+            f"Inference server listening on {self.socket_path} "
+            f"(max_batch={self.max_batch}, max_wait={self.max_wait * 1000:g}ms)"
+        )
+        batcher = asyncio.create_task(self._batch_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    header, payload = await _read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                # Requests on one connection may be pipelined; reply as they finish
+                task = asyncio.create_task(self._answer(header, payload, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except Exception as e:
+            logger.warning(f"Dropping inference connection: {e}")
+        finally:
+            self.connections -= 1
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, header: Dict, payload: bytes, writer: asyncio.StreamWriter,
+                      write_lock: asyncio.Lock):
+        reply: Dict = {"id": header.get("id")}
+        result: Optional[np.ndarray] = None
+        try:
+            op = header.get("op")
+            if op == "embed" and "slots" in header:
+                if self.slab is None or header.get("slab") != self.slab.name:
+                    reply.update(error="Unknown slab", code="stale_slab")
+                else:
+                    self.slab_requests += 1
+                    result = await self.submit(slots=header["slots"])
+            elif op == "embed":
+                self.inline_requests += 1
+                pixels = np.frombuffer(payload, dtype=header["dtype"]).reshape(header["shape"])
+                result = await self.submit(pixels)
+            elif op == "slab":
+                reply["slab"] = self.slab.describe() if self.slab is not None else None
+            elif op == "stats":
+                reply["stats"] = self.stats()
+            else:
+                reply["error"] = f"Unknown op {op!r}"
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Inference request failed: {e}", exc_info=True)
+            reply["error"] = str(e)
+
+        if result is not None:
+            reply.update(shape=list(result.shape), dtype=str(result.dtype))
+        data = result.tobytes() if result is not None else b""
+        async with write_lock:
+            writer.write(_encode_frame(reply, len(data)))
+            if data:
+                writer.write(data)
+            await writer.drain()
+
+    async def submit(self, pixels: Optional[np.ndarray] = None,
+                     slots: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Queue work for the next batch
+
+        Args:
+            pixels: (N, 3, H, W) tensor sent inline
+            slots: Or: N slab slots already holding the pixels
+
+        Returns:
+            (N, d) embeddings
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Job(future, pixels=pixels, slots=slots))
+        return await future
+
+    async def _next_batch(self) -> List[_Job]:
+        """Wait for work, then gather more until the batch is full or max_wait passes"""
+        loop = asyncio.get_running_loop()
+        job, self._carry = self._carry or await self._queue.get(), None
+        jobs, count = [job], job.size
+        deadline = loop.time() + self.max_wait
+
+        while count < self.max_batch:
+            try:
+                job = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if count + job.size > self.max_batch:
+                # Would overflow the batch: it starts the next one instead
+                self._carry = job
+                break
+            jobs.append(job)
+            count += job.size
+        return jobs
+
+    def _assemble(self, jobs: List[_Job]) -> np.ndarray:
+        """One (N, 3, H, W) input for the batch, copying only when unavoidable"""
+        if all(job.slots is not None for job in jobs):
+            return self.slab.batch([slot for job in jobs for slot in job.slots])
+        # Each job is copied straight into its rows of one new array (which also
+        # gives torch a writable array; request payloads are read-only bytes).
+        # Not slab.batch() per job: every call reuses the same gather buffer.
+        first = jobs[0]
+        shape = first.pixels.shape[1:] if first.slots is None else self.slab.slot_shape
+        pixels = np.empty((sum(job.size for job in jobs), *shape), dtype=np.float32)
+        offset = 0
+        for job in jobs:
+            rows = pixels[offset:offset + job.size]
+            if job.slots is None:
+                rows[...] = job.pixels
+            else:
+                self.slab.gather(job.slots, rows)
+            offset += job.size
+        return pixels
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [job for job in await self._next_batch() if not job.future.done()]
+            if not jobs:
+                continue
+            started = time.perf_counter()
+            try:
+                pixels = self._assemble(jobs)
+                embeddings = await loop.run_in_executor(self._executor, self.embed_fn, pixels)
+            except Exception as e:
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                continue
+
+            self.forward_time += time.perf_counter() - started
+            self.batches += 1
+            self.requests += len(jobs)
+            self.images += len(pixels)
+            self.max_batch_seen = max(self.max_batch_seen, len(pixels))
+            offset = 0
+            for job in jobs:
+                self.queue_time += started - job.enqueued
+                rows = job.size
+                if not job.future.done():
+                    job.future.set_result(embeddings[offset:offset + rows])
+                offset += rows
+
+    def stats(self) -> Dict:
+        """Counters for /health"""
+        return {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started, 1),
+            "connections": self.connections,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "images": self.images,
+            "batches": self.batches,
+            "errors": self.errors,
+            "slab_requests": self.slab_requests,
+            "inline_requests": self.inline_requests,
+            "slab": (
+                {"name": self.slab.name, "slots": self.slab.slots, "in_use": self.slab.in_use}
+                if self.slab is not None else None
+            ),
+            "mean_batch_size": round(self.images / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "mean_forward_ms": round(self.forward_time / self.batches * 1000, 1) if self.batches else 0.0,
+            "mean_queue_ms": round(self.queue_time / self.requests * 1000, 1) if self.requests else 0.0
+        }
+
+
+class InferenceClient:
+    """
+    Blocking client for InferenceServer, safe to share across threads
+
+    Each thread keeps its own connection (opened lazily, so a client created
+    before fork() is fine), and the server batches across all of them.
+
+    When the server offers a slab, pixels are written into shared memory
+    slots and only the slot indices are sent. If no slots free up within
+    `slab_timeout`, the request waits no longer and sends its pixels
+    inline instead.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0,
+                 use_slab: bool = True, slab_timeout: float = 0.5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.use_slab = use_slab
+        self.slab_timeout = slab_timeout
+        self._local = threading.local()
+        self._next_id = 0
+        self._slab: Optional[TensorSlab] = None
+        self._slab_pid: Optional[int] = None
+        self._slab_lock = threading.Lock()
+
+        self.slab_requests = 0
+        self.inline_requests = 0
+        self.slab_fallbacks = 0
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None or getattr(self._local, "pid", None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                raise InferenceUnavailable(f"Inference server at {self.socket_path} unavailable: {e}")
+            self._local.sock, self._local.pid = sock, os.getpid()
+        return sock
+
+    def _disconnect(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _call(self, header: Dict, payload: Optional[np.ndarray] = None) -> Tuple[Dict, bytearray]:
+        self._next_id += 1
+        header = dict(header, id=self._next_id)
+        payload_len = payload.nbytes if payload is not None else 0
+
+        # One retry on a fresh connection covers a server restart between calls
+        for attempt in (1, 2):
+            sock = self._connection()
+            try:
+                sock.sendall(_encode_frame(header, payload_len))
+                if payload_len:
+                    sock.sendall(memoryview(payload).cast("B"))
+                header_len, reply_len = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+                reply = json.loads(_recv_exact(sock, header_len))
+                data = _recv_exact(sock, reply_len) if reply_len else bytearray()
+                break
+            except (OSError, ConnectionError) as e:
+                self._disconnect()
+                if attempt == 2 or isinstance(e, socket.timeout):
+                    raise InferenceUnavailable(f"Inference request failed: {e}")
+
+        if reply.get("code") == "stale_slab":
+            raise _StaleSlab(reply["error"])
+        if reply.get("error"):
+            raise RuntimeError(f"Inference server error: {reply['error']}")
+        return reply, data
+
+    def _get_slab(self) -> Optional[TensorSlab]:
+        """This process's mapping of the server's slab (attached on first use)"""
+        if not self.use_slab:
+            return None
+        with self._slab_lock:
+            if self._slab_pid != os.getpid():
+                # First use in this process (or after fork): map it ourselves;
+                # an inherited lock descriptor would be shared with the parent
+                self._slab = None
+                reply, _ = self._call({"op": "slab"})
+                if reply.get("slab"):
+                    try:
+                        self._slab = TensorSlab.attach(reply["slab"])
+                        logger.info(f"Attached to tensor slab {self._slab.name} ({self._slab.slots} slots)")
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Cannot map tensor slab {reply['slab']['name']}: {e}; sending pixels inline")
+                self._slab_pid = os.getpid()
+            return self._slab
+
+    def _drop_slab(self):
+        with self._slab_lock:
+            if self._slab is not None and self._slab_pid == os.getpid():
+                self._slab.close()
+            self._slab, self._slab_pid = None, None
+
+    def _embed_via_slab(self, slab: TensorSlab, pixel_values: np.ndarray) -> Optional[np.ndarray]:
+        try:
+            slots = slab.allocate(len(pixel_values), timeout=self.slab_timeout)
+        except SlabExhausted as e:
+            self.slab_fallbacks += 1
+            logger.warning(f"{e}; sending pixels inline")
+            return None
+        try:
+            slab.write(slots, pixel_values)
+            reply, data = self._call({"op": "embed", "slab": slab.name, "slots": slots})
+        finally:
+            slab.free(slots)
+        self.slab_requests += 1
+        return np.frombuffer(data, dtype=reply["dtype"]).reshape(reply["shape"])
+
+    def embed(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        Embed preprocessed pixels on the server
+
+        Args:
+            pixel_values: (N, 3, H, W) float32 tensor from the CLIP processor
+
+        Returns:
+            (N, d) float32 normalized embeddings
+        """
+        pixel_values = np.ascontiguousarray(pixel_values, dtype=np.float32)
+
+        for attempt in (1, 2):
+            slab = self._get_slab()
+            if slab is None or pixel_values.shape[1:] != slab.slot_shape:
+                break
+            try:
+                result = self._embed_via_slab(slab, pixel_values)
+            except _StaleSlab:
+                # Server restarted with a new slab: map that one and retry
+                self._drop_slab()
+                continue
+            if result is not None:
+                return result
+            break
+
+        self.inline_requests += 1
+        reply, data = self._call(
+            {"op": "embed", "shape": list(pixel_values.shape), "dtype": "float32"}, pixel_values
+        )
+        return np.frombuffer(data, dtype=reply["dtype"]).reshape(reply["shape"])
+
+    def stats(self) -> Dict:
+        """The server's batching counters, plus this process's transfer counters"""
+        reply, _ = self._call({"op": "stats"})
+        slab = self._slab if self._slab_pid == os.getpid() else None
+        return {
+            **reply["stats"],
+            "client": {
+                "pid": os.getpid(),
+                "slab_requests": self.slab_requests,
+                "inline_requests": self.inline_requests,
+                "slab_fallbacks": self.slab_fallbacks,
+                "slab": slab.stats() if slab is not None else None
+            }
+        }
+
+
+__all__ = [
+    'InferenceClient',
+    'InferenceServer',
+    'InferenceUnavailable',
+    'DEFAULT_MAX_BATCH',
+    'DEFAULT_MAX_WAIT_MS'
+]
@@ -0,0 +1,418 @@
+"""
+Streaming image ingestion for the upload endpoints
+Request bodies are parsed chunk by chunk as they arrive: size limits are
+enforced while reading, payloads that are not images are refused from their
+first bytes, and the image lands in a pooled buffer the decoder reads in place
+"""
+import binascii
+import re
+import threading
+import cv2
+import numpy as np
+from typing import Dict, List, Optional
+import logging
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024  # Default limit for one image
+SNIFF_BYTES = 12  # Leading bytes needed to recognize every supported format
+PART_OVERHEAD = 16 * 1024  # Multipart boundary and headers allowed per file on top of its data
+JSON_OVERHEAD = 64 * 1024  # JSON around the base64 string (other keys, whitespace)
+
+# Formats cv2.imdecode reads, by leading bytes
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff")
+)
+SUPPORTED_FORMATS = "JPEG, PNG, WebP, BMP or TIFF"
+
+# Rejection reasons (UploadRejected.reason, metric label)
+TOO_LARGE = "too_large"
+NOT_AN_IMAGE = "not_an_image"
+MALFORMED = "malformed"
+TOO_MANY_FILES = "too_many_files"
+
+
+class UploadRejected(Exception):
+    """An upload refused while it was being received"""
+
+    def __init__(self, status_code: int, detail: str, reason: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.reason = reason
+
+
+def _too_large(max_bytes: int) -> UploadRejected:
+    return UploadRejected(413, f"File too large (max {max_bytes // (1024 * 1024)}MB)", TOO_LARGE)
+
+
+def _not_an_image() -> UploadRejected:
+    return UploadRejected(415, f"Not an image (expected {SUPPORTED_FORMATS})", NOT_AN_IMAGE)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Image format from the first SNIFF_BYTES of a file, None if unsupported"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+class BufferPool:
+    """
+    Receive buffers reused across requests
+
+    Buffers keep their capacity between uploads, so steady traffic stops
+    allocating once the pool is warm. Buffers grown past `max_buffer_bytes`
+    are dropped on release so one huge upload does not pin its memory.
+    """
+
+    def __init__(self, max_buffers: int = 8, max_buffer_bytes: int = 8 * 1024 * 1024):
+        self.max_buffers = max_buffers
+        self.max_buffer_bytes = max_buffer_bytes
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.allocated += 1
+        return bytearray()
+
+    def release(self, buffer: bytearray):
+        if len(buffer) > self.max_buffer_bytes:
+            return
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buffer)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "pooled_buffers": len(self._free),
+                "pooled_bytes": sum(len(b) for b in self._free),
+                "buffers_allocated": self.allocated,
+                "buffers_reused": self.reused
+            }
+
+
+class ImagePayload:
+    """
+    One image being received into a pooled buffer
+
+    write() enforces the size limit and checks the format as soon as the
+    first SNIFF_BYTES are in; decode() reads the buffer in place and hands it
+    back to the pool. A payload that failed keeps its error and ignores
+    further data (batch uploads report it per file).
+    """
+
+    def __init__(self, pool: BufferPool, max_bytes: int = MAX_IMAGE_BYTES, filename: Optional[str] = None):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.kind: Optional[str] = None
+        self.error: Optional[UploadRejected] = None
+        self._pool = pool
+        self._buffer: Optional[bytearray] = pool.acquire()
+
+    def write(self, chunk):
+        """Append a chunk (bytes or memoryview); raises UploadRejected"""
+        if self.error is not None:
+            return
+        end = self.size + len(chunk)
+        if end > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        # Overwrites the previous upload's bytes in place, grows only past them
+        self._buffer[self.size:end] = chunk
+        self.size = end
+        if self.kind is None and self.size >= SNIFF_BYTES:
+            self._sniff()
+
+    def finish(self):
+        """End of data: files shorter than SNIFF_BYTES are checked here"""
+        if self.error is None and self.kind is None:
+            self._sniff()
+
+    def fail(self, error: UploadRejected):
+        self.error = error
+        self.release()
+
+    def _sniff(self):
+        self.kind = sniff_image_type(bytes(self._buffer[:min(self.size, SNIFF_BYTES)]))
+        if self.kind is None:
+            raise _not_an_image()
+
+    def decode(self, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """cv2.imdecode straight from the buffer; None if the data is corrupt"""
+        if self._buffer is None:
+            return None
+        try:
+            return cv2.imdecode(np.frombuffer(self._buffer, np.uint8, count=self.size), flags)
+        finally:
+            self.release()
+
+    def release(self):
+        if self._buffer is not None:
+            self._pool.release(self._buffer)
+            self._buffer = None
+
+
+def _check_content_length(request, limit: int, max_bytes: int):
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise _too_large(max_bytes)
+
+
+class _MultipartImages:
+    """python-multipart callbacks collecting the file parts of one form field"""
+
+    def __init__(self, field: str, max_files: int, max_bytes: int, pool: BufferPool, per_file_errors: bool):
+        self.field = field
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.pool = pool
+        self.per_file_errors = per_file_errors
+        self.files: List[ImagePayload] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._current: Optional[ImagePayload] = None
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._current = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("utf-8", "replace") != self.field:
+            return  # Other form fields are skipped (they still count toward the body limit)
+        if len(self.files) >= self.max_files:
+            detail = "Expected one file" if self.max_files == 1 else f"Too many files (max {self.max_files} per batch)"
+            raise UploadRejected(400, detail, TOO_MANY_FILES)
+        filename = options.get(b"filename")
+        self._current = ImagePayload(
+            self.pool, self.max_bytes,
+            filename.decode("utf-8", "replace") if filename is not None else None
+        )
+        self.files.append(self._current)
+
+    def _guard(self, action, *args):
+        try:
+            action(*args)
+        except UploadRejected as e:
+            if not self.per_file_errors:
+                raise
+            self._current.fail(e)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._current is not None:
+            self._guard(self._current.write, memoryview(data)[start:end])
+
+    def on_part_end(self):
+        if self._current is not None:
+            self._guard(self._current.finish)
+        self._current = None
+
+    def release(self):
+        for payload in self.files:
+            payload.release()
+
+
+async def _read_multipart(request, field: str, max_files: int, max_bytes: int,
+                          pool: BufferPool, per_file_errors: bool) -> List[ImagePayload]:
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(415, "Expected a multipart/form-data upload", MALFORMED)
+
+    body_limit = max_files * (max_bytes + PART_OVERHEAD)
+    _check_content_length(request, body_limit, max_bytes)
+
+    form = _MultipartImages(field, max_files, max_bytes, pool, per_file_errors)
+    parser = MultipartParser(boundary, form.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise _too_large(max_bytes)
+            try:
+                parser.write(chunk)
+            except UploadRejected:
+                raise
+            except Exception as e:
+                raise UploadRejected(400, f"Malformed multipart body: {e}", MALFORMED)
+    except BaseException:
+        form.release()
+        raise
+
+    if not form.files:
+        raise UploadRejected(422, f"No file in form field '{field}'", MALFORMED)
+    return form.files
+
+
+async def read_image_upload(request, field: str = "file", max_bytes: int = MAX_IMAGE_BYTES,
+                            pool: Optional[BufferPool] = None) -> ImagePayload:
+    """
+    Receive the single image of a multipart/form-data upload
+
+    Args:
+        request: Starlette request whose body has not been read yet
+        field: Form field holding the file
+        max_bytes: Largest file accepted; larger ones are refused mid-upload
+        pool: Buffer pool (default: the module's shared pool)
+
+    Returns:
+        The received image, ready for decode()
+
+    Raises:
+        UploadRejected: too large (413), not an image (415), malformed (400/422)
+    """
+    files = await _read_multipart(request, field, 1, max_bytes, pool or shared_pool, False)
+    return files[0]
+
+
+async def read_image_uploads(request, field: str = "files", max_files: int = 32,
+                             max_bytes: int = MAX_IMAGE_BYTES,
+                             pool: Optional[BufferPool] = None) -> List[ImagePayload]:
+    """
+    Receive every image of a multi-file multipart/form-data upload
+
+    A file that is too large or not an image does not fail the request: its
+    payload carries the error and the rest of its data is skipped. Too many
+    files or a body larger than max_files full-size images still raise.
+
+    Returns:
+        Payloads in upload order, each with either data or `error`
+    """
+    return await _read_multipart(request, field, max_files, max_bytes, pool or shared_pool, True)
+
+
+def _clean_base64(text: bytes) -> bytes:
+    """Drop the JSON escapes a base64 string can legally contain (\\/ and line breaks)"""
+    if b"\\" in text:
+        text = text.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"")
+        if b"\\" in text:
+            raise UploadRejected(400, "Invalid base64 image data", MALFORMED)
+    return text
+
+
+async def read_base64_image(request, field: str = "image", max_bytes: int = MAX_IMAGE_BYTES,
+                            pool: Optional[BufferPool] = None) -> ImagePayload:
+    """
+    Receive a JSON body {"<field>": "<base64 image>"} without buffering it
+
+    The string value is located in the first bytes of the body and decoded
+    chunk by chunk into a pooled buffer, so the format is checked after the
+    first chunk and the size limit applies to the decoded image while it
+    arrives. Keys after the image are not parsed.
+
+    Raises:
+        UploadRejected: too large (413), not an image (415), malformed (400)
+    """
+    body_limit = (max_bytes + 2) // 3 * 4 + JSON_OVERHEAD
+    _check_content_length(request, body_limit, max_bytes)
+    key = re.compile(rb'"' + re.escape(field.encode()) + rb'"\s*:\s*"')
+
+    payload = ImagePayload(pool or shared_pool, max_bytes)
+    prefix = b""  # Body before the value starts
+    pending = b""  # Base64 characters not decoded yet (< 4), or a split escape
+    found = done = False
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise _too_large(max_bytes)
+            if done:
+                continue
+            if not found:
+                prefix += chunk
+                match = key.search(prefix)
+                if match is None:
+                    if len(prefix) > JSON_OVERHEAD:
+                        break
+                    continue
+                found = True
+                chunk, prefix = prefix[match.end():], b""
+
+            quote = chunk.find(b'"')
+            if quote >= 0:
+                chunk, done = chunk[:quote], True
+            text = pending + chunk
+            # A trailing backslash is half of an escape split across chunks
+            hold = 1 if text.endswith(b"\\") and not done else 0
+            text = _clean_base64(text[:len(text) - hold])
+            usable = len(text) - len(text) % 4
+            try:
+                payload.write(binascii.a2b_base64(text[:usable]))
+            except binascii.Error:
+                raise UploadRejected(400, "Invalid base64 image data", MALFORMED)
+            pending = text[usable:] + (b"\\" if hold else b"")
+
+        if not found:
+            raise UploadRejected(400, f"Expected a JSON object with an '{field}' field", MALFORMED)
+        if not done or pending:
+            raise UploadRejected(400, "Invalid base64 image data", MALFORMED)
+        payload.finish()
+    except BaseException:
+        payload.release()
+        raise
+    return payload
+
+
+shared_pool = BufferPool()
+
+
+__all__ = [
+    'BufferPool',
+    'ImagePayload',
+    'MALFORMED',
+    'MAX_IMAGE_BYTES',
+    'NOT_AN_IMAGE',
+    'TOO_LARGE',
+    'TOO_MANY_FILES',
+    'UploadRejected',
+    'read_base64_image',
+    'read_image_upload',
+    'read_image_uploads',
+    'shared_pool',
+    'sniff_image_type'
+]
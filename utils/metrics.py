@@ -0,0 +1,231 @@
+"""
+Prometheus metrics for the recognition service
+With PROMETHEUS_MULTIPROC_DIR set (as in book-ocr.service), every uvicorn
+worker writes its samples there and /metrics aggregates all of them
+"""
+import functools
+import os
+import time
+from typing import Dict, Optional
+import logging
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+REBUILD_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+
+REQUEST_LATENCY = Histogram(
+    "book_ocr_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "book_ocr_stage_duration_seconds",
+    "Time spent per request in each recognition stage (see Server-Timing)",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    "book_ocr_inference_batch_size",
+    "Images per CLIP forward pass",
+    buckets=BATCH_SIZE_BUCKETS
+)
+QUEUE_DEPTH = Gauge(
+    "book_ocr_inference_queue_depth",
+    "Requests waiting for an inference slot",
+    multiprocess_mode="livesum"
+)
+INFLIGHT = Gauge(
+    "book_ocr_inference_in_flight",
+    "Inference slots in use",
+    multiprocess_mode="livesum"
+)
+SHED = Counter(
+    "book_ocr_requests_shed_total",
+    "Requests rejected by admission control or abandoned before inference",
+    ["reason"]
+)
+CACHE_REQUESTS = Counter(
+    "book_ocr_embedding_cache_requests_total",
+    "Embedding cache lookups; hit ratio = rate(result=\"hit\") / rate(total)",
+    ["result"]
+)
+CACHE_SIZE = Gauge(
+    "book_ocr_embedding_cache_entries",
+    "Entries in the embedding cache",
+    multiprocess_mode="livesum"
+)
+INDEX_SIZE = Gauge(
+    "book_ocr_index_vectors",
+    "Vectors in the catalog index",
+    multiprocess_mode="livemax"
+)
+INDEX_INFO = Gauge(
+    "book_ocr_index_info",
+    "Catalog index type and shard count (1 = current, 0 = replaced)",
+    ["type", "shards"],
+    multiprocess_mode="livemax"
+)
+REBUILD_DURATION = Histogram(
+    "book_ocr_rebuild_duration_seconds",
+    "Duration of index builds and embedding regenerations",
+    ["operation"],
+    buckets=REBUILD_BUCKETS
+)
+CASCADE_DECISIONS = Counter(
+    "book_ocr_cascade_decisions_total",
+    "Cascade stage-one outcomes; acceptance rate = rate(outcome=\"accepted\") / rate(total)",
+    ["outcome"]
+)
+CASCADE_AUDITS = Counter(
+    "book_ocr_cascade_audits_total",
+    "Stage-one answers re-checked with CLIP, by whether CLIP agreed",
+    ["result"]
+)
+BARCODE_SCANS = Counter(
+    "book_ocr_barcode_scans_total",
+    "Images checked for an ISBN barcode; fast-path hit ratio = rate(result=\"hit\") / rate(total)",
+    ["result"]
+)
+BARCODE_LATENCY = Histogram(
+    "book_ocr_barcode_duration_seconds",
+    "Barcode scan plus ISBN lookup per image, by result (hit = answered without CLIP)",
+    ["result"],
+    buckets=STAGE_BUCKETS
+)
+STREAM_FRAMES = Counter(
+    "book_ocr_stream_frames_total",
+    "Frames received on /ws/recognize by outcome (processed, stale, duplicate, invalid)",
+    ["outcome"]
+)
+OPEN_STREAMS = Gauge(
+    "book_ocr_open_streams",
+    "Open /ws/recognize connections",
+    multiprocess_mode="livesum"
+)
+UPLOADS_REJECTED = Counter(
+    "book_ocr_uploads_rejected_total",
+    "Uploads refused while being received, by reason (too_large, not_an_image, malformed, too_many_files)",
+    ["reason"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "book_ocr_db_query_duration_seconds",
+    "SQLite query latency by BookDatabase method",
+    ["query"],
+    buckets=STAGE_BUCKETS
+)
+
+_index_labels: Optional[Dict[str, str]] = None
+
+
+def observe_request(endpoint: str, method: str, status: int, timer):
+    """
+    Record a finished request and its stage breakdown
+
+    Args:
+        endpoint: Route template (e.g. /books/{book_id}), not the raw path
+        method: HTTP method
+        status: Response status code
+        timer: utils.timing.RequestTimer of the request
+    """
+    REQUEST_LATENCY.labels(endpoint, method, str(status)).observe(timer.finish())
+    for stage, seconds in timer.stages.items():
+        STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+def set_index_info(index_info: Optional[Dict]):
+    """Publish the size and type of the live catalog index"""
+    global _index_labels
+
+    labels = None
+    if index_info is not None:
+        labels = {"type": index_info["type"], "shards": str(index_info["shards"])}
+    if _index_labels and _index_labels != labels:
+        # Zero rather than remove: removal does not reach multiprocess files
+        INDEX_INFO.labels(**_index_labels).set(0)
+    if labels:
+        INDEX_INFO.labels(**labels).set(1)
+    _index_labels = labels
+    INDEX_SIZE.set(index_info["size"] if index_info else 0)
+
+
+def observe_db_query(fn):
+    """Decorator timing an async BookDatabase method as DB query latency"""
+    histogram = DB_QUERY_LATENCY.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def render_metrics():
+    """
+    Render all metrics in Prometheus text format
+
+    Returns:
+        Tuple of (body bytes, content type)
+    """
+    if MULTIPROC_DIR:
+        # Aggregate the samples every worker wrote to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    """Drop this worker's live gauges from the aggregate (call on shutdown)"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+__all__ = [
+    'BARCODE_LATENCY',
+    'BARCODE_SCANS',
+    'CACHE_REQUESTS',
+    'CACHE_SIZE',
+    'CASCADE_AUDITS',
+    'CASCADE_DECISIONS',
+    'DB_QUERY_LATENCY',
+    'INDEX_INFO',
+    'INDEX_SIZE',
+    'INFERENCE_BATCH_SIZE',
+    'INFLIGHT',
+    'OPEN_STREAMS',
+    'QUEUE_DEPTH',
+    'REBUILD_DURATION',
+    'REQUEST_LATENCY',
+    'SHED',
+    'STAGE_LATENCY',
+    'STREAM_FRAMES',
+    'UPLOADS_REJECTED',
+    'mark_worker_dead',
+    'observe_db_query',
+    'observe_request',
+    'render_metrics',
+    'set_index_info'
+]
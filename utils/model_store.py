@@ -0,0 +1,280 @@
+"""
+Local artifact store for the CLIP vision tower
+A one-time export writes only the image encoder to a memory-mapped safetensors
+file with a manifest and checksums; loading it needs no network or hub lookups
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODEL_STORE_FORMAT_VERSION = 1
+
+DEFAULT_STORE_ROOT = "models"
+MANIFEST_FILE = "manifest.json"
+WEIGHTS_FILE = "vision.safetensors"
+PREPROCESSOR_FILE = "preprocessor_config.json"
+# Files that passed a full checksum, keyed by size/mtime/inode, so later
+# starts do not hash 350 MB again; export_model.py verify always hashes
+VERIFIED_STAMP_FILE = ".verified.json"
+
+# State-dict prefixes shared by CLIPModel and CLIPVisionModelWithProjection;
+# everything else (text tower, logit scale) is not needed to embed covers
+VISION_PREFIXES = ("vision_model.", "visual_projection.")
+
+
+class ModelStoreError(Exception):
+    """Raised when a model artifact is missing, corrupt or for another model"""
+
+
+class VisionArtifact(NamedTuple):
+    """A loaded model artifact"""
+    manifest: Dict
+    model: object  # CLIPVisionModelWithProjection
+    processor: object  # CLIPImageProcessor
+
+
+def store_dir_for(model_id: str, root: Optional[str] = None) -> Path:
+    """
+    Artifact directory for a model
+
+    Args:
+        model_id: Hugging Face model id, e.g. openai/clip-vit-base-patch32
+        root: Store root (default: $BOOK_OCR_MODEL_DIR or ./models)
+
+    Returns:
+        <root>/<model id with / replaced by -->
+    """
+    root = root or os.environ.get("BOOK_OCR_MODEL_DIR") or DEFAULT_STORE_ROOT
+    return Path(root) / model_id.replace("/", "--")
+
+
+def has_artifact(store_dir) -> bool:
+    """Whether an export finished in store_dir (the manifest is written last)"""
+    return (Path(store_dir) / MANIFEST_FILE).is_file()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(4 * 2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_key(path: Path) -> List[int]:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def _read_stamp(store_dir) -> Dict:
+    try:
+        return json.loads((Path(store_dir) / VERIFIED_STAMP_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_stamp(store_dir, stamp: Dict):
+    try:
+        (Path(store_dir) / VERIFIED_STAMP_FILE).write_text(json.dumps(stamp))
+    except OSError as e:
+        # Read-only store: every start hashes the files, which is only slower
+        logger.debug(f"Cannot record verified checksums in {store_dir}: {e}")
+
+
+def export_vision_model(model_id: str, output_dir=None, source: Optional[str] = None) -> Dict:
+    """
+    Export the CLIP image encoder and its preprocessing config
+
+    Args:
+        model_id: Model id recorded in the manifest (what initialize_clip_model asks for)
+        output_dir: Artifact directory (default: store_dir_for(model_id))
+        source: Where to read the checkpoint from, if not the hub id itself
+            (e.g. a local copy of the Hugging Face checkpoint)
+
+    Returns:
+        The artifact manifest
+    """
+    import torch
+    import transformers
+    from safetensors.torch import save_file
+    from transformers import CLIPImageProcessor, CLIPModel
+
+    output = Path(output_dir) if output_dir else store_dir_for(model_id)
+    source = source or model_id
+
+    logger.info(f"Loading {source} to export its vision tower")
+    model = CLIPModel.from_pretrained(source)
+    processor = CLIPImageProcessor.from_pretrained(source)
+
+    tensors = {
+        name: tensor.detach().contiguous()
+        for name, tensor in model.state_dict().items()
+        if name.startswith(VISION_PREFIXES)
+    }
+    vision_config = model.config.vision_config.to_dict()
+    # CLIPVisionModelWithProjection reads the projection size from the vision config
+    vision_config["projection_dim"] = model.config.projection_dim
+
+    # Build next to the target and swap in whole, so a half-written export
+    # is never picked up by a starting worker
+    tmp_dir = output.with_name(output.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    save_file(tensors, str(tmp_dir / WEIGHTS_FILE), metadata={"format": "pt", "model_id": model_id})
+    processor.save_pretrained(str(tmp_dir))
+
+    manifest = {
+        "format_version": MODEL_STORE_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model_id": model_id,
+        "source": source,
+        "architecture": "CLIPVisionModelWithProjection",
+        "embedding_dim": model.config.projection_dim,
+        "parameters": sum(tensor.numel() for tensor in tensors.values()),
+        "dtype": str(next(iter(tensors.values())).dtype).replace("torch.", ""),
+        "vision_config": vision_config,
+        "versions": {"torch": torch.__version__, "transformers": transformers.__version__},
+        "files": {
+            name: {"sha256": _file_sha256(tmp_dir / name), "size": (tmp_dir / name).stat().st_size}
+            for name in (WEIGHTS_FILE, PREPROCESSOR_FILE)
+        }
+    }
+    (tmp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+
+    if output.exists():
+        shutil.rmtree(output)
+    tmp_dir.rename(output)
+
+    size_mb = manifest["files"][WEIGHTS_FILE]["size"] / 2**20
+    logger.info(f"Exported {len(tensors)} tensors ({manifest['parameters']:,} parameters, {size_mb:.0f} MiB) -> {output}")
+    return manifest
+
+
+def read_manifest(store_dir) -> Dict:
+    """Read and sanity-check an artifact manifest"""
+    path = Path(store_dir) / MANIFEST_FILE
+    try:
+        manifest = json.loads(path.read_text())
+    except FileNotFoundError:
+        raise ModelStoreError(f"No model artifact in {store_dir} (missing {MANIFEST_FILE})")
+    except (OSError, ValueError) as e:
+        raise ModelStoreError(f"Cannot read {path}: {e}")
+
+    if manifest.get("format_version") != MODEL_STORE_FORMAT_VERSION:
+        raise ModelStoreError(
+            f"Unsupported model artifact format {manifest.get('format_version')} "
+            f"(expected {MODEL_STORE_FORMAT_VERSION})"
+        )
+    return manifest
+
+
+def verify_artifact(store_dir, manifest: Optional[Dict] = None, checksums: bool = True,
+                    reuse_verified: bool = True) -> Dict:
+    """
+    Check the artifact's files against its manifest
+
+    Args:
+        store_dir: Artifact directory
+        manifest: Already-read manifest (read from store_dir if None)
+        checksums: Hash the files; False only compares sizes
+        reuse_verified: Skip hashing files unchanged (same size, mtime and
+            inode) since they last passed the checksum
+
+    Returns:
+        The manifest
+    """
+    manifest = manifest or read_manifest(store_dir)
+    stamp = _read_stamp(store_dir) if checksums else {}
+    hashed = False
+    for name, info in manifest["files"].items():
+        path = Path(store_dir) / name
+        if not path.is_file():
+            raise ModelStoreError(f"Model artifact is missing {name}")
+        if path.stat().st_size != info["size"]:
+            raise ModelStoreError(f"Size mismatch for {name}: {path.stat().st_size} bytes, expected {info['size']}")
+        if not checksums:
+            continue
+
+        verified = {"sha256": info["sha256"], "stat": _stat_key(path)}
+        if reuse_verified and stamp.get(name) == verified:
+            continue
+        if _file_sha256(path) != info["sha256"]:
+            raise ModelStoreError(f"Checksum mismatch for {name}")
+        stamp[name] = verified
+        hashed = True
+
+    if hashed:
+        _write_stamp(store_dir, stamp)
+    return manifest
+
+
+def load_vision_model(store_dir, expected_model_id: Optional[str] = None,
+                      checksums: bool = True, reuse_verified: bool = True) -> VisionArtifact:
+    """
+    Load the image encoder from an artifact, without network access
+
+    The weights are memory-mapped and assigned to the module in place:
+    there is no random initialization and no copy, and forked workers
+    share the pages.
+
+    Args:
+        store_dir: Directory written by export_vision_model
+        expected_model_id: Refuse artifacts exported from a different model
+        checksums: Verify SHA-256 of every file before loading
+        reuse_verified: Trust an earlier full check of unchanged files
+
+    Returns:
+        VisionArtifact with the model in eval mode on the CPU
+    """
+    manifest = read_manifest(store_dir)
+    if expected_model_id and manifest.get("model_id") != expected_model_id:
+        raise ModelStoreError(
+            f"Model artifact in {store_dir} is {manifest.get('model_id')}, "
+            f"but {expected_model_id} was requested"
+        )
+    verify_artifact(store_dir, manifest, checksums=checksums, reuse_verified=reuse_verified)
+
+    from safetensors.torch import load_file
+    from transformers import CLIPImageProcessor, CLIPVisionConfig, CLIPVisionModelWithProjection
+    from transformers.modeling_utils import no_init_weights
+
+    with no_init_weights():
+        model = CLIPVisionModelWithProjection(CLIPVisionConfig(**manifest["vision_config"]))
+    try:
+        model.load_state_dict(load_file(str(Path(store_dir) / WEIGHTS_FILE)), strict=True, assign=True)
+    except RuntimeError as e:
+        raise ModelStoreError(f"Model artifact does not match its architecture: {e}")
+    model.eval()
+
+    processor = CLIPImageProcessor.from_pretrained(str(store_dir), local_files_only=True)
+    return VisionArtifact(manifest, model, processor)
+
+
+def load_processor(store_dir):
+    """Only the preprocessing config of an artifact (no weights)"""
+    from transformers import CLIPImageProcessor
+
+    verify_artifact(store_dir, checksums=False)
+    return CLIPImageProcessor.from_pretrained(str(store_dir), local_files_only=True)
+
+
+__all__ = [
+    'ModelStoreError',
+    'VisionArtifact',
+    'MODEL_STORE_FORMAT_VERSION',
+    'export_vision_model',
+    'has_artifact',
+    'load_processor',
+    'load_vision_model',
+    'read_manifest',
+    'store_dir_for',
+    'verify_artifact'
+]
@@ -0,0 +1,214 @@
+"""
+In-process sampling profiler for a running worker
+A background thread snapshots every thread's Python stack at a fixed interval;
+output is collapsed stacks (flamegraph.pl / speedscope) or speedscope JSON
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_DURATION = 60.0  # Seconds; keeps a forgotten request from profiling forever
+MIN_INTERVAL = 0.001
+
+# A thread whose innermost frame is one of these is parked, not using CPU
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("base_events.py", "_run_once")
+}
+
+Frame = Tuple[str, str, int]  # (file, function, first line)
+Stack = Tuple[Frame, ...]     # root first
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is already being taken in this process"""
+
+
+class Profile:
+    """Sample counts per (thread name, stack) from one profiling run"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.ticks = 0
+        self.duration = 0.0
+
+    def to_collapsed(self) -> str:
+        """
+        Collapsed stack format, one `thread;frame;...;frame count` per line
+
+        Frames are `file.py:function` so output stays readable in flame
+        graphs; feed it to flamegraph.pl or drop it into speedscope.
+        """
+        lines = []
+        for (thread, stack), count in self.samples.most_common():
+            frames = [thread] + [f"{os.path.basename(path)}:{func}" for path, func, _ in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "book-ocr") -> Dict:
+        """speedscope JSON with one sampled profile per thread"""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict] = []
+        by_thread: Dict[str, List[Tuple[List[int], int]]] = {}
+
+        for (thread, stack), count in self.samples.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    path, func, line = frame
+                    frames.append({"name": func, "file": path, "line": line})
+                indices.append(frame_index[frame])
+            by_thread.setdefault(thread, []).append((indices, count))
+
+        interval_ms = self.interval * 1000
+        profiles = []
+        for thread, entries in sorted(by_thread.items()):
+            total = sum(count for _, count in entries) * interval_ms
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": [indices for indices, _ in entries],
+                "weights": [count * interval_ms for _, count in entries]
+            })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "book-ocr sampling profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+
+def _is_idle(stack: Stack) -> bool:
+    if not stack:
+        return True
+    path, func, _ = stack[-1]
+    return (os.path.basename(path), func) in IDLE_FRAMES
+
+
+def _walk(frame) -> Stack:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+_lock = threading.Lock()
+
+
+def sample(duration: float, interval: float = 0.01, include_idle: bool = False) -> Profile:
+    """
+    Sample all threads of this process for `duration` seconds (blocking)
+
+    Only the sampling thread does work; profiled threads are never paused
+    beyond the GIL hand-off needed to read their frames. One profile may run
+    per process at a time.
+
+    Args:
+        duration: Seconds to sample (capped at MAX_DURATION)
+        interval: Seconds between samples
+        include_idle: Keep samples of threads parked in select/wait/queue get
+
+    Returns:
+        Profile with sample counts
+
+    Raises:
+        ProfilerBusy: Another profile is in progress
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+
+    try:
+        duration = min(max(duration, 0.0), MAX_DURATION)
+        interval = max(interval, MIN_INTERVAL)
+        profile = Profile(interval)
+        me = threading.get_ident()
+        names = {}
+
+        start = time.perf_counter()
+        next_tick = start
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = _walk(frame)
+                if not include_idle and _is_idle(stack):
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                profile.samples[(names.get(ident, f"thread-{ident}"), stack)] += 1
+            profile.ticks += 1
+
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind (sampling itself is slow); do not burst to catch up
+                next_tick = time.perf_counter()
+
+        profile.duration = time.perf_counter() - start
+        logger.info(
+            f"Profiled {profile.duration:.1f}s: {profile.ticks} ticks, "
+            f"{sum(profile.samples.values())} samples"
+        )
+        return profile
+    finally:
+        _lock.release()
+
+
+def profile_in_thread(duration: float, interval: float = 0.01,
+                      include_idle: bool = False, on_done=None) -> threading.Thread:
+    """
+    Run sample() on a dedicated daemon thread (keeps executor threads free)
+
+    Args:
+        on_done: Called with (profile, error) when sampling ends
+
+    Returns:
+        The started thread
+    """
+    def run():
+        try:
+            result = sample(duration, interval, include_idle)
+        except Exception as e:
+            on_done and on_done(None, e)
+        else:
+            on_done and on_done(result, None)
+
+    thread = threading.Thread(target=run, name="sampling-profiler", daemon=True)
+    thread.start()
+    return thread
+
+
+__all__ = [
+    'MAX_DURATION',
+    'Profile',
+    'ProfilerBusy',
+    'profile_in_thread',
+    'sample'
+]
@@ -0,0 +1,265 @@
+"""
+Read replicas: tail the leader's catalog change log and apply it locally
+Transports read the log straight from the leader's books.db file or over HTTP
+"""
+import asyncio
+import base64
+import fcntl
+import os
+import time
+import numpy as np
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+
+from .database import (
+    DB_PATH,
+    apply_changes_sync,
+    get_change_head_sync,
+    get_changes_since_sync
+)
+
+logger = logging.getLogger(__name__)
+
+
+def encode_change(change: Dict) -> Dict:
+    """Make a change dict JSON-serializable (embedding -> base64 float32)"""
+    encoded = dict(change)
+    if change.get('embedding') is not None:
+        encoded['embedding'] = base64.b64encode(
+            np.asarray(change['embedding'], dtype=np.float32).tobytes()
+        ).decode('ascii')
+    return encoded
+
+
+def decode_change(data: Dict) -> Dict:
+    """Inverse of encode_change"""
+    change = dict(data)
+    if data.get('embedding'):
+        change['embedding'] = np.frombuffer(
+            base64.b64decode(data['embedding']), dtype=np.float32
+        ).copy()
+    else:
+        change['embedding'] = None
+    return change
+
+
+class FileChangeLogTransport:
+    """Read the change log directly from a leader's SQLite file (shared disk / tests)"""
+
+    def __init__(self, leader_db_path: str):
+        self.source = leader_db_path
+
+    def fetch(self, since: int, limit: int) -> Tuple[List[Dict], int]:
+        """Return (changes with seq > since, leader head seq)"""
+        changes = get_changes_since_sync(since, limit, db_path=self.source)
+        head = get_change_head_sync(db_path=self.source)
+        return changes, head
+
+
+class HttpChangeLogTransport:
+    """Poll a leader's /replication/changes endpoint"""
+
+    def __init__(self, leader_url: str, timeout: float = 5.0):
+        self.source = leader_url.rstrip('/')
+        self.timeout = timeout
+
+    def fetch(self, since: int, limit: int) -> Tuple[List[Dict], int]:
+        """Return (changes with seq > since, leader head seq)"""
+        import requests
+
+        response = requests.get(
+            f"{self.source}/replication/changes",
+            params={"since": since, "limit": limit},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        return [decode_change(c) for c in data["changes"]], data["head_seq"]
+
+
+def make_transport(source: str):
+    """Pick a transport from a leader URL (http/https) or a books.db path"""
+    if source.startswith(("http://", "https://")):
+        return HttpChangeLogTransport(source)
+    return FileChangeLogTransport(source)
+
+
+class ApplierLock:
+    """
+    Elects the one worker per node that applies replicated changes
+
+    A non-blocking fcntl.flock on a file next to books.db. The kernel drops
+    the lock when its holder exits, so another worker takes over on its
+    next attempt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """Try to take the lock without waiting; True if this process holds it"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class ChangeLogFollower:
+    """
+    Tail a leader's change log into the local database and index
+
+    The replication position is the local MAX(seq) of catalog_changes, so a
+    follower provisioned from a copy of the leader's books.db resumes from
+    the point the copy was taken.
+
+    With several workers per node, pass the same `lock` path to each: the
+    worker holding it applies the leader's changes to books.db, the others
+    tail the local change log and only update their in-memory index.
+    on_applied(changes, persist) tells them apart (persist is True for the
+    applying worker, which also owns the on-disk embeddings). Both callbacks
+    are coroutines: they run on the event loop and keep blocking work off it.
+
+    The position moves past a batch only once on_applied() has taken it. If
+    it fails, on_resync(persist) rebuilds the index from the local database,
+    which already holds the batch; without on_resync the batch is retried.
+    """
+
+    def __init__(self, transport, on_applied: Callable[[List[Dict], bool], Awaitable[None]],
+                 db_path: str = DB_PATH, poll_interval: float = 2.0,
+                 batch_size: int = 500, lock: Optional[ApplierLock] = None,
+                 on_resync: Optional[Callable[[bool], Awaitable[None]]] = None):
+        self.transport = transport
+        self.local_transport = FileChangeLogTransport(db_path)
+        self.on_applied = on_applied
+        self.on_resync = on_resync
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lock = lock
+
+        self.position = get_change_head_sync(db_path)
+        self.leader_head: Optional[int] = None
+        self.source_head: Optional[int] = None
+        self.applied_total = 0
+        self.caught_up_at: Optional[float] = None
+        self.last_poll_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def applies(self) -> bool:
+        """Whether this worker writes the leader's changes to the local database"""
+        return self.lock is None or self.lock.held
+
+    async def poll_once(self) -> int:
+        """Fetch and apply one batch of changes; returns number applied"""
+        if self.lock is not None and not self.lock.held and self.lock.acquire():
+            logger.info(f"This worker now applies replicated changes to {self.db_path}")
+        applying = self.applies
+        transport = self.transport if applying else self.local_transport
+
+        loop = asyncio.get_running_loop()
+        changes, head = await loop.run_in_executor(
+            None, transport.fetch, self.position, self.batch_size
+        )
+        self.source_head = head
+        if applying:
+            self.leader_head = head
+        self.last_poll_at = time.time()
+
+        new_changes = [c for c in changes if c['seq'] > self.position]
+        if new_changes:
+            if applying:
+                await loop.run_in_executor(None, apply_changes_sync, new_changes, self.db_path)
+            try:
+                await self.on_applied(new_changes, applying)
+            except Exception as e:
+                if self.on_resync is None:
+                    raise
+                # The batch is in the local database already: skipping it would
+                # leave the index behind the database until a restart
+                logger.error(f"Indexing {len(new_changes)} replicated changes failed ({e}); rebuilding the index")
+                await self.on_resync(applying)
+            self.position = new_changes[-1]['seq']
+            self.applied_total += len(new_changes)
+            logger.info(
+                f"{'Applied' if applying else 'Reloaded'} {len(new_changes)} catalog changes "
+                f"(now at seq {self.position})"
+            )
+
+        if self.position >= head:
+            self.caught_up_at = self.last_poll_at
+
+        return len(new_changes)
+
+    async def run(self):
+        """Poll forever; drains back-to-back while behind, sleeps when caught up"""
+        logger.info(f"Following catalog change log at {self.transport.source} from seq {self.position}")
+        while True:
+            try:
+                applied = await self.poll_once()
+                self.last_error = None
+                if applied == self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Replication poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def status(self) -> Dict:
+        """Replication state and lag for /health"""
+        now = time.time()
+        lag_changes = None
+        if self.source_head is not None:
+            lag_changes = max(0, self.source_head - self.position)
+
+        if lag_changes == 0:
+            lag_seconds = 0.0
+        elif self.caught_up_at is not None:
+            lag_seconds = round(now - self.caught_up_at, 3)
+        else:
+            lag_seconds = None
+
+        return {
+            "role": "follower",
+            "source": self.transport.source,
+            # Workers that do not apply follow the node's own books.db; their
+            # lag is behind that copy, not behind the leader
+            "applies_changes": self.applies,
+            "applied_seq": self.position,
+            "leader_head_seq": self.leader_head,
+            "lag_changes": lag_changes,
+            "lag_seconds": lag_seconds,
+            "applied_total": self.applied_total,
+            "last_poll_age_seconds": round(now - self.last_poll_at, 3) if self.last_poll_at else None,
+            "last_error": self.last_error
+        }
+
+
+__all__ = [
+    'ApplierLock',
+    'ChangeLogFollower',
+    'FileChangeLogTransport',
+    'HttpChangeLogTransport',
+    'decode_change',
+    'encode_change',
+    'make_transport'
+]
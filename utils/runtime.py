@@ -0,0 +1,193 @@
+"""
+Thread pool sizes and CPU pinning for the native libraries
+torch, onnxruntime, FAISS (OpenMP) and OpenCV each default to one thread per
+core; several workers on a 4-core box then oversubscribe it many times over
+"""
+import os
+from typing import Dict, List, NamedTuple, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadConfig(NamedTuple):
+    """Per-process thread budget (None = leave the library default)"""
+    torch_threads: Optional[int] = None
+    torch_interop_threads: Optional[int] = None
+    faiss_threads: Optional[int] = None
+    opencv_threads: Optional[int] = None
+    onnx_threads: Optional[int] = None
+    cpu_affinity: Optional[List[int]] = None
+
+
+# Used by processes that fork workers: no native thread pool may exist at fork time
+SINGLE_THREADED = ThreadConfig(
+    torch_threads=1, faiss_threads=1, opencv_threads=1, onnx_threads=1
+)
+
+_applied: Optional[ThreadConfig] = None
+_applied_pid: Optional[int] = None
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """Parse a CPU list such as '0-1,3' (the taskset/cgroup format)"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            cpus.update(range(int(low), int(high) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def split_cpus(cpus: List[int], workers: int, index: int) -> List[int]:
+    """
+    Disjoint share of `cpus` for worker `index` of `workers`
+
+    Extra CPUs go to the lowest-numbered workers; when there are more
+    workers than CPUs, workers share CPUs round-robin.
+    """
+    if workers >= len(cpus):
+        return [cpus[index % len(cpus)]]
+    per_worker, extra = divmod(len(cpus), workers)
+    start = index * per_worker + min(index, extra)
+    return cpus[start:start + per_worker + (1 if index < extra else 0)]
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def thread_config_from_env(workers: Optional[int] = None) -> ThreadConfig:
+    """
+    Thread budget for one worker, from BOOK_OCR_* variables or defaults
+
+    Defaults split the CPUs between the workers for torch (the only
+    library whose single calls benefit from many threads) and keep FAISS,
+    OpenCV and torch's inter-op pool at one thread: requests already run
+    in parallel, so per-call parallelism there only adds contention.
+
+    Args:
+        workers: Worker processes sharing the machine (default:
+            WEB_CONCURRENCY, which uvicorn also reads, or 1)
+
+    Returns:
+        ThreadConfig; BOOK_OCR_CPU_AFFINITY is 'auto' (this worker's
+        share, needs the worker index, see serve_prefork.py) or a CPU list
+    """
+    workers = workers or _env_int("WEB_CONCURRENCY") or 1
+    spec = os.environ.get("BOOK_OCR_CPU_AFFINITY", "").strip()
+    affinity = parse_cpu_list(spec) if spec and spec != "auto" else None
+    # A pinned worker owns its CPUs; otherwise the workers split what is available
+    default_threads = len(affinity) if affinity else max(1, len(available_cpus()) // workers)
+    torch_threads = _env_int("BOOK_OCR_TORCH_THREADS") or default_threads
+    return ThreadConfig(
+        torch_threads=torch_threads,
+        torch_interop_threads=_env_int("BOOK_OCR_TORCH_INTEROP_THREADS") or 1,
+        faiss_threads=_env_int("BOOK_OCR_FAISS_THREADS") or 1,
+        opencv_threads=_env_int("BOOK_OCR_OPENCV_THREADS") or 1,
+        onnx_threads=_env_int("BOOK_OCR_ONNX_THREADS") or torch_threads,
+        cpu_affinity=affinity
+    )
+
+
+def apply_thread_config(config: ThreadConfig) -> Dict:
+    """
+    Apply a thread budget to this process
+
+    Pinning comes first so that thread pools started afterwards inherit
+    it. torch's inter-op pool can only be sized before it starts; later
+    attempts are logged and skipped.
+
+    Returns:
+        runtime_report() after applying
+    """
+    global _applied, _applied_pid
+    import torch
+    import faiss
+    import cv2
+
+    if config.cpu_affinity and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, config.cpu_affinity)
+    if config.torch_threads:
+        torch.set_num_threads(config.torch_threads)
+    if config.torch_interop_threads:
+        try:
+            torch.set_num_interop_threads(config.torch_interop_threads)
+        except RuntimeError:
+            if torch.get_num_interop_threads() != config.torch_interop_threads:
+                logger.warning(
+                    f"torch inter-op pool already started with {torch.get_num_interop_threads()} "
+                    f"threads; cannot change it to {config.torch_interop_threads}"
+                )
+    if config.faiss_threads:
+        faiss.omp_set_num_threads(config.faiss_threads)
+    if config.opencv_threads:
+        cv2.setNumThreads(config.opencv_threads)
+
+    _applied, _applied_pid = config, os.getpid()
+    report = runtime_report()
+    logger.info(
+        "Runtime threads: " + ", ".join(f"{key}={value}" for key, value in report.items() if key != "cpu_count")
+    )
+    return report
+
+
+def is_configured() -> bool:
+    """Whether this process (not a parent it was forked from) applied a config"""
+    return _applied is not None and _applied_pid == os.getpid()
+
+
+def onnx_session_options():
+    """onnxruntime SessionOptions honoring the applied thread budget"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    threads = _applied.onnx_threads if is_configured() else None
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def runtime_report() -> Dict:
+    """Effective thread counts and CPU pinning, for /health"""
+    import torch
+    import faiss
+    import cv2
+
+    return {
+        "cpu_count": os.cpu_count(),
+        "cpu_affinity": available_cpus(),
+        "torch_threads": torch.get_num_threads(),
+        "torch_interop_threads": torch.get_num_interop_threads(),
+        "faiss_threads": faiss.omp_get_max_threads(),
+        "opencv_threads": cv2.getNumThreads(),
+        "onnx_threads": _applied.onnx_threads if is_configured() else None
+    }
+
+
+__all__ = [
+    'ThreadConfig',
+    'SINGLE_THREADED',
+    'apply_thread_config',
+    'available_cpus',
+    'is_configured',
+    'onnx_session_options',
+    'parse_cpu_list',
+    'runtime_report',
+    'split_cpus',
+    'thread_config_from_env'
+]
@@ -0,0 +1,289 @@
+"""
+Batched similarity search over the catalog FAISS index
+One index.search call per query block, vectorized result assembly
+"""
+import numpy as np
+import faiss
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+# HNSW defaults (see evaluate_index.py for measuring other settings)
+HNSW_M = 32  # Number of connections per layer
+HNSW_EF_CONSTRUCTION = 40
+HNSW_EF_SEARCH = 16
+
+# Similarity bands, highest first: (lower bound, confidence, match quality).
+# The last band's bound is the service's confidence threshold and is passed in
+# at search time; anything below it is "low"/"poor".
+CONFIDENCE_BANDS = (
+    (0.85, "very_high", "excellent"),
+    (0.75, "high", "good"),
+)
+THRESHOLD_BAND = ("medium", "acceptable")
+BELOW_THRESHOLD_BAND = ("low", "poor")
+
+
+class BatchSearchResult(NamedTuple):
+    """Top-k results for an (N, d) query block, all arrays shaped (N, k)"""
+    similarities: np.ndarray
+    indices: np.ndarray
+    book_ids: np.ndarray
+    valid: np.ndarray
+    confidence: np.ndarray
+    match_quality: np.ndarray
+
+    def __len__(self) -> int:
+        return self.similarities.shape[0]
+
+
+def confidence_buckets(similarities: np.ndarray, threshold: float):
+    """
+    Map similarity scores to confidence / match quality labels
+
+    Args:
+        similarities: Array of cosine similarities (any shape)
+        threshold: Minimum similarity for a "medium" confidence match
+
+    Returns:
+        Tuple of (confidence, match_quality) string arrays with the same shape
+    """
+    conditions = [similarities >= bound for bound, _, _ in CONFIDENCE_BANDS]
+    conditions.append(similarities >= threshold)
+
+    confidence = np.select(
+        conditions,
+        [label for _, label, _ in CONFIDENCE_BANDS] + [THRESHOLD_BAND[0]],
+        default=BELOW_THRESHOLD_BAND[0]
+    )
+    quality = np.select(
+        conditions,
+        [label for _, _, label in CONFIDENCE_BANDS] + [THRESHOLD_BAND[1]],
+        default=BELOW_THRESHOLD_BAND[1]
+    )
+    return confidence, quality
+
+
+def build_flat_or_hnsw(embeddings: np.ndarray, use_hnsw: bool = True,
+                       hnsw_min_size: int = 100, hnsw_m: int = HNSW_M,
+                       ef_construction: int = HNSW_EF_CONSTRUCTION,
+                       ef_search: int = HNSW_EF_SEARCH) -> faiss.Index:
+    """
+    Build a single (unsharded) inner-product index over normalized embeddings
+
+    Args:
+        embeddings: (N, d) float32 array, already L2-normalized
+        use_hnsw: Use HNSW when the catalog is larger than hnsw_min_size
+        hnsw_min_size: Below this size exact flat search is used
+        hnsw_m: HNSW connections per layer
+        ef_construction: HNSW build-time candidate list size
+        ef_search: HNSW query-time candidate list size (recall vs speed)
+
+    Returns:
+        Populated FAISS index
+    """
+    dim = embeddings.shape[1]
+
+    if use_hnsw and len(embeddings) > hnsw_min_size:
+        # HNSW for larger datasets (approximate but faster)
+        # Inner-product metric so scores are cosine similarities like the flat index
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    else:
+        # Exact search with inner product (cosine similarity on normalized vectors)
+        index = faiss.IndexFlatIP(dim)
+
+    index.add(embeddings)
+    return index
+
+
+def build_index(embeddings: np.ndarray, use_hnsw: bool = True,
+                num_shards: int = 1, hnsw_min_size: int = 100,
+                **hnsw_params) -> faiss.Index:
+    """
+    Build the catalog index, optionally partitioned into parallel shards
+
+    Shards hold contiguous row ranges and are searched concurrently (one
+    thread per shard); faiss merges the per-shard top-k lists and offsets
+    ids, so results match the unsharded index for exact (flat) search.
+
+    Args:
+        embeddings: (N, d) float32 array, already L2-normalized
+        use_hnsw: Use HNSW when the catalog is larger than hnsw_min_size
+        num_shards: Number of shards (1 = single in-process index)
+        hnsw_min_size: Below this (total) size exact flat search is used
+        **hnsw_params: hnsw_m / ef_construction / ef_search for build_flat_or_hnsw
+
+    Returns:
+        Populated FAISS index (IndexShards when num_shards > 1)
+    """
+    num_shards = max(1, min(num_shards, len(embeddings)))
+    if num_shards == 1:
+        return build_flat_or_hnsw(embeddings, use_hnsw, hnsw_min_size, **hnsw_params)
+
+    # Decide the index type from the full catalog size so every shard is
+    # the same kind of index as the unsharded build would be
+    shard_use_hnsw = use_hnsw and len(embeddings) > hnsw_min_size
+
+    shards = faiss.IndexShards(embeddings.shape[1], True, True)
+    for part in np.array_split(embeddings, num_shards):
+        shard = build_flat_or_hnsw(np.ascontiguousarray(part), shard_use_hnsw, hnsw_min_size=0, **hnsw_params)
+        # The python wrapper keeps a reference to each shard
+        shards.add_shard(shard)
+
+    logger.info(f"Built {num_shards} index shards over {len(embeddings)} vectors")
+    return shards
+
+
+def set_ef_search(index: faiss.Index, ef_search: int):
+    """Set HNSW efSearch on an index (or every shard); no-op for flat indexes"""
+    if isinstance(index, faiss.IndexShards):
+        for i in range(index.count()):
+            set_ef_search(faiss.downcast_index(index.at(i)), ef_search)
+        return
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def describe_index(index: faiss.Index) -> Dict:
+    """Summarize index type and shard layout (for /health and /stats)"""
+    if isinstance(index, faiss.IndexShards):
+        shard = faiss.downcast_index(index.at(0))
+        return {
+            "type": type(shard).__name__,
+            "shards": index.count(),
+            "shard_sizes": [int(index.at(i).ntotal) for i in range(index.count())],
+            "size": int(index.ntotal)
+        }
+    return {"type": type(index).__name__, "shards": 1, "size": int(index.ntotal)}
+
+
+def prepare_queries(queries: np.ndarray) -> np.ndarray:
+    """
+    Convert embeddings to a contiguous, L2-normalized float32 (N, d) block
+
+    Args:
+        queries: (d,) or (N, d) embedding array
+
+    Returns:
+        New (N, d) float32 array safe to pass to faiss
+    """
+    block = np.array(queries, dtype="float32", order="C", ndmin=2)
+    faiss.normalize_L2(block)
+    return block
+
+
+class SearchService:
+    """
+    Shared search path for single, batch and offline (benchmark) queries
+
+    Wraps a FAISS index plus the row -> book_id mapping, so callers never
+    touch raw FAISS indices.
+    """
+
+    def __init__(self, index: faiss.Index, book_ids: Sequence[str],
+                 top_k: int = 5, threshold: float = 0.65):
+        self.index = index
+        self.top_k = top_k
+        self.threshold = threshold
+        # Object array so ids can be gathered with fancy indexing
+        self._book_ids = np.asarray(list(book_ids), dtype=object)
+
+    @property
+    def size(self) -> int:
+        return int(self.index.ntotal)
+
+    def search(self, queries: np.ndarray, k: Optional[int] = None) -> BatchSearchResult:
+        """
+        Search an (N, d) block of query embeddings in one index call
+
+        Args:
+            queries: (d,) or (N, d) embeddings (normalized here)
+            k: Number of neighbours per query (defaults to top_k)
+
+        Returns:
+            BatchSearchResult with (N, k) arrays
+        """
+        k = k or self.top_k
+        block = prepare_queries(queries)
+        similarities, indices = self.index.search(block, k)
+
+        # FAISS pads with -1 when fewer than k results exist; rows can also
+        # be out of range if embeddings.npy and the DB disagree in length.
+        valid = (indices >= 0) & (indices < len(self._book_ids))
+        safe_indices = np.where(valid, indices, 0)
+
+        if len(self._book_ids):
+            book_ids = self._book_ids[safe_indices]
+            book_ids[~valid] = None
+        else:
+            book_ids = np.full(indices.shape, None, dtype=object)
+
+        confidence, quality = confidence_buckets(similarities, self.threshold)
+
+        return BatchSearchResult(
+            similarities=similarities,
+            indices=indices,
+            book_ids=book_ids,
+            valid=valid,
+            confidence=confidence,
+            match_quality=quality
+        )
+
+    def unique_book_ids(self, result: BatchSearchResult) -> List[str]:
+        """All distinct valid book ids in a result block (for one bulk DB fetch)"""
+        return list(dict.fromkeys(result.book_ids[result.valid].tolist()))
+
+
+def assemble_candidates(result: BatchSearchResult, row: int,
+                        books: Dict[str, Dict]) -> List[Dict]:
+    """
+    Build candidate dicts for one query row of a batch result
+
+    Args:
+        result: Output of SearchService.search
+        row: Query row to assemble
+        books: book_id -> book info, fetched once for the whole block
+
+    Returns:
+        Ranked list of candidate dicts (same shape as the v2 API response)
+    """
+    sims = result.similarities[row].tolist()
+    ids = result.book_ids[row].tolist()
+    confidence = result.confidence[row].tolist()
+    quality = result.match_quality[row].tolist()
+    valid = result.valid[row].tolist()
+
+    candidates = []
+    for rank in range(len(ids)):
+        if not valid[rank]:
+            continue
+        book_info = books.get(ids[rank])
+        if not book_info:
+            continue
+        candidates.append({
+            "book_id": ids[rank],
+            "title": book_info["title"],
+            "author": book_info["author"],
+            "image": book_info["image"],
+            "similarity": sims[rank],
+            "confidence": confidence[rank],
+            "match_quality": quality[rank],
+            "rank": rank + 1
+        })
+    return candidates
+
+
+__all__ = [
+    'BatchSearchResult',
+    'SearchService',
+    'assemble_candidates',
+    'build_index',
+    'confidence_buckets',
+    'describe_index',
+    'prepare_queries',
+    'set_ef_search'
+]
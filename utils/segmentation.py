@@ -0,0 +1,150 @@
+"""
+Find individual book covers in a photo of a shelf or table
+Classic OpenCV only: colour edges, closed contours and rectangle tests on a
+downscaled copy; boxes are mapped back to full resolution for cropping
+"""
+import cv2
+import numpy as np
+from typing import List, NamedTuple, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIDE = 1024  # Longest side of the copy contours are found on
+MIN_REGION_AREA = 0.01  # Smallest cover, as a fraction of the frame
+MIN_REGION_SIDE = 100  # Smallest cover side in full-resolution pixels (assess_image_quality's minimum)
+ASPECT_RANGE = (0.25, 4.0)  # Allowed width/height of a cover box
+CANNY_THRESHOLDS = (30, 90)  # Per colour channel, after a 5x5 blur
+MIN_RECTANGULARITY = 0.8  # Contour hull area / bounding box area
+# A box whose inner boxes (two or more) fill this much of it is split into
+# them: that is several touching covers rather than one cover's artwork
+SPLIT_COVERAGE = 0.75
+
+
+class Region(NamedTuple):
+    """Axis-aligned box of one cover candidate, in full-resolution pixels"""
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @property
+    def area(self) -> int:
+        return self.width * self.height
+
+    def contains(self, other: "Region", tolerance: int = 0) -> bool:
+        return (other.x >= self.x - tolerance and other.y >= self.y - tolerance
+                and other.x + other.width <= self.x + self.width + tolerance
+                and other.y + other.height <= self.y + self.height + tolerance)
+
+    def crop(self, img: np.ndarray) -> np.ndarray:
+        return img[self.y:self.y + self.height, self.x:self.x + self.width]
+
+    def to_dict(self) -> dict:
+        return {"x": self.x, "y": self.y, "width": self.width, "height": self.height}
+
+
+def _iou(a: Region, b: Region) -> float:
+    ix = max(0, min(a.x + a.width, b.x + b.width) - max(a.x, b.x))
+    iy = max(0, min(a.y + a.height, b.y + b.height) - max(a.y, b.y))
+    inter = ix * iy
+    return inter / float(a.area + b.area - inter) if inter else 0.0
+
+
+def _candidate_boxes(img: np.ndarray, min_area: float) -> List[Region]:
+    """Rectangular closed contours of a (downscaled) image"""
+    blurred = cv2.GaussianBlur(img, (5, 5), 0)
+    # Edges of every colour channel: a cover can differ from the table in hue
+    # while having the same brightness, which grayscale edges would miss
+    channels = cv2.split(blurred) if blurred.ndim == 3 else [blurred]
+    edges = np.max([cv2.Canny(channel, *CANNY_THRESHOLDS) for channel in channels], axis=0)
+    edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8), iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area or not ASPECT_RANGE[0] <= w / h <= ASPECT_RANGE[1]:
+            continue
+        if cv2.contourArea(cv2.convexHull(contour)) < MIN_RECTANGULARITY * w * h:
+            continue
+        boxes.append(Region(x, y, w, h))
+    return boxes
+
+
+def _dedupe(boxes: List[Region], max_iou: float = 0.85) -> List[Region]:
+    """Drop near-identical boxes (inner and outer edge of the same border)"""
+    kept: List[Region] = []
+    for box in sorted(boxes, key=lambda b: b.area, reverse=True):
+        if all(_iou(box, other) < max_iou for other in kept):
+            kept.append(box)
+    return kept
+
+
+def _select(box: Region, boxes: List[Region], tolerance: int) -> List[Region]:
+    """The box itself, or its children when they explain it (see SPLIT_COVERAGE)"""
+    inside = [b for b in boxes if b is not box and b.area < box.area and box.contains(b, tolerance)]
+    children = [b for b in inside if not any(o is not b and o.area > b.area and o.contains(b, tolerance) for o in inside)]
+    if len(children) >= 2 and sum(c.area for c in children) >= SPLIT_COVERAGE * box.area:
+        return [region for child in children for region in _select(child, inside, tolerance)]
+    return [box]
+
+
+def detect_cover_regions(img: np.ndarray, max_regions: int = 32,
+                         max_side: int = DEFAULT_MAX_SIDE) -> List[Region]:
+    """
+    Candidate cover boxes in a photo of several books
+
+    Args:
+        img: OpenCV image (BGR)
+        max_regions: Keep at most this many boxes (the largest)
+        max_side: Longest side of the copy contours are found on
+
+    Returns:
+        Boxes in reading order (top to bottom, then left to right); empty
+        when the photo does not show several covers (use the whole frame)
+    """
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else img
+
+    boxes = _dedupe(_candidate_boxes(small, MIN_REGION_AREA * small.shape[0] * small.shape[1]))
+    tolerance = max(2, int(0.01 * max(small.shape[:2])))
+    roots = [b for b in boxes if not any(o is not b and o.area > b.area and o.contains(b, tolerance) for o in boxes)]
+    selected = [region for root in roots for region in _select(root, boxes, tolerance)]
+
+    # Back to full resolution
+    regions = []
+    for box in selected:
+        x0, y0 = int(box.x / scale), int(box.y / scale)
+        x1, y1 = min(w, int(np.ceil((box.x + box.width) / scale))), min(h, int(np.ceil((box.y + box.height) / scale)))
+        if min(x1 - x0, y1 - y0) >= MIN_REGION_SIDE:
+            regions.append(Region(x0, y0, x1 - x0, y1 - y0))
+
+    # One box is not a segmentation: a cover filling the frame has no edge of
+    # its own, so the box is its artwork or title panel, and a lone book on a
+    # table is recognized just as well from the whole frame
+    if len(regions) < 2:
+        return []
+
+    regions = sorted(regions, key=lambda r: r.area, reverse=True)[:max_regions]
+    return sort_reading_order(regions)
+
+
+def sort_reading_order(regions: List[Region]) -> List[Region]:
+    """Rows top to bottom (boxes whose centres are within half a box height), left to right in each"""
+    rows: List[Tuple[float, List[Region]]] = []
+    for region in sorted(regions, key=lambda r: r.y + r.height / 2):
+        centre = region.y + region.height / 2
+        if rows and abs(centre - rows[-1][0]) <= region.height / 2:
+            rows[-1][1].append(region)
+        else:
+            rows.append((centre, [region]))
+    return [region for _, row in rows for region in sorted(row, key=lambda r: r.x)]
+
+
+__all__ = [
+    'Region',
+    'detect_cover_regions',
+    'sort_reading_order'
+]
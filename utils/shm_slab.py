@@ -0,0 +1,264 @@
+"""
+Shared-memory slab of fixed-size input tensors for zero-copy handoff
+HTTP workers write preprocessed pixels straight into a slot and pass only the
+slot index; the inference server reads the batch in place
+"""
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SLOT_SHAPE = (3, 224, 224)  # CLIP ViT-B/32 input (224x224 RGB, channels first as the model takes it)
+DEFAULT_SLOTS = 64  # 64 x 588 KiB = ~37 MiB
+FREE = 0  # Owner table value of an unallocated slot
+_ALIGN = 64
+
+
+class SlabExhausted(Exception):
+    """Raised when no slots free up before the allocation timeout"""
+
+
+class TensorSlab:
+    """
+    Pool of float32 tensor slots in one shared memory block
+
+    Layout: an owner table (one int64 per slot holding the pid of the process
+    that allocated it, 0 when free) followed by the slots themselves.
+    Allocation takes a file lock, so any process that attaches (whether
+    forked or not) can allocate. The allocating process frees its slots once
+    the server has answered. Slots held by a process that died are taken
+    back when the pool runs dry.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int,
+                 slot_shape: Tuple[int, ...], lock_path: str, owner: bool):
+        self.shm = shm
+        self.name = shm.name
+        self.slots = slots
+        self.slot_shape = tuple(slot_shape)
+        self.lock_path = lock_path
+        self.owner = owner
+
+        table_bytes = -(-slots * 8 // _ALIGN) * _ALIGN
+        self.owners = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=0)
+        self.tensors = np.ndarray((slots, *self.slot_shape), dtype=np.float32, buffer=shm.buf, offset=table_bytes)
+
+        # flock() excludes other processes; threads of this process share
+        # the descriptor, so they also need an ordinary lock
+        self._thread_lock = threading.Lock()
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o660)
+        self._gather: Optional[np.ndarray] = None
+
+        self.allocations = 0
+        self.waits = 0
+        self.reclaimed = 0
+
+    @staticmethod
+    def nbytes(slots: int, slot_shape: Tuple[int, ...] = SLOT_SHAPE) -> int:
+        table_bytes = -(-slots * 8 // _ALIGN) * _ALIGN
+        return table_bytes + slots * int(np.prod(slot_shape)) * 4
+
+    @classmethod
+    def create(cls, name: str, slots: int = DEFAULT_SLOTS, slot_shape: Tuple[int, ...] = SLOT_SHAPE,
+               lock_path: Optional[str] = None) -> "TensorSlab":
+        """
+        Create the slab (inference server side)
+
+        Args:
+            name: Shared memory name (appears under /dev/shm)
+            slots: Number of tensor slots
+            slot_shape: Shape of one slot
+            lock_path: File used for the cross-process allocation lock
+
+        Returns:
+            The slab; call close(unlink=True) when shutting down
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=cls.nbytes(slots, slot_shape))
+        except FileExistsError:
+            # Left behind by a server that was killed; nobody can be using it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=cls.nbytes(slots, slot_shape))
+        slab = cls(shm, slots, slot_shape, lock_path or f"/dev/shm/{name}.lock", owner=True)
+        slab.owners[:] = FREE
+        logger.info(f"Created tensor slab {name}: {slots} slots of {slot_shape} ({shm.size / 2**20:.1f} MiB)")
+        return slab
+
+    @classmethod
+    def attach(cls, info: Dict) -> "TensorSlab":
+        """Attach to a slab described by describe() (HTTP worker side)"""
+        try:
+            shm = shared_memory.SharedMemory(name=info["name"], track=False)
+        except TypeError:
+            # Python < 3.13 always tracks, and the tracker would unlink the
+            # server's block when this process exits
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name=info["name"])
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, info["slots"], tuple(info["slot_shape"]), info["lock_path"], owner=False)
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "slot_shape": list(self.slot_shape),
+            "lock_path": self.lock_path
+        }
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _find_free(self, count: int) -> Optional[np.ndarray]:
+        free = np.flatnonzero(self.owners == FREE)
+        if len(free) < count:
+            return None
+        # Prefer a consecutive run: the server can then use it without a gather
+        if count > 1:
+            run_starts = np.flatnonzero(free[count - 1:] - free[:len(free) - count + 1] == count - 1)
+            if len(run_starts):
+                start = run_starts[0]
+                return free[start:start + count]
+        return free[:count]
+
+    def try_allocate(self, count: int) -> Optional[List[int]]:
+        """Claim `count` slots for this process, or None if not enough are free"""
+        if count > self.slots:
+            return None
+        with self._locked():
+            chosen = self._find_free(count)
+            if chosen is None and self._reclaim_dead():
+                chosen = self._find_free(count)
+            if chosen is None:
+                return None
+            self.owners[chosen] = os.getpid()
+        self.allocations += 1
+        return chosen.tolist()
+
+    def allocate(self, count: int, timeout: float = 0.5) -> List[int]:
+        """
+        Claim `count` slots, waiting for others to free theirs
+
+        Args:
+            count: Slots needed
+            timeout: Seconds to wait while the pool is exhausted
+
+        Raises:
+            SlabExhausted: Not enough slots freed up in time (or count > slots)
+        """
+        slots = self.try_allocate(count)
+        if slots is not None:
+            return slots
+        if count > self.slots:
+            raise SlabExhausted(f"{count} slots requested, slab has {self.slots}")
+
+        self.waits += 1
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
+            slots = self.try_allocate(count)
+            if slots is not None:
+                return slots
+        raise SlabExhausted(f"No {count} free slot(s) after {timeout:g}s ({self.slots} in pool)")
+
+    def free(self, slots: List[int]):
+        """Return slots to the pool"""
+        with self._locked():
+            self.owners[slots] = FREE
+
+    def _reclaim_dead(self) -> int:
+        """Free slots whose allocating process no longer exists (lock held)"""
+        reclaimed = 0
+        for pid in set(self.owners[self.owners != FREE].tolist()):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                dead = self.owners == pid
+                reclaimed += int(dead.sum())
+                self.owners[dead] = FREE
+            except PermissionError:
+                pass  # Alive, owned by another user
+        if reclaimed:
+            self.reclaimed += reclaimed
+            logger.warning(f"Reclaimed {reclaimed} slot(s) held by exited processes")
+        return reclaimed
+
+    def write(self, slots: List[int], pixel_values: np.ndarray):
+        """Copy (N, *slot_shape) pixels into the given slots"""
+        for slot, pixels in zip(slots, pixel_values):
+            np.copyto(self.tensors[slot], pixels, casting="same_kind")
+
+    def batch(self, slots: List[int]) -> np.ndarray:
+        """
+        (N, *slot_shape) tensor over the given slots
+
+        A view into shared memory when the slots are consecutive (no copy);
+        otherwise one gather into a reusable buffer. Valid until the next call,
+        so batches assembled from several calls must use gather() instead.
+        """
+        first = slots[0]
+        if slots == list(range(first, first + len(slots))):
+            return self.tensors[first:first + len(slots)]
+        if self._gather is None or len(self._gather) < len(slots):
+            self._gather = np.empty((len(slots), *self.slot_shape), dtype=np.float32)
+        return self.gather(slots, self._gather[:len(slots)])
+
+    def gather(self, slots: List[int], out: np.ndarray) -> np.ndarray:
+        """Copy the given slots into `out` (N, *slot_shape), e.g. rows of a larger batch"""
+        np.take(self.tensors, slots, axis=0, out=out)
+        return out
+
+    @property
+    def in_use(self) -> int:
+        return int(np.count_nonzero(self.owners != FREE))
+
+    def stats(self) -> Dict:
+        """Pool occupancy (shared) and this process's allocation counters"""
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "in_use": self.in_use,
+            "allocations": self.allocations,
+            "allocation_waits": self.waits,
+            "reclaimed": self.reclaimed
+        }
+
+    def close(self, unlink: bool = False):
+        # numpy views must go before the buffer they point into
+        self.owners = self.tensors = self._gather = None
+        os.close(self._lock_fd)
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A batch still references the mapping; it goes away with the process
+        if unlink:
+            self.shm.unlink()
+            try:
+                os.unlink(self.lock_path)
+            except FileNotFoundError:
+                pass
+
+
+__all__ = [
+    'SlabExhausted',
+    'TensorSlab',
+    'DEFAULT_SLOTS',
+    'SLOT_SHAPE'
+]
@@ -0,0 +1,243 @@
+"""
+Catalog snapshot bundles for fast node provisioning
+A single tar holding the serialized FAISS index, id map, vectors, the books
+table and a manifest with model id and checksums; loading needs no inference
+faiss is imported by export/load only, so reading a manifest stays cheap
+"""
+import hashlib
+import io
+import json
+import sqlite3
+import tarfile
+import time
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+import logging
+
+if TYPE_CHECKING:
+    import faiss
+
+from .database import DB_PATH, initialize_database
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+BOOK_COLUMNS = ['book_id', 'title', 'author', 'isbn', 'publisher', 'image_path', 'created_at', 'updated_at']
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot bundle is missing, corrupt or incompatible"""
+
+
+class CatalogSnapshot(NamedTuple):
+    """Contents of a loaded snapshot bundle"""
+    manifest: Dict
+    index: "faiss.Index"
+    embeddings: np.ndarray
+    book_ids: List[str]
+    books: List[Dict]
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_snapshot(output_path: str, model_id: str, db_path: str = DB_PATH,
+                    embeddings_path: str = "embeddings.npy",
+                    use_hnsw: bool = True) -> Dict:
+    """
+    Write a snapshot bundle from the local catalog
+
+    Args:
+        output_path: Bundle file to create (tar)
+        model_id: Embedding model the vectors were produced with
+        db_path: Source SQLite database
+        embeddings_path: Source embeddings.npy (rows in book_id creation order)
+        use_hnsw: Serialize an HNSW index (for catalogs over 100 books)
+
+    Returns:
+        The bundle manifest
+    """
+    import faiss
+    from .search import build_flat_or_hnsw, describe_index
+
+    embeddings = np.load(embeddings_path).astype("float32")
+    faiss.normalize_L2(embeddings)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY created_at, rowid")
+        books = [dict(zip(BOOK_COLUMNS, row)) for row in cursor.fetchall()]
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM catalog_changes")
+        change_seq = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    book_ids = [book['book_id'] for book in books]
+    if len(book_ids) != len(embeddings):
+        raise SnapshotError(
+            f"Mismatch: {len(book_ids)} books but {len(embeddings)} embeddings; "
+            "regenerate embeddings before exporting"
+        )
+
+    index = build_flat_or_hnsw(embeddings, use_hnsw=use_hnsw)
+
+    members = {
+        "index.faiss": faiss.serialize_index(index).tobytes(),
+        "vectors.npy": _npy_bytes(embeddings),
+        "ids.json": json.dumps(book_ids).encode("utf-8"),
+        "books.jsonl": "".join(json.dumps(book) + "\n" for book in books).encode("utf-8")
+    }
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model_id": model_id,
+        "embedding_dim": int(embeddings.shape[1]),
+        "count": len(book_ids),
+        "index": describe_index(index),
+        "change_seq": change_seq,
+        "files": {
+            name: {"sha256": _sha256(data), "size": len(data)}
+            for name, data in members.items()
+        }
+    }
+
+    output = Path(output_path)
+    tmp_path = output.with_name(output.name + ".tmp")
+    with tarfile.open(tmp_path, "w") as tar:
+        # Manifest first so inspect() only has to read the head of the file
+        _add_member(tar, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+        for name, data in members.items():
+            _add_member(tar, name, data)
+    tmp_path.replace(output)
+
+    logger.info(f"Exported snapshot of {len(book_ids)} books -> {output}")
+    return manifest
+
+
+def read_manifest(bundle_path: str) -> Dict:
+    """Read only the manifest of a bundle"""
+    with tarfile.open(bundle_path, "r") as tar:
+        member = tar.extractfile("manifest.json")
+        if member is None:
+            raise SnapshotError(f"{bundle_path} has no manifest.json")
+        return json.loads(member.read())
+
+
+def load_snapshot(bundle_path: str, expected_model_id: Optional[str] = None) -> CatalogSnapshot:
+    """
+    Load and verify a snapshot bundle
+
+    Args:
+        bundle_path: Bundle created by export_snapshot
+        expected_model_id: Refuse bundles built with a different model
+
+    Returns:
+        CatalogSnapshot with the deserialized index ready to search
+    """
+    import faiss
+
+    try:
+        with tarfile.open(bundle_path, "r") as tar:
+            files = {
+                member.name: tar.extractfile(member).read()
+                for member in tar.getmembers() if member.isfile()
+            }
+    except (OSError, tarfile.TarError) as e:
+        raise SnapshotError(f"Cannot read snapshot {bundle_path}: {e}")
+
+    if "manifest.json" not in files:
+        raise SnapshotError(f"{bundle_path} has no manifest.json")
+    manifest = json.loads(files["manifest.json"])
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(
+            f"Unsupported snapshot format {manifest.get('format_version')} "
+            f"(expected {SNAPSHOT_FORMAT_VERSION})"
+        )
+    if expected_model_id and manifest.get("model_id") != expected_model_id:
+        raise SnapshotError(
+            f"Snapshot was built with {manifest.get('model_id')}, "
+            f"but this node uses {expected_model_id}"
+        )
+
+    for name, info in manifest["files"].items():
+        if name not in files:
+            raise SnapshotError(f"Snapshot is missing {name}")
+        if _sha256(files[name]) != info["sha256"]:
+            raise SnapshotError(f"Checksum mismatch for {name}")
+
+    index = faiss.deserialize_index(np.frombuffer(files["index.faiss"], dtype=np.uint8))
+    embeddings = np.load(io.BytesIO(files["vectors.npy"]), allow_pickle=False)
+    book_ids = json.loads(files["ids.json"])
+    books = [json.loads(line) for line in files["books.jsonl"].decode("utf-8").splitlines() if line]
+
+    if not (index.ntotal == len(embeddings) == len(book_ids) == manifest["count"]):
+        raise SnapshotError("Snapshot index, vectors and id map disagree in size")
+
+    return CatalogSnapshot(manifest, index, embeddings, book_ids, books)
+
+
+def restore_books(snapshot: CatalogSnapshot, db_path: str = DB_PATH):
+    """
+    Replace the local books table with the snapshot's catalog
+
+    Rows are inserted in id-map order (matching the vectors), and the
+    snapshot's change log position is recorded so a replica resumes from it.
+    """
+    initialize_database(db_path)
+    embeddings = snapshot.embeddings
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM books")
+        placeholders = ", ".join("?" for _ in BOOK_COLUMNS)
+        for row, book in enumerate(snapshot.books):
+            cursor.execute(
+                f"INSERT INTO books ({', '.join(BOOK_COLUMNS)}, embedding_vector) VALUES ({placeholders}, ?)",
+                [book.get(column) for column in BOOK_COLUMNS] + [embeddings[row].tobytes()]
+            )
+
+        change_seq = snapshot.manifest.get("change_seq", 0)
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM catalog_changes")
+        if change_seq > cursor.fetchone()[0]:
+            cursor.execute(
+                "INSERT INTO catalog_changes (seq, op, book_id) VALUES (?, 'snapshot', '')",
+                (change_seq,)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f"Restored {len(snapshot.books)} books from snapshot into {db_path}")
+
+
+__all__ = [
+    'CatalogSnapshot',
+    'SnapshotError',
+    'export_snapshot',
+    'load_snapshot',
+    'read_manifest',
+    'restore_books'
+]
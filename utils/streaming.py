@@ -0,0 +1,116 @@
+"""
+Frame handling for live camera streams (the /ws/recognize WebSocket)
+Only the newest frame waits for recognition, older ones are dropped, and
+frames that look like the last recognized one are skipped
+"""
+import asyncio
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 16  # Side of the grayscale thumbnail frames are compared on
+
+STALE = "stale"  # Replaced by a newer frame before recognition started
+DUPLICATE = "duplicate"  # Too close to the last recognized frame
+INVALID = "invalid"  # Too large or not a decodable image
+PROCESSED = "processed"  # Recognized
+FRAME_OUTCOMES = (PROCESSED, STALE, DUPLICATE, INVALID)
+
+
+def frame_thumbnail(img: np.ndarray, size: int = THUMBNAIL_SIZE) -> np.ndarray:
+    """Small grayscale copy of a BGR frame, for near-duplicate checks"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def thumbnail_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two thumbnails, 0 (identical) to 1"""
+    return float(np.mean(np.abs(a - b))) / 255.0
+
+
+def decode_frame(data: bytes) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Decode an encoded frame and make its thumbnail
+
+    Blocking (full-resolution decode): run it in an executor.
+
+    Returns:
+        (BGR image, thumbnail), or (None, None) when the data is not an image
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None, None
+    return img, frame_thumbnail(img)
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox between a stream's reader and its recognizer
+
+    put() never waits: a frame that was not picked up yet is replaced and
+    counted as stale, so recognition always works on the newest frame and a
+    slow recognizer never builds a backlog.
+    """
+
+    def __init__(self):
+        self._frame: Optional[Tuple[int, bytes]] = None
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def put(self, seq: int, data: bytes) -> Optional[int]:
+        """Offer a frame; returns the sequence number of the frame it replaced"""
+        replaced = self._frame[0] if self._frame is not None else None
+        self._frame = (seq, data)
+        self._ready.set()
+        return replaced
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self) -> Optional[Tuple[int, bytes]]:
+        """Wait for the newest frame; None once the stream is closed"""
+        while self._frame is None and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        if self._frame is None:
+            return None
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class StreamStats:
+    """Frame counts by outcome, for one stream or summed over all of them"""
+
+    def __init__(self):
+        self.frames = {outcome: 0 for outcome in FRAME_OUTCOMES}
+        self.matches_pushed = 0
+
+    def record(self, outcome: str):
+        self.frames[outcome] += 1
+
+    def stats(self) -> Dict:
+        received = sum(self.frames.values())
+        return {
+            "frames_received": received,
+            **{f"frames_{outcome}": count for outcome, count in self.frames.items()},
+            "matches_pushed": self.matches_pushed,
+            "processed_ratio": round(self.frames[PROCESSED] / received, 4) if received else None
+        }
+
+
+__all__ = [
+    'DUPLICATE',
+    'FRAME_OUTCOMES',
+    'INVALID',
+    'LatestFrame',
+    'PROCESSED',
+    'STALE',
+    'StreamStats',
+    'decode_frame',
+    'frame_thumbnail',
+    'thumbnail_difference'
+]
@@ -0,0 +1,186 @@
+"""
+Synthetic covers and catalogs for offline benchmarks and evaluation
+Everything is generated from a seeded RNG so runs are reproducible
+"""
+import cv2
+import numpy as np
+import sqlite3
+from typing import List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+COVER_SIZE = (400, 600)  # (width, height), a typical phone crop of a cover
+EMBEDDING_DIM = 512
+
+
+def synthetic_cover(rng: np.random.Generator, size: Tuple[int, int] = COVER_SIZE) -> np.ndarray:
+    """
+    Draw a fake book cover: background, colour blocks, title and author text
+
+    Args:
+        rng: Random generator (determines the cover)
+        size: (width, height) in pixels
+
+    Returns:
+        BGR uint8 image that passes assess_image_quality
+    """
+    width, height = size
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = rng.integers(40, 220, size=3)
+
+    for _ in range(int(rng.integers(2, 6))):
+        x1, x2 = sorted(rng.integers(0, width, size=2))
+        y1, y2 = sorted(rng.integers(0, height, size=2))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), color, -1)
+
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    title = "".join(rng.choice(list(letters), size=int(rng.integers(5, 12))))
+    author = "".join(rng.choice(list(letters), size=int(rng.integers(4, 10))))
+    text_color = tuple(int(c) for c in 255 - img[height // 4, width // 2])
+    cv2.putText(img, title, (20, height // 4), cv2.FONT_HERSHEY_DUPLEX, 1.4, text_color, 3)
+    cv2.putText(img, author, (20, height - 60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, text_color, 2)
+
+    # Light sensor noise so JPEG sizes and Laplacian variance look photographic
+    noise = rng.normal(0, 6, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(img: np.ndarray, quality: int = 90) -> bytes:
+    """JPEG-encode an image the way a phone upload would arrive"""
+    ok, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+AUGMENTATIONS = ("rotate", "crop", "blur", "glare", "perspective", "dim")
+
+
+def augment_cover(img: np.ndarray, kind: str, rng: np.random.Generator) -> np.ndarray:
+    """
+    Simulate a phone photo of a catalog cover
+
+    Args:
+        img: BGR cover image
+        kind: One of AUGMENTATIONS
+        rng: Random generator (strength of the distortion)
+
+    Returns:
+        Distorted BGR image
+    """
+    h, w = img.shape[:2]
+
+    if kind == "rotate":
+        angle = float(rng.uniform(-15, 15))
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        return cv2.warpAffine(img, matrix, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+    if kind == "crop":
+        scale = float(rng.uniform(0.7, 0.9))
+        ch, cw = int(h * scale), int(w * scale)
+        y, x = int(rng.integers(0, h - ch + 1)), int(rng.integers(0, w - cw + 1))
+        return cv2.resize(img[y:y + ch, x:x + cw], (w, h))
+
+    if kind == "blur":
+        k = int(rng.choice([5, 7, 9]))
+        return cv2.GaussianBlur(img, (k, k), 0)
+
+    if kind == "glare":
+        # Bright elliptical highlight, like a lamp reflected on a glossy cover
+        cy, cx = int(rng.integers(0, h)), int(rng.integers(0, w))
+        yy, xx = np.mgrid[0:h, 0:w]
+        radius = float(rng.uniform(0.2, 0.4)) * max(h, w)
+        mask = np.exp(-(((yy - cy) ** 2 + (xx - cx) ** 2) / (2 * radius ** 2)))
+        strength = float(rng.uniform(120, 200))
+        return np.clip(img + (mask * strength)[..., None], 0, 255).astype(np.uint8)
+
+    if kind == "perspective":
+        d = 0.12
+        src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+        jitter = rng.uniform(0, d, size=(4, 2)) * np.float32([w, h])
+        dst = np.float32([
+            [jitter[0, 0], jitter[0, 1]],
+            [w - jitter[1, 0], jitter[1, 1]],
+            [w - jitter[2, 0], h - jitter[2, 1]],
+            [jitter[3, 0], h - jitter[3, 1]]
+        ])
+        matrix = cv2.getPerspectiveTransform(src, dst)
+        return cv2.warpPerspective(img, matrix, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+    if kind == "dim":
+        alpha = float(rng.uniform(0.5, 0.75))
+        return cv2.convertScaleAbs(img, alpha=alpha, beta=0)
+
+    raise ValueError(f"Unknown augmentation '{kind}' (choose from {', '.join(AUGMENTATIONS)})")
+
+
+def synthetic_catalog(n: int, rng: np.random.Generator, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Random L2-normalized catalog embeddings
+
+    Returns:
+        (n, dim) float32 array
+    """
+    vectors = rng.standard_normal((n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def noisy_queries(catalog: np.ndarray, n: int, rng: np.random.Generator,
+                  noise: float = 0.03) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Queries that are perturbed copies of catalog rows (like re-photographed covers)
+
+    Args:
+        catalog: (N, d) normalized embeddings
+        n: Number of queries
+        noise: Per-dimension Gaussian noise added before re-normalizing
+
+    Returns:
+        Tuple of ((n, d) float32 queries, (n,) source row of each query)
+    """
+    rows = rng.integers(0, len(catalog), size=n)
+    queries = catalog[rows] + rng.normal(0, noise, (n, catalog.shape[1])).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries.astype("float32"), rows
+
+
+def synthetic_books_db(db_path: str, n: int, book_ids: Optional[List[str]] = None) -> List[str]:
+    """
+    Create a books database with n placeholder books
+
+    Args:
+        db_path: SQLite file to create (schema from initialize_database)
+        n: Number of books
+        book_ids: Ids to use (default SYN000000, SYN000001, ...)
+
+    Returns:
+        The book ids, in insertion order
+    """
+    from .database import initialize_database
+
+    book_ids = book_ids or [f"SYN{i:06d}" for i in range(n)]
+    initialize_database(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO books (book_id, title, author, image_path) VALUES (?, ?, ?, ?)",
+            ((book_id, f"Title {book_id}", f"Author {book_id}", f"covers/{book_id}.jpg") for book_id in book_ids)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return book_ids
+
+
+__all__ = [
+    'AUGMENTATIONS',
+    'augment_cover',
+    'encode_jpeg',
+    'noisy_queries',
+    'synthetic_books_db',
+    'synthetic_catalog',
+    'synthetic_cover'
+]
@@ -0,0 +1,175 @@
+"""
+Per-request stage timing emitted as a Server-Timing header
+Spans are recorded into a timer carried in a context variable, so stages deep
+in the call stack (and in executor threads) need no extra arguments
+"""
+import contextvars
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar("request_timer", default=None)
+_NO_SPAN = nullcontext()
+
+
+class RequestTimer:
+    """Accumulated duration per stage name for one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.total: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        # Repeated stages (e.g. one decode per file in a batch) are summed
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self) -> float:
+        if self.total is None:
+            self.total = time.perf_counter() - self.start
+        return self.total
+
+    def header_value(self) -> str:
+        """Server-Timing header, e.g. `decode;dur=3.1, forward;dur=41.0, total;dur=52.7`"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.finish() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items())
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return _current_timer.get()
+
+
+@contextmanager
+def _timed(timer: RequestTimer, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def span(name: str):
+    """
+    Time a stage of the current request
+
+    Usage:
+        with span("decode"):
+            img = cv2.imdecode(...)
+
+    Outside a timed request this returns a shared no-op context manager, so
+    the cost when timing is disabled is one context variable lookup.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return _NO_SPAN
+    return _timed(timer, name)
+
+
+@contextmanager
+def collect_spans():
+    """
+    Record spans outside an HTTP request (benchmarks, scripts)
+
+    Usage:
+        with collect_spans() as timer:
+            get_clip_embedding(img)
+        timer.stages["forward"]
+    """
+    timer = RequestTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+        timer.finish()
+
+
+def record(name: str, seconds: float):
+    """Add a duration measured by the caller to the current request's timer"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+def bind_context(fn: Callable, *args):
+    """
+    Wrap fn(*args) to run in the caller's context (for run_in_executor)
+
+    Executor threads do not inherit context variables, so without this spans
+    recorded in model code would be lost.
+    """
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that times each HTTP request and adds a Server-Timing header
+
+    Requests slower than `slow_request_ms` are logged with their stage
+    breakdown, and `on_finish(scope, status, timer)` is called for every
+    request (metrics). Plain ASGI (not BaseHTTPMiddleware) so the endpoint
+    keeps seeing client disconnects.
+    """
+
+    def __init__(self, app, slow_request_ms: Optional[float] = None,
+                 paths: Optional[List[str]] = None, emit_header: bool = True,
+                 on_finish: Optional[Callable] = None):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+        self.paths = tuple(paths) if paths else None
+        self.emit_header = emit_header
+        self.on_finish = on_finish
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (self.paths and not scope["path"].startswith(self.paths)):
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.emit_header:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timer.header_value().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timer.reset(token)
+            total_ms = timer.finish() * 1000
+            if self.slow_request_ms is not None and total_ms > self.slow_request_ms:
+                logger.warning(
+                    f"Slow request {scope['method']} {scope['path']}: "
+                    f"{total_ms:.1f}ms ({timer.summary()})"
+                )
+            if self.on_finish is not None:
+                try:
+                    self.on_finish(scope, status, timer)
+                except Exception as e:
+                    logger.warning(f"Request observer failed: {e}")
+
+
+__all__ = [
+    'RequestTimer',
+    'ServerTimingMiddleware',
+    'bind_context',
+    'collect_spans',
+    'current_timer',
+    'record',
+    'span'
+]
@@ -15,6 +15,8 @@ from datetime import datetime
 
 
 API_URL = "http://localhost:8000/recognize"
+# Bulk lane: interactive users are served first, folder jobs get a guaranteed share
+HEADERS = {"X-Priority": "bulk"}
 
 
 class ImageHandler(FileSystemEventHandler):
@@ -56,7 +58,7 @@ class ImageHandler(FileSystemEventHandler):
         """Process a single image"""
         try:
             with open(image_path, 'rb') as f:
-                response = requests.post(API_URL, files={"file": f}, timeout=30)
+                response = requests.post(API_URL, files={"file": f}, headers=HEADERS, timeout=90)
             
             if response.status_code == 200:
                 result = response.json()